@@ -1,6 +1,12 @@
 from flask import Flask, g
 from importlib import import_module
+from .utils.compound_cache import CompoundCache
 from .utils.graphdb_handler import GraphdbHandler
+from .utils.http_client import HttpClient
+from .utils.mml_expression import MMLExpression
+from .utils.property_cache import PropertyCache
+from .utils.property_database import PropertyDatabase
+from .utils.solubility_surrogate import SolubilitySurrogate
 
 
 def register_extension(app):
@@ -25,6 +31,27 @@ def create_app(config):
     # Configure database
     graphdb_handler = GraphdbHandler(config)
 
+    # Seed numpy translations precompiled from the ontology
+    MMLExpression.load_precompiled(config.PRECOMPILED_NUMPY)
+
+    # Configure the HTTP client shared by the agents querying external services
+    HttpClient.configure(config.HTTP_TIMEOUT, config.HTTP_RETRIES)
+
+    # Open the compound cache shared by physical property and solubility agents
+    CompoundCache.open(config.COMPOUND_CACHE, config.COMPOUND_CACHE_TTL)
+    if config.COMPOUND_CACHE_PRELOAD:
+        CompoundCache.preload(config.COMPOUND_CACHE_PRELOAD)
+
+    # Open the physical property cache, stale results are served while revalidated in background
+    PropertyCache.open(config.PROPERTY_CACHE, config.PROPERTY_CACHE_TTL, config.PROPERTY_CACHE_STALE_TTL)
+
+    # Open the local property database, consulted before the public databases
+    PropertyDatabase.open(config.PROPERTY_DATABASE)
+
+    # Load the local solubility surrogate, RMG is only queried for pairs predicted without confidence
+    if config.SOLUBILITY_SURROGATE:
+        SolubilitySurrogate.load(config.SOLUBILITY_SURROGATE, config.SOLUBILITY_SURROGATE_MAX_STD)
+
     @app.before_request
     def before_request():
         g.graphdb_handler = graphdb_handler
@@ -9,6 +9,18 @@ class Config:
     GRAPHDB_PASSWORD =  os.getenv("GRAPHDB_PASSWORD", "root")
     GRAPHDB_DB =        os.getenv("GRAPHDB_DB", "ontomo")
     ASSETS_ROOT =       os.getenv('ASSETS_ROOT', '/static/assets')
+    PRECOMPILED_NUMPY = os.getenv("PRECOMPILED_NUMPY", os.path.join(basedir, "precompiled_numpy.json"))
+    COMPOUND_CACHE =    os.getenv("COMPOUND_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "kg4dt", "compound_cache.sqlite"))
+    COMPOUND_CACHE_TTL = float(os.getenv("COMPOUND_CACHE_TTL", 30 * 24 * 3600))
+    COMPOUND_CACHE_PRELOAD = os.getenv("COMPOUND_CACHE_PRELOAD", "")
+    PROPERTY_CACHE =    os.getenv("PROPERTY_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "kg4dt", "property_cache.sqlite"))
+    PROPERTY_CACHE_TTL = float(os.getenv("PROPERTY_CACHE_TTL", 30 * 24 * 3600))
+    PROPERTY_CACHE_STALE_TTL = float(os.getenv("PROPERTY_CACHE_STALE_TTL", 365 * 24 * 3600))
+    PROPERTY_DATABASE = os.getenv("PROPERTY_DATABASE", os.path.join(basedir, "data", "property_database.sqlite"))
+    SOLUBILITY_SURROGATE = os.getenv("SOLUBILITY_SURROGATE", "")
+    SOLUBILITY_SURROGATE_MAX_STD = float(os.getenv("SOLUBILITY_SURROGATE_MAX_STD", 0.5))
+    HTTP_TIMEOUT =      float(os.getenv("HTTP_TIMEOUT", 120))
+    HTTP_RETRIES =      int(os.getenv("HTTP_RETRIES", 3))
 
     PREFIX_RDF =                "PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>"
     PREFIX_ONTOMO =             "PREFIX ontomo: <https://raw.githubusercontent.com/sustainable-processes/KG4DT/refs/heads/main/ontology/OntoMo.owl#>"
@@ -220,7 +220,10 @@ def model_simulation():
     entity = g.graphdb_handler.query()
     model_simulation_request = request.get_json()
     model_simulation_agent = ModelSimulationAgent(entity, model_simulation_request)
-    results = model_simulation_agent.simulate_scipy()
+    try:
+        results = model_simulation_agent.simulate_scipy()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     return results
 
 
@@ -229,7 +232,10 @@ def model_calibration():
     entity = g.graphdb_handler.query()
     model_calibration_request = request.get_json()
     model_calibration_agent = ModelCalibrationAgent(entity, model_calibration_request)
-    result = model_calibration_agent.calibration_scipy()
+    try:
+        result = model_calibration_agent.calibration_scipy()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     return result
 
 
@@ -238,7 +244,10 @@ def model_exploration():
     entity = g.graphdb_handler.query()
     model_exploration_request = request.get_json()
     model_exploration_agent = ModelExplorationAgent(entity, model_exploration_request)
-    result = model_exploration_agent.exploration_scipy()
+    try:
+        result = model_exploration_agent.exploration_scipy()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     return result
 
 
@@ -283,6 +292,18 @@ def solvent_miscibility():
     return solvent_miscibility_agent.query_sigmaaldrich(solvents)
 
 
+@blueprint.route("/solvent_miscibility_batch", methods=["POST"])
+def solvent_miscibility_batch():
+    entity = g.graphdb_handler.query()
+    solvent_miscibility_agent = SolventMiscibilityAgent(entity, "app/data/solvent_miscibility_table.csv")
+    solvent_sets = request.get_json(silent=True)
+    try:
+        solvent_miscibility_agent.validate_solvent_sets(solvent_sets)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return solvent_miscibility_agent.query_many(solvent_sets)
+
+
 @blueprint.route("/solute_solubility", methods=["POST"])
 def solute_solubility():
     entity = g.graphdb_handler.query()
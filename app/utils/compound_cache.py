@@ -0,0 +1,233 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+import urllib.error
+
+import pubchempy as pcp
+
+from .http_client import HttpClient
+
+
+# host of the PubChem REST API requested by `pcp.get_compounds`
+PUBCHEM_HOST = "pubchem.ncbi.nlm.nih.gov"
+# default path of the compound cache, outside of the read-only app directory of the container
+COMPOUND_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "kg4dt", "compound_cache.sqlite")
+# seconds before resolved compounds and unresolvable queries are looked up again
+COMPOUND_CACHE_TTL = 30 * 24 * 3600
+COMPOUND_CACHE_NEGATIVE_TTL = 24 * 3600
+
+
+class CompoundCache:
+    """
+    Persistent cache of PubChem compound resolutions, shared by all agents.
+
+    A query (name or formula) is resolved by `pcp.get_compounds` once, within the PubChem limits of `HttpClient`, and its first compound is kept in SQLite as
+    `{"cid", "canonical_smiles", "connectivity_smiles"}` for `ttl` seconds. Queries without compound, and queries
+    rejected by PubChem (e.g. names searched as formula), are kept for `negative_ttl` seconds; rejected ones raise
+    `ValueError` again on every hit, so that callers falling back to another namespace behave as without cache.
+
+    The cache is opened by `open`, lazily at `COMPOUND_CACHE_PATH` if not configured. Resolutions can be exported by
+    `export` and preloaded offline by `preload`, e.g. on a machine without access to PubChem, see `cache_info` for
+    hit and miss counters.
+
+    Usage:
+        python -m app.utils.compound_cache --resolve water toluene --export compounds.json
+        python -m app.utils.compound_cache --preload compounds.json
+    """
+    connection = None
+    ttl = COMPOUND_CACHE_TTL
+    negative_ttl = COMPOUND_CACHE_NEGATIVE_TTL
+    lock = threading.RLock()
+    counters = {"hits": 0, "negative_hits": 0, "misses": 0}
+
+
+    @staticmethod
+    def open(path=COMPOUND_CACHE_PATH, ttl=COMPOUND_CACHE_TTL, negative_ttl=COMPOUND_CACHE_NEGATIVE_TTL):
+        """Open (or create) the SQLite cache, shared by all threads of the process.
+
+        Args:
+            path (str): path of the SQLite database, or `:memory:`
+            ttl (float): seconds before resolved compounds are looked up again
+            negative_ttl (float): seconds before queries without compound are looked up again
+        """
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with CompoundCache.lock:
+            if CompoundCache.connection is not None:
+                CompoundCache.connection.close()
+            CompoundCache.connection = sqlite3.connect(path, check_same_thread=False)
+            CompoundCache.connection.execute(
+                "CREATE TABLE IF NOT EXISTS compound ("
+                "namespace TEXT, query TEXT, cid INTEGER, canonical_smiles TEXT, connectivity_smiles TEXT, "
+                "error TEXT, updated REAL, PRIMARY KEY (namespace, query))"
+            )
+            CompoundCache.connection.commit()
+            CompoundCache.ttl = ttl
+            CompoundCache.negative_ttl = negative_ttl
+
+
+    @staticmethod
+    def cursor():
+        if CompoundCache.connection is None:
+            CompoundCache.open()
+        return CompoundCache.connection
+
+
+    @staticmethod
+    def lookup(query, namespace="name"):
+        """Cached resolution of a query, without resolving it on PubChem.
+
+        Args:
+            query (str): name or formula of the compound
+            namespace (str): PubChem namespace of the query, e.g. `name` or `formula`
+
+        Returns:
+            tuple: whether the query is cached, and its compound (None without compound)
+        """
+        with CompoundCache.lock:
+            row = CompoundCache.cursor().execute(
+                "SELECT cid, canonical_smiles, connectivity_smiles, error, updated FROM compound WHERE namespace = ? AND query = ?",
+                (namespace, query),
+            ).fetchone()
+            if row:
+                cid, canonical_smiles, connectivity_smiles, error, updated = row
+                if time.time() - updated < (CompoundCache.ttl if cid is not None else CompoundCache.negative_ttl):
+                    if cid is None:
+                        CompoundCache.counters["negative_hits"] += 1
+                        if error:
+                            raise ValueError(f"Unresolvable {namespace} on PubChem: {query} ({error})")
+                        return True, None
+                    CompoundCache.counters["hits"] += 1
+                    return True, {"cid": cid, "canonical_smiles": canonical_smiles, "connectivity_smiles": connectivity_smiles}
+        return False, None
+
+
+    @staticmethod
+    def get_compound(query, namespace="name"):
+        """First PubChem compound of a query, from the cache or resolved and cached.
+
+        Args:
+            query (str): name or formula of the compound
+            namespace (str): PubChem namespace of the query, e.g. `name` or `formula`
+
+        Returns:
+            dict: `cid`, `canonical_smiles` and `connectivity_smiles`, or None without compound
+        """
+        cached, compound = CompoundCache.lookup(query, namespace)
+        if cached:
+            return compound
+        with CompoundCache.lock:
+            CompoundCache.counters["misses"] += 1
+
+        # resolve outside of the lock, so that threads of an agent query PubChem concurrently
+        try:
+            compounds = HttpClient.call(
+                PUBCHEM_HOST,
+                lambda: pcp.get_compounds(query, namespace=namespace),
+                (pcp.ServerBusyError, pcp.ServerError, pcp.TimeoutError, urllib.error.URLError),
+            )
+        except pcp.BadRequestError as e:
+            CompoundCache.store(namespace, query, None, error=str(e))
+            raise ValueError(f"Unresolvable {namespace} on PubChem: {query} ({e})")
+        compound = None
+        if compounds:
+            compound = {
+                "cid": compounds[0].cid,
+                "canonical_smiles": compounds[0].canonical_smiles,
+                "connectivity_smiles": compounds[0].connectivity_smiles,
+            }
+        CompoundCache.store(namespace, query, compound)
+        return compound
+
+
+    @staticmethod
+    def store(namespace, query, compound, error=None, updated=None):
+        compound = compound or {}
+        with CompoundCache.lock:
+            CompoundCache.cursor().execute(
+                "INSERT OR REPLACE INTO compound VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (namespace, query, compound.get("cid"), compound.get("canonical_smiles"), compound.get("connectivity_smiles"),
+                 error, time.time() if updated is None else updated),
+            )
+            CompoundCache.connection.commit()
+
+
+    @staticmethod
+    def preload(path):
+        """Preload resolutions exported by `export`, without querying PubChem.
+
+        Args:
+            path (str): path of the JSON file `{namespace: {query: compound or null}}`
+
+        Returns:
+            int: number of preloaded queries
+        """
+        with open(path, "r") as f:
+            resolutions = json.load(f)
+        count = 0
+        for namespace, compounds in resolutions.items():
+            for query, compound in compounds.items():
+                CompoundCache.store(namespace, query, compound)
+                count += 1
+        return count
+
+
+    @staticmethod
+    def export(path):
+        """Export the cached resolutions (except rejected queries) for `preload`.
+
+        Args:
+            path (str): path of the JSON file `{namespace: {query: compound or null}}`
+        """
+        resolutions = {}
+        with CompoundCache.lock:
+            rows = CompoundCache.cursor().execute(
+                "SELECT namespace, query, cid, canonical_smiles, connectivity_smiles FROM compound WHERE error IS NULL"
+            ).fetchall()
+        for namespace, query, cid, canonical_smiles, connectivity_smiles in rows:
+            compound = {"cid": cid, "canonical_smiles": canonical_smiles, "connectivity_smiles": connectivity_smiles}
+            resolutions.setdefault(namespace, {})[query] = compound if cid is not None else None
+        with open(path, "w") as f:
+            json.dump(resolutions, f, indent=2, ensure_ascii=False)
+
+
+    @staticmethod
+    def cache_info():
+        """Hit and miss counters of the process and number of cached queries.
+
+        Returns:
+            dict: `hits`, `negative_hits`, `misses` and `size`
+        """
+        with CompoundCache.lock:
+            size = CompoundCache.cursor().execute("SELECT COUNT(*) FROM compound").fetchone()[0]
+            return {**CompoundCache.counters, "size": size}
+
+
+    @staticmethod
+    def cache_clear():
+        """Remove all cached queries and reset the counters."""
+        with CompoundCache.lock:
+            CompoundCache.cursor().execute("DELETE FROM compound")
+            CompoundCache.connection.commit()
+            CompoundCache.counters.update({"hits": 0, "negative_hits": 0, "misses": 0})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--path", default=os.getenv("COMPOUND_CACHE", COMPOUND_CACHE_PATH), help="Path of the SQLite compound cache")
+    parser.add_argument("--resolve", nargs="*", default=[], help="Names to resolve on PubChem into the cache")
+    parser.add_argument("--preload", help="Path of a JSON file of resolutions to preload")
+    parser.add_argument("--export", help="Path of the JSON file to export resolutions to")
+    args = parser.parse_args()
+
+    CompoundCache.open(args.path)
+    if args.preload:
+        print(f"Preloaded {CompoundCache.preload(args.preload)} queries")
+    for name in args.resolve:
+        print(name, CompoundCache.get_compound(name, "name"))
+    if args.export:
+        CompoundCache.export(args.export)
+    print(CompoundCache.cache_info())
@@ -1,8 +1,74 @@
 import re
+import sys
 import pygraphdb
 from .mml_expression import MMLExpression
 
 
+class LazyFormulaRecord(dict):
+    """
+    Law or definition record of the entity, whose MathML `formula` is rendered for display in `mode` on first access.
+
+    Requests which never read the formula, e.g. code generation from a `mainpage` entity, skip the display rendering.
+    Reading the record through `[]`, `get`, `items`, `values`, `keys` or iteration renders it, and so do
+    `json.dumps`, templates, `dict(record)`, `{**record}` and `copy`, which returns a rendered `LazyFormulaRecord`.
+    Other C-level reads of the underlying dict, e.g. `==` or `PyDict_GetItem` in extensions, see the formula unrendered.
+    """
+
+    def __init__(self, record, mode):
+        super().__init__(record)
+        self.mode = mode
+        self.rendered = False
+
+    def render(self):
+        if self.rendered:
+            return
+        self.rendered = True
+        formula = super().get("formula")
+        if formula is None:
+            return
+        if self.mode == "sidebar":
+            super().__setitem__("formula", MMLExpression(formula).to_sidebar_mml())
+        if self.mode == "mainpage":
+            super().__setitem__("formula", MMLExpression(formula).to_mainpage_mml())
+
+    def __getitem__(self, key):
+        if key == "formula":
+            self.render()
+        return super().__getitem__(key)
+
+    def __setitem__(self, key, value):
+        if key == "formula":
+            self.rendered = True
+        super().__setitem__(key, value)
+
+    def get(self, key, default=None):
+        if key == "formula":
+            self.render()
+        return super().get(key, default)
+
+    def items(self):
+        self.render()
+        return super().items()
+
+    def values(self):
+        self.render()
+        return super().values()
+
+    def keys(self):
+        self.render()
+        return super().keys()
+
+    def __iter__(self):
+        self.render()
+        return super().__iter__()
+
+    def copy(self):
+        self.render()
+        record = LazyFormulaRecord(super().items(), self.mode)
+        record.rendered = True
+        return record
+
+
 class GraphdbHandler:
     """
     Class to handle connection with graphdb for querying and convert ontologies to dict.
@@ -36,7 +102,7 @@ class GraphdbHandler:
         data_source = self.query_data_source()
         context_descriptor = self.query_context_descriptor()
         rule = self.query_rule()
-        return {
+        return self.intern_names({
             "phenomenon": phenomenon,
             "model_dimension": model_dimension,
             "model_variable": model_variable,
@@ -46,7 +112,29 @@ class GraphdbHandler:
             "data_source": data_source,
             "context_descriptor": context_descriptor,
             "rule": rule,
-        }
+        })
+
+
+    @staticmethod
+    def intern_names(entity):
+        """Intern the names and IRIs of the entity in place, MathML fields are kept as they are.
+
+        Names repeated across records (namespaces, classes, referenced laws and variables) then share one string,
+        which shrinks the entity in memory and in pickles, e.g. of calibration workers.
+        """
+        for section in entity:
+            records = {}
+            for name, record in entity[section].items():
+                for key, value in dict.items(record):
+                    if key in ["formula", "formula_integrated_with_accumulation", "symbol"]:
+                        continue
+                    if isinstance(value, str):
+                        dict.__setitem__(record, key, sys.intern(value))
+                    if isinstance(value, list):
+                        dict.__setitem__(record, key, [sys.intern(v) if isinstance(v, str) else v for v in value])
+                records[sys.intern(name)] = record
+            entity[section] = records
+        return entity
 
 
     def query_phenomenon(self):
@@ -144,10 +232,6 @@ class GraphdbHandler:
             definition = definition.split("#")[-1]
             formula = re.sub(r'("*)"', r'\1', formula)
             formula = re.sub(r' xmlns=".*"', "", formula)
-            if mode == "sidebar":
-                formula = MMLExpression(formula).to_sidebar_mml()
-            if mode == "mainpage":
-                formula = MMLExpression(formula).to_mainpage_mml()
             definitions[definition]["formula"] = formula
             model_variable = model_variable.split("#")[-1]
             if model_variable not in definitions[definition]["model_variables"]:
@@ -156,6 +240,8 @@ class GraphdbHandler:
         definitions = dict(sorted(definitions.items(), key=lambda x: x[0]))
         for definition in definitions:
             definitions[definition]["model_variables"] = sorted(definitions[definition]["model_variables"])
+            if mode in ["sidebar", "mainpage"]:
+                definitions[definition] = LazyFormulaRecord(definitions[definition], mode)
         return definitions
         
 
@@ -215,10 +301,6 @@ class GraphdbHandler:
             formula = re.sub(r' xmlns=".*"', "", formula)
             formula_integrated_with_accumulation = re.sub(r'("*)"', r'\1', formula_integrated_with_accumulation)
             formula_integrated_with_accumulation = re.sub(r' xmlns=".*"', "", formula_integrated_with_accumulation)
-            if mode == "sidebar":
-                formula = MMLExpression(formula).to_sidebar_mml()
-            if mode == "mainpage":
-                formula = MMLExpression(formula).to_mainpage_mml()
             laws[law]["formula"] = formula
             laws[law]["phenomenon"] = phenomenon
             if model_variable != "" and model_variable not in laws[law]["model_variables"]:
@@ -242,6 +324,8 @@ class GraphdbHandler:
         for law in laws:
             laws[law]["model_variables"] = sorted(laws[law]["model_variables"])
             laws[law]["optional_model_variables"] = sorted(laws[law]["optional_model_variables"])
+            if mode in ["sidebar", "mainpage"]:
+                laws[law] = LazyFormulaRecord(laws[law], mode)
         return laws
     
 
@@ -0,0 +1,276 @@
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# maximum number of concurrent requests of one `get_many` call, and to a host not in `HTTP_HOST_CONCURRENCY`
+HTTP_WORKERS = 8
+# minimum seconds between two requests to a host, e.g. PubChem allows at most 5 requests per second
+HTTP_HOST_INTERVALS = {"pubchem.ncbi.nlm.nih.gov": 0.2}
+# maximum number of concurrent requests to a host, so that bursts of many users do not get them throttled
+HTTP_HOST_CONCURRENCY = {"pubchem.ncbi.nlm.nih.gov": 4, "api.openai.com": 4}
+# seconds before a request without response is given up
+HTTP_TIMEOUT = 120
+# retries of a request failing with a connection error, a timeout or a status of `HTTP_RETRY_STATUSES`
+HTTP_RETRIES = 3
+# seconds before the first retry, doubled for each next retry unless the response has a `Retry-After` header
+HTTP_BACKOFF = 0.5
+# statuses of busy or failing servers, worth retrying
+HTTP_RETRY_STATUSES = [429, 500, 502, 503, 504]
+
+
+class FakeSession:
+    """
+    Local fake of `requests.Session` for tests, answering GET requests with a handler instead of the network.
+
+    Usage:
+        previous = HttpClient.set_session(FakeSession(lambda url, headers: (200, '{"Records": []}')))
+        ...
+        HttpClient.set_session(previous)
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def get(self, url, headers=None, timeout=None):
+        with self.lock:
+            self.requests.append(url)
+        status_code, text = self.handler(url, headers)
+        response = requests.Response()
+        response.status_code = status_code
+        response.url = url
+        response.encoding = "utf-8"
+        response._content = text.encode("utf-8")
+        return response
+
+
+class HttpClient:
+    """
+    HTTP client shared by the agents querying external services (PubChem, ChemSpider, Wikipedia, RMG and OpenAI).
+
+    All requests go through one `requests.Session`, so that connections to a host are kept alive and reused,
+    and `get_many` fetches a list of URLs concurrently on a pool of `HTTP_WORKERS` threads shared by all requests,
+    each unique URL once. Calls to a host, including calls of client libraries wrapped by `call`, are:
+        - spaced by its interval in `host_intervals`, and at most `host_concurrency` at a time,
+        - retried `retries` times with exponential backoff on connection errors, timeouts and busy servers,
+        - counted with their latency in `metrics_info`.
+
+    The session is replaced by `set_session`, e.g. by a `FakeSession` in tests, and the timeout and retries are
+    configured by `configure`.
+    """
+    session = None
+    pool = None
+    timeout = HTTP_TIMEOUT
+    retries = HTTP_RETRIES
+    lock = threading.Lock()
+    host_intervals = dict(HTTP_HOST_INTERVALS)
+    host_concurrency = dict(HTTP_HOST_CONCURRENCY)
+    host_slots = {}
+    host_semaphores = {}
+    metrics = {}
+
+
+    @staticmethod
+    def configure(timeout=HTTP_TIMEOUT, retries=HTTP_RETRIES):
+        """Configure the requests of the process.
+
+        Args:
+            timeout (float): seconds before a request without response is given up
+            retries (int): retries of a failing request
+        """
+        with HttpClient.lock:
+            HttpClient.timeout = timeout
+            HttpClient.retries = retries
+
+
+    @staticmethod
+    def get_session():
+        with HttpClient.lock:
+            if HttpClient.session is None:
+                HttpClient.session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=HTTP_WORKERS, pool_maxsize=HTTP_WORKERS)
+                HttpClient.session.mount("http://", adapter)
+                HttpClient.session.mount("https://", adapter)
+            return HttpClient.session
+
+
+    @staticmethod
+    def set_session(session):
+        """Replace the shared session, e.g. by a `FakeSession`.
+
+        Args:
+            session (requests.Session): session with a `get(url, headers=None, timeout=None)` method, or None for a new one
+
+        Returns:
+            requests.Session: previous session, or None
+        """
+        with HttpClient.lock:
+            previous, HttpClient.session = HttpClient.session, session
+            return previous
+
+
+    @staticmethod
+    def map(func, items):
+        """Apply a blocking function to items on the shared pool, e.g. to resolve compounds concurrently.
+
+        The function must not call `map` or `get_many` itself, its threads would wait for threads of the same pool.
+
+        Args:
+            func (callable): function of an item
+            items (list): items
+
+        Returns:
+            list: results of the items
+        """
+        if not items:
+            return []
+        with HttpClient.lock:
+            if HttpClient.pool is None:
+                HttpClient.pool = ThreadPool(HTTP_WORKERS)
+        return HttpClient.pool.map(func, items)
+
+
+    @staticmethod
+    def wait(host):
+        """Wait for the next free slot of the host, slots are reserved in order of calls."""
+        interval = HttpClient.host_intervals.get(host, 0)
+        if not interval:
+            return
+        with HttpClient.lock:
+            now = time.monotonic()
+            slot = max(now, HttpClient.host_slots.get(host, 0))
+            HttpClient.host_slots[host] = slot + interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+    @staticmethod
+    def semaphore(host):
+        with HttpClient.lock:
+            if host not in HttpClient.host_semaphores:
+                HttpClient.host_semaphores[host] = threading.BoundedSemaphore(HttpClient.host_concurrency.get(host, HTTP_WORKERS))
+            return HttpClient.host_semaphores[host]
+
+
+    @staticmethod
+    def record(host, latency, failed, retried):
+        with HttpClient.lock:
+            metrics = HttpClient.metrics.setdefault(host, {"requests": 0, "failures": 0, "retries": 0, "latency": 0.0, "max_latency": 0.0})
+            metrics["requests"] += 1
+            metrics["failures"] += failed
+            metrics["retries"] += retried
+            metrics["latency"] += latency
+            metrics["max_latency"] = max(metrics["max_latency"], latency)
+
+
+    @staticmethod
+    def call(host, func, retry_errors=(), retry_result=None, retries=None):
+        """Call a function requesting a host, within the limits of the host, with retries and metrics.
+
+        Args:
+            host (str): host requested by the function, e.g. `pubchem.ncbi.nlm.nih.gov`
+            func (callable): function without arguments sending one request
+            retry_errors (tuple of type): exceptions of the function worth retrying
+            retry_result (callable): function of a result whether worth retrying, e.g. of a busy server
+            retries (int): retries of a failing call, `HttpClient.retries` if None
+
+        Returns:
+            object: result of the function, the last one if all attempts are worth retrying
+
+        Raises:
+            Exception: exception of the last attempt, if all attempts raised an exception worth retrying
+        """
+        retries = HttpClient.retries if retries is None else retries
+        for attempt in range(retries + 1):
+            HttpClient.wait(host)
+            result, error = None, None
+            with HttpClient.semaphore(host):
+                start = time.perf_counter()
+                try:
+                    result = func()
+                except retry_errors as e:
+                    error = e
+                except Exception:
+                    HttpClient.record(host, time.perf_counter() - start, True, attempt > 0)
+                    raise
+                latency = time.perf_counter() - start
+            failed = error is not None or (retry_result is not None and retry_result(result))
+            HttpClient.record(host, latency, failed, attempt > 0)
+            if not failed or attempt == retries:
+                break
+            backoff = HTTP_BACKOFF * 2 ** attempt
+            retry_after = getattr(result, "headers", {}).get("Retry-After", "")
+            if retry_after.isdigit():
+                backoff = max(backoff, float(retry_after))
+            time.sleep(backoff)
+        if error is not None:
+            raise error
+        return result
+
+
+    @staticmethod
+    def get(url, headers=None, retries=None):
+        """GET a URL through the shared session, see `call`.
+
+        Args:
+            url (str): URL to fetch
+            headers (dict): request headers
+            retries (int): retries of a failing request, `HttpClient.retries` if None
+
+        Returns:
+            requests.Response: response of the URL
+        """
+        session = HttpClient.get_session()
+        return HttpClient.call(
+            urlparse(url).netloc,
+            lambda: session.get(url, headers=headers, timeout=HttpClient.timeout),
+            (requests.ConnectionError, requests.Timeout),
+            lambda response: response.status_code in HTTP_RETRY_STATUSES,
+            retries,
+        )
+
+
+    @staticmethod
+    def get_many(urls, headers=None, retries=None):
+        """GET URLs concurrently through the shared session, each unique URL once.
+
+        Args:
+            urls (list of str): URLs to fetch, possibly repeated
+            headers (dict): request headers of all URLs
+            retries (int): retries of a failing request, `HttpClient.retries` if None
+
+        Returns:
+            dict: responses keyed by URL
+        """
+        urls = list(dict.fromkeys(urls))
+        return dict(zip(urls, HttpClient.map(lambda url: HttpClient.get(url, headers, retries), urls)))
+
+
+    @staticmethod
+    def metrics_info():
+        """Requests of the process per host, with failures (including retried ones), retries and latency in seconds.
+
+        Returns:
+            dict: `requests`, `failures`, `retries`, `mean_latency` and `max_latency` of each host
+        """
+        with HttpClient.lock:
+            return {
+                host: {
+                    "requests": metrics["requests"], "failures": metrics["failures"], "retries": metrics["retries"],
+                    "mean_latency": metrics["latency"] / metrics["requests"], "max_latency": metrics["max_latency"],
+                }
+                for host, metrics in HttpClient.metrics.items()
+            }
+
+
+    @staticmethod
+    def metrics_clear():
+        """Reset the metrics of all hosts."""
+        with HttpClient.lock:
+            HttpClient.metrics = {}
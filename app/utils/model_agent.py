@@ -1,8 +1,27 @@
 import re
+import ast
 import json
 from .mml_expression import MMLExpression
 
 
+# default solver settings of generated scipy models, overridable per request, see `ModelAgent.solver_options`;
+# dispersion models solved by solve_bvp only use `rtol` (as its `tol`), `n_eval` and `decimals`
+SCIPY_SOLVER_OPTIONS = {
+    "method": "LSODA",      # solve_ivp method: LSODA, BDF, Radau, RK45, RK23 or DOP853 (ignored by solve_bvp)
+    "rtol": 1e-3,           # relative tolerance (`tol` of solve_bvp)
+    "atol": 1e-12,          # absolute tolerance (ignored by solve_bvp)
+    "n_eval": 201,          # number of output points (initial mesh nodes of solve_bvp)
+    "adaptive": False,      # place output points by solution curvature instead of a uniform grid (ignored by solve_bvp)
+    "decimals": 6,          # rounding of returned profiles, None to keep full precision
+}
+SCIPY_IVP_METHODS = ["LSODA", "BDF", "Radau", "RK45", "RK23", "DOP853"]
+# functions of node-vectorized right-hand sides: elementwise, reductions rewritten by `ScipyModelCode.reduce_last_axis`,
+# and `np.matmul`, whose first operand (the rates of the laws) carries the node axes as leading batch dimensions
+SCIPY_VECTORIZED_FUNCTIONS = ["np.sum", "np.prod", "np.shape", "np.matmul", "np.exp", "np.log", "np.log10", "np.sqrt", "np.abs", "np.maximum", "np.minimum", "np.power"]
+# numpy functions without side effects or aliasing, whose calls may be shared by common subexpression elimination
+CSE_PURE_FUNCTIONS = ["sum", "prod", "exp", "log", "log10", "sqrt", "abs", "maximum", "minimum", "matmul", "dot", "shape", "power"]
+
+
 class ScipyModelCode:
     """Helper of ModelAgent for creating scipy model codes."""
 
@@ -24,6 +43,39 @@ class ScipyModelCode:
         self.codes.append("from scipy.optimize import fsolve")
         self.codes.append("from scipy.integrate import solve_bvp, solve_ivp")
         self.codes.append("")
+
+    def add_output_grid(self):
+        self.codes.extend([
+            "def adaptive_output_grid(t, y, n):",
+            '    """Place `n` output points on `[t[0], t[-1]]`, half uniformly and half by solution curvature."""',
+            "    if len(t) < 3:",
+            "        return np.linspace(t[0], t[-1], n)",
+            "    slope = np.diff(y, axis=1) / np.diff(t)",
+            "    curvature = np.abs(np.diff(slope, axis=1)).sum(axis=0)",
+            "    curvature = np.concatenate(([curvature[0]], curvature, [curvature[-1]]))",
+            "    curvature = (curvature[1:] + curvature[:-1]) / 2",
+            "    weight = np.diff(t) / (t[-1] - t[0])",
+            "    if curvature.sum() > 0:",
+            "        weight = weight + curvature / curvature.sum()",
+            "    cumulative_weight = np.concatenate(([0], np.cumsum(weight)))",
+            "    return np.interp(np.linspace(0, cumulative_weight[-1], n), cumulative_weight, t)",
+            "",
+        ])
+
+    def add_implicit_solver(self):
+        self.codes.extend([
+            "implicit_solutions = {}",
+            "",
+            "def solve_implicit(name, func, x0, inputs):",
+            '    """Root of the implicit equation `func` of `name` from `x0`, cached across simulations by the `inputs` of the law."""',
+            "    key = (name, ) + tuple(np.asarray(v, dtype=np.float64).tobytes() for v in (x0, ) + tuple(inputs))",
+            "    if key not in implicit_solutions:",
+            "        if len(implicit_solutions) >= 4096:",
+            "            implicit_solutions.clear()",
+            "        implicit_solutions[key] = fsolve(func, x0, xtol=1e-6, maxfev=1000)[0]",
+            "    return implicit_solutions[key]",
+            "",
+        ])
     
     def add_function(self, model_variable, input_symbols, code, level):
         function_head = f"calc_{model_variable.lower().replace('-', '_')}({', '.join(input_symbols)})"
@@ -32,11 +84,35 @@ class ScipyModelCode:
             code = code.split("\n")[1:] + code.split("\n")[:1]
         else:
             code = code.split("\n")
+        # inner fsolve of a law of the parameter part is solved by `solve_implicit`, keyed by the function inputs as the
+        # law may reassign them; inside `derivative` the inputs follow the state, so the cold fsolve of the law is kept
+        if level == 1 and any(re.match(r"^fsolve\(inner_param_func, ", c) for c in code):
+            function_name = function_head.split("(")[0]
+            self.add(f"_inputs = ({', '.join(input_symbols)}, )", level + 1)
+            code = [re.sub(r"^fsolve\(inner_param_func, ([^,]+), xtol=1e-6, maxfev=1000\)\[0\]$", f"solve_implicit('{function_name}', inner_param_func, \\1, _inputs)", c) for c in code]
         for c in code[:-1]:
             self.add(c, level + 1)
         self.add("return " + code[-1].strip(), level + 1)
         return function_head
 
+    def local_symbols(self, position, level):
+        """Arguments and assigned symbols of the function generated from `position` with its body at `level`.
+
+        Args:
+            position (int): index of the function head in `codes`
+            level (int): indentation level of the function body
+
+        Returns:
+            set: symbols local to the function, e.g. the state `c` and everything derived from it in `derivative`
+        """
+        head = re.match(r"^ *def \w+\((.*)\):$", self.codes[position])
+        symbols = set(a.strip() for a in head.group(1).split(",")) if head else set()
+        for c in self.codes[position + 1:]:
+            assignment = re.match(f"^ {{{self.spaces * level}}}(\\w+)(\\[.*\\])? \\*?= ", c)
+            if assignment:
+                symbols.add(assignment.group(1))
+        return symbols
+
     def add(self, code, level):
         if isinstance(code, str):
             self.codes.append(" " * self.spaces * level + code)
@@ -47,6 +123,233 @@ class ScipyModelCode:
     def get_model(self):
         return '\n'.join(self.codes)
 
+    @staticmethod
+    def find_closing_bracket(code, pos):
+        """Find the index of the bracket closing the one opened at `pos`."""
+        depth = 0
+        for i in range(pos, len(code)):
+            if code[i] == "(":
+                depth += 1
+            elif code[i] == ")":
+                depth -= 1
+                if depth == 0:
+                    return i
+        return len(code)
+
+    @staticmethod
+    def reduce_last_axis(code, keepdims=False):
+        """Rewrite reductions of a numpy expression for arrays with leading mesh node axes.
+
+        `np.sum`, `np.prod` and `len` act on the whole (species or stream) dimension of
+        an unbatched array, which becomes the last axis once node axes are prepended.
+        Other calls than `SCIPY_VECTORIZED_FUNCTIONS` raise `ValueError`, as they may act on the node axes.
+        """
+        axis = ", axis=-1, keepdims=True" if keepdims else ", axis=-1"
+        for func in ["np.sum(", "np.prod("]:
+            pos = code.find(func)
+            while pos >= 0:
+                end = ScipyModelCode.find_closing_bracket(code, pos + len(func) - 1)
+                code = code[:end] + axis + code[end:]
+                pos = code.find(func, pos + len(func))
+        pos = re.search(r"(?<![\w.])len\(", code)
+        while pos:
+            end = ScipyModelCode.find_closing_bracket(code, pos.end() - 1)
+            code = code[:pos.start()] + "np.shape(" + code[pos.end():end] + ")[-1]" + code[end + 1:]
+            pos = re.search(r"(?<![\w.])len\(", code)
+        for func in re.findall(r"([\w.]+)\(", code):
+            if func not in SCIPY_VECTORIZED_FUNCTIONS:
+                raise ValueError(f"Cannot vectorize {func} over mesh nodes: {code}")
+        return code
+
+    @staticmethod
+    def check_vectorized(code, subscripts):
+        """Raise `ValueError` if the node subscripts of a vectorized numpy expression were not all rewritten.
+
+        Every occurrence of a symbol in `subscripts` must be followed by its node subscript (e.g. `[..., 0]`),
+        which must not be followed by a plain index, and masks chained after a subscript must index the
+        last axes (`[..., mask > 0]`).
+
+        Args:
+            code (str): numpy expression
+            subscripts (dict): node subscript of each symbol
+        """
+        for symbol, subscript in subscripts.items():
+            for match in re.finditer(f"(?<![\\w.]){re.escape(symbol)}(?!\\w)", code):
+                rest = code[match.end():]
+                if not rest.startswith(subscript) or re.match(r"\[\d", rest[len(subscript):]):
+                    raise ValueError(f"Cannot vectorize {symbol} over mesh nodes: {code}")
+        if re.search(r"\]\[(?!\.\.\.)[^\[\]]* [<>] ", code):
+            raise ValueError(f"Cannot vectorize mask over mesh nodes: {code}")
+
+    @staticmethod
+    def eliminate_common_subexpressions(codes, level):
+        """Compute subexpressions repeated across the statements of a function body once.
+
+        Repeated pure expressions (arithmetic, comparisons and calls of `CSE_PURE_FUNCTIONS`) of
+        top-level statements are assigned to temporaries `_cse0`, `_cse1`, ... before their first
+        use, as long as none of their variables is written between the uses, taking the largest
+        savings first. Variables passed to other functions are taken as written by these calls.
+        Compound statements and nested functions are kept as they are, and expressions assigned
+        as a whole to a variable are not shared, so that no arrays get aliased. Statements are
+        rewritten in place, so the remaining code keeps its formatting.
+
+        Args:
+            codes (list of str): lines of the function body
+            level (int): indentation level of the function body
+
+        Returns:
+            list of str: lines of the function body with common subexpressions eliminated
+            int: number of eliminated subexpressions
+            int: number of operations saved per evaluation
+        """
+        indent = " " * 4 * level
+        source = "\n".join(c[len(indent):] for c in codes).encode()
+        # ast positions are utf-8 byte offsets
+        line_offsets = [0]
+        for line in source.split(b"\n"):
+            line_offsets.append(line_offsets[-1] + len(line) + 1)
+        span = lambda node: (line_offsets[node.lineno - 1] + node.col_offset, line_offsets[node.end_lineno - 1] + node.end_col_offset)
+        body = ast.parse(source).body
+        originals = {id(stmt) for stmt in body}
+        replaced = []
+        count = 0
+        saved = 0
+        while True:
+            occurrences = {}
+            for i, stmt in enumerate(body):
+                for node in ScipyModelCode.subexpressions(stmt):
+                    occurrences.setdefault(ast.dump(node), []).append((i, node))
+            writes = [ScipyModelCode.written_names(stmt) for stmt in body]
+            passed = [ScipyModelCode.passed_names(stmt) for stmt in body]
+            best = None
+            for occurrence in occurrences.values():
+                names = {n.id for n in ast.walk(occurrence[0][1]) if isinstance(n, ast.Name)} - {"np"}
+                if not names:
+                    continue
+                # runs of occurrences evaluated on the same variables, excluding statements which may change them during evaluation
+                runs = [[]]
+                for i, node in occurrence:
+                    if passed[i] & names:
+                        continue
+                    if runs[-1] and any(writes[j] & names for j in range(runs[-1][-1][0], i)):
+                        runs.append([])
+                    runs[-1].append((i, node))
+                for run in runs:
+                    gain = (len(run) - 1) * ScipyModelCode.count_operations(run[0][1]) if len(run) > 1 else 0
+                    if gain and (best is None or gain > best[0]):
+                        best = (gain, run)
+            if best is None:
+                break
+            gain, occurrence = best
+            temp = f"cse{count}"
+            for i, node in occurrence:
+                ScipyModelCode.replace_node(body[i], node, ast.Name(id=temp, ctx=ast.Load()))
+                replaced.append(span(node) + (temp, ))
+            body.insert(occurrence[0][0], ast.Assign(targets=[ast.Name(id=temp, ctx=ast.Store())], value=occurrence[0][1]))
+            count += 1
+            saved += gain
+
+        temps = {stmt.targets[0].id: f"_cse{k}" for k, stmt in enumerate(stmt for stmt in body if id(stmt) not in originals)}
+
+        def substitute(start, end):
+            """Source between byte offsets with the outermost replaced expressions inside substituted by their temporaries"""
+            inner = sorted((r for r in replaced if start <= r[0] and r[1] <= end and (r[0], r[1]) != (start, end)), key=lambda r: (r[0], -r[1]))
+            text = b""
+            pos = start
+            for r_start, r_end, temp in inner:
+                if r_start >= pos:
+                    text += source[pos:r_start] + temps[temp].encode()
+                    pos = r_end
+            return (text + source[pos:end]).decode()
+
+        # comments and blank lines are kept, temporaries go right before the statement of their first use
+        eliminated = []
+        assigns = []
+        pos = 0
+        for stmt in body:
+            if id(stmt) not in originals:
+                assigns.append(f"{temps[stmt.targets[0].id]} = {substitute(*span(stmt.value))}")
+                continue
+            start, end = span(stmt)
+            line_end = source.find(b"\n", end) if source.find(b"\n", end) >= 0 else len(source)
+            eliminated.extend(source[pos:start].decode().split("\n")[:-1] + assigns)
+            eliminated.extend((substitute(start, end) + source[end:line_end].decode()).split("\n"))
+            assigns = []
+            pos = line_end + 1
+        eliminated.extend(assigns + (source[pos:].decode().split("\n") if pos < len(source) else []))
+        return [indent + c if c else c for c in eliminated], count, saved
+
+    @staticmethod
+    def subexpressions(stmt):
+        """Candidate subexpressions of a simple statement for `eliminate_common_subexpressions`."""
+        if not isinstance(stmt, (ast.Assign, ast.AugAssign, ast.Expr, ast.Return)) or stmt.value is None:
+            return []
+        nodes = [stmt.value]
+        if isinstance(stmt, ast.Assign) and not all(isinstance(t, (ast.Subscript, ast.Attribute)) for t in stmt.targets):
+            nodes = list(ast.iter_child_nodes(stmt.value))
+        candidates = []
+        while nodes:
+            node = nodes.pop(0)
+            if isinstance(node, (ast.Lambda, ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)):
+                continue
+            if isinstance(node, (ast.BinOp, ast.UnaryOp, ast.Compare, ast.Call)) and ScipyModelCode.is_pure(node):
+                candidates.append(node)
+            nodes.extend(ast.iter_child_nodes(node))
+        return candidates
+
+    @staticmethod
+    def is_pure(node):
+        """Whether an expression only calls `CSE_PURE_FUNCTIONS` and `len`."""
+        for n in ast.walk(node):
+            if isinstance(n, (ast.Lambda, ast.NamedExpr, ast.Starred, ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)):
+                return False
+            if isinstance(n, ast.Call):
+                func = n.func
+                if isinstance(func, ast.Name) and func.id == "len":
+                    continue
+                if isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name) and func.value.id == "np" and func.attr in CSE_PURE_FUNCTIONS:
+                    continue
+                return False
+        return True
+
+    @staticmethod
+    def passed_names(stmt):
+        """Variables passed to calls of anything else than `CSE_PURE_FUNCTIONS` by a statement, which may change them."""
+        if isinstance(stmt, (ast.FunctionDef, ast.ClassDef)):
+            return set()
+        calls = [n for n in ast.walk(stmt) if isinstance(n, ast.Call) and not ScipyModelCode.is_pure(n)]
+        return {n.id for call in calls for n in ast.walk(call) if isinstance(n, ast.Name)}
+
+    @staticmethod
+    def written_names(stmt):
+        """Variables a statement may write: assigned variables, variables of assigned items and `passed_names`."""
+        if isinstance(stmt, (ast.FunctionDef, ast.ClassDef)):
+            return {stmt.name}
+        names = ScipyModelCode.passed_names(stmt)
+        for node in ast.walk(stmt):
+            if isinstance(node, (ast.Name, ast.Subscript, ast.Attribute)) and isinstance(node.ctx, (ast.Store, ast.Del)):
+                while isinstance(node, (ast.Subscript, ast.Attribute)):
+                    node = node.value
+                if isinstance(node, ast.Name):
+                    names.add(node.id)
+        return names
+
+    @staticmethod
+    def count_operations(node):
+        return sum(isinstance(n, (ast.BinOp, ast.UnaryOp, ast.Compare, ast.Call)) for n in ast.walk(node))
+
+    @staticmethod
+    def replace_node(root, old, new):
+        """Replace the node `old` by `new` in the tree of `root`."""
+        for node in ast.walk(root):
+            for field, value in ast.iter_fields(node):
+                if value is old:
+                    setattr(node, field, new)
+                    return
+                if isinstance(value, list) and any(v is old for v in value):
+                    value[[i for i, v in enumerate(value) if v is old][0]] = new
+                    return
+
 
 class PyomoModelCode:
     """Helper of ModelAgent for creating pyomo model codes."""
@@ -184,6 +487,34 @@ class ModelAgent:
         self.entity = entity
         self.model_context = model_context
         self.calibrated_parameter = calibrated_parameter
+        self.parameter_value_index = None
+        self.common_subexpressions = None
+
+    def translate_entity(self):
+        """Translate the symbols and formulas of the laws selected by the model context to numpy in one pass, ahead of code generation.
+
+        Laws of the phenomena of the description and the parameter laws are translated with their model variables and
+        definitions. Other translations needed by the generated model are made (and cached) on first use.
+        """
+        description = self.model_context["description"]
+        phenomena = [description["accumulation"], description["flow_pattern"]] + description["molecular_transport"] + \
+            [p for ps in description["reaction"].values() for p in ps]
+        laws = [l for l in self.entity["law"] if self.entity["law"][l]["phenomenon"] in phenomena] + \
+            [l for l in description["parameter_law"].values() if l in self.entity["law"]]
+        model_variables = set()
+        for l in laws:
+            law = self.entity["law"][l]
+            model_variables.update(law["model_variables"] + law["optional_model_variables"])
+            model_variables.update(mv for mv in [law["differential_model_variable"], law["differential_upper_limit"]] if mv)
+        definitions = set(self.entity["model_variable"][mv]["definition"] for mv in model_variables if self.entity["model_variable"][mv]["definition"])
+        model_variables.update(mv for d in definitions for mv in self.entity["definition"][d]["model_variables"])
+
+        mml_strs = [self.entity["model_variable"][mv]["symbol"] for mv in model_variables if self.entity["model_variable"][mv]["symbol"]]
+        mml_strs.extend(self.entity["definition"][d]["formula"] for d in definitions if self.entity["definition"][d].get("formula"))
+        for l in laws:
+            law = self.entity["law"][l]
+            mml_strs.extend(f for f in [law["formula"], law["formula_integrated_with_accumulation"]] if f)
+        MMLExpression.convert_many(mml_strs, "numpy")
     
     def extract_parameter_value(self):
         parameter_value_dict = {}
@@ -301,6 +632,21 @@ class ModelAgent:
         return parameter_value_dict
 
 
+    def parameter_index(self, keys):
+        """Locate parameters in the flat parameter vector `p` of generated models.
+
+        Args:
+            keys (list): parameter keys `(parameter, species, reaction, stream, solvent)`
+
+        Returns:
+            list: index of each key in `p`, None for keys not used by the model
+        """
+        # the keys of `p` are fixed by the model context, so they are indexed once per agent
+        if self.parameter_value_index is None:
+            self.parameter_value_index = {k: i for i, k in enumerate(self.extract_parameter_value())}
+        return [self.parameter_value_index.get(tuple(k)) for k in keys]
+
+
     def to_flowchart(self):
         # accumulation -> parameter / rate_variable -> parameter
         flowchart = {"chart": [[], [], []], "link": []}
@@ -483,7 +829,49 @@ class ModelAgent:
         return flowchart
 
 
-    def to_scipy_model(self):
+    @staticmethod
+    def solver_options(solver=None):
+        """Validate solver settings of a request, as they are written into the generated code.
+
+        Args:
+            solver (dict): solver settings overriding `SCIPY_SOLVER_OPTIONS`, or None
+
+        Returns:
+            dict: all solver settings, with `rtol` and `atol` as float and `n_eval` and `decimals` as int
+
+        Raises:
+            ValueError: on unknown settings, or values of the wrong type or out of range
+        """
+        if solver is None:
+            solver = {}
+        if not isinstance(solver, dict):
+            raise ValueError(f"Solver settings must be a dict: {solver}")
+        unknown = [k for k in solver if k not in SCIPY_SOLVER_OPTIONS]
+        if unknown:
+            raise ValueError(f"Unknown solver settings: {unknown}")
+        solver = {**SCIPY_SOLVER_OPTIONS, **solver}
+        if solver["method"] not in SCIPY_IVP_METHODS:
+            raise ValueError(f"Unsupported solver method: {solver['method']}")
+        for key in ["rtol", "atol"]:
+            if isinstance(solver[key], bool) or not isinstance(solver[key], (int, float)) or not 0 < solver[key] < float("inf"):
+                raise ValueError(f"Solver {key} must be a positive number: {solver[key]}")
+            solver[key] = float(solver[key])
+        for key in ["n_eval", "decimals"]:
+            if solver[key] is None and key == "decimals":
+                continue
+            if isinstance(solver[key], bool) or not (isinstance(solver[key], int) or isinstance(solver[key], float) and solver[key].is_integer()):
+                raise ValueError(f"Solver {key} must be an integer: {solver[key]}")
+            solver[key] = int(solver[key])
+        if solver["n_eval"] < 2:
+            raise ValueError(f"Solver n_eval must be at least 2: {solver['n_eval']}")
+        if solver["decimals"] is not None and not 0 <= solver["decimals"] <= 15:
+            raise ValueError(f"Solver decimals must be between 0 and 15: {solver['decimals']}")
+        if not isinstance(solver["adaptive"], bool):
+            raise ValueError(f"Solver adaptive must be a boolean: {solver['adaptive']}")
+        return solver
+
+
+    def to_scipy_model(self, vectorized=False, theta_keys=None, operating_keys=None, solver=None, cse=False):
         """The converted scipy model is given as:
         
         parameter_value_dict: `{(parameter, species, reaction, stream, solvent): value}`
@@ -494,13 +882,51 @@ class ModelAgent:
             res = solve_bvp(derivative, boundary, x_init, c_init)
             return res.x, post_process(res.y)
 
+        With `vectorized`, `derivative` accepts states of shape `(n_states, n_nodes)` and
+        evaluates all mesh nodes at once, so `solve_bvp` takes one call per collocation
+        iteration instead of looping over the nodes in `derivative_axis`. Formulas whose node
+        subscripts or reductions cannot be rewritten raise `ValueError`, see `ScipyModelCode.check_vectorized`.
+
+        All entry points take `outlet`: when set, only the terminal state is returned as
+        `[end, c_end, q]`, integrated without output grid or rounding.
+
+        With `theta_keys` and `operating_keys`, the model is simulated from the flat parameter
+        vector by `simulation_vector(p)`, and also exposes `simulate(theta, operating)`, which
+        writes both arrays into a copy of that vector at the fixed indices given by `parameter_index`.
+
+        Implicit laws (SOLVE START/SOLVE END) whose inputs do not depend on the state are solved in the
+        parameter part, once per simulation, by `solve_implicit`, which caches roots across simulations by
+        the inputs of the law. Implicit laws reading the state keep their cold `fsolve` in `derivative`.
+
+        With `cse`, subexpressions shared by the laws combined in `derivative` (or `conversion`)
+        are computed once per evaluation, see `ScipyModelCode.eliminate_common_subexpressions`.
+        The number of eliminated subexpressions and saved operations is noted at the top of its body
+        and kept in `common_subexpressions`. It is off by default and used by the calibration script,
+        which evaluates the right-hand side for every candidate and condition; the outputs with and
+        without it are checked to be equal by `benchmarks/model_cse.py`.
+
+        Args:
+            vectorized (bool): generate a node-vectorized `derivative` (dispersion models only)
+            theta_keys (list): keys of the parameters passed as `theta` to `simulate`
+            operating_keys (list): keys of the operating parameters passed as `operating` to `simulate`
+            solver (dict): solver settings overriding `SCIPY_SOLVER_OPTIONS`, validated by `solver_options`;
+                dispersion models solved by `solve_bvp` ignore `method`, `atol` and `adaptive`, and use `rtol` as `tol`
+            cse (bool): eliminate common subexpressions of the right-hand side, sets `common_subexpressions`
+
         Returns:
             str: converted scipy model
         """
 
+        solver = self.solver_options(solver)
+        rounding = f".round({solver['decimals']})" if solver["decimals"] is not None else ""
+
+        self.translate_entity()
         scipy_model_code = ScipyModelCode()
         # scipy_model_code.add_header(self.model_context)
         scipy_model_code.add_lib()
+        if solver["adaptive"] and not self.model_context["description"]["accumulation"] == "CSTR":
+            scipy_model_code.add_output_grid()
+        lib_position = len(scipy_model_code.codes)
 
         # parameter_value_dict
         parameter_value_dict = self.extract_parameter_value()
@@ -551,11 +977,20 @@ class ModelAgent:
         if self.model_context["description"]["accumulation"] in ["Continuous", "Batch"]:
             differential_model_variable = self.entity["law"][accumulation_law]["differential_model_variable"]
             differential_model_variable_symbol = MMLExpression(self.entity["model_variable"][differential_model_variable]['symbol']).to_numpy().strip()
+        # vectorized mode: states carry a leading mesh node axis, so stream and species are indexed from the end
+        vectorized = vectorized and bool(formula_integrated_with_accumulation)
+        node_shape = "c.shape[:-2] + " if vectorized else ""
+        node_index = "..., " if vectorized else ""
+        layout = theta_keys is not None or operating_keys is not None
 
         # simulation function head
-        scipy_model_code.add("def simulation(parameter_value_dict):", 0)
-        scipy_model_code.add("# PARAMETER PART", 1)
-        scipy_model_code.add("p = list(parameter_value_dict.values())", 1)
+        if layout:
+            scipy_model_code.add("def simulation_vector(p, outlet=False):", 0)
+            scipy_model_code.add("# PARAMETER PART", 1)
+        else:
+            scipy_model_code.add("def simulation(parameter_value_dict, outlet=False):", 0)
+            scipy_model_code.add("# PARAMETER PART", 1)
+            scipy_model_code.add("p = list(parameter_value_dict.values())", 1)
 
         # parameter setup
         for model_variable in model_variables:
@@ -643,11 +1078,14 @@ class ModelAgent:
                     scipy_model_code.add(f"{symbol} = {code}", 1)
                 scipy_model_code.add("", 0)
         scipy_model_code.add("", 0)
+        derivative_position = len(scipy_model_code.codes)
 
         # concentration axial position derivative function
         if self.model_context["description"]["accumulation"] == "Continuous":
             scipy_model_code.add(f"def derivative({differential_model_variable_symbol}, c):", 1)
-            if formula_integrated_with_accumulation:
+            if vectorized:
+                scipy_model_code.add(f"c = np.asarray(c, dtype=np.float64).T.reshape(-1, {len(liquid_streams)}, {len(species) * 2})", 2)
+            elif formula_integrated_with_accumulation:
                 scipy_model_code.add(f"c = np.array(c, dtype=np.float64).reshape({len(liquid_streams)}, {len(species) * 2})", 2)
             else:
                 scipy_model_code.add(f"c = np.array(c, dtype=np.float64).reshape({len(liquid_streams)}, {len(species)})", 2)
@@ -666,7 +1104,7 @@ class ModelAgent:
         # reaction part
         scipy_model_code.add("# REACTION PART", 2)
         reaction_rate_symbol = MMLExpression(self.entity["model_variable"]["Reaction_Rate"]["symbol"]).to_numpy()
-        scipy_model_code.add(f'{reaction_rate_symbol} = np.zeros(({len(liquid_streams)}, {len(reactions)}), dtype=np.float64)', 2)
+        scipy_model_code.add(f'{reaction_rate_symbol} = np.zeros({node_shape}({len(liquid_streams)}, {len(reactions)}), dtype=np.float64)', 2)
         scipy_model_code.add("", 0)
         definition_model_variables = list(set([mv for laws in reaction_laws.values() for l in laws for mv in self.entity["law"][l]["model_variables"] if self.entity["model_variable"][mv]["definition"]]))
         definition_parameters = [self.entity["model_variable"][mv] for mv in definition_model_variables]
@@ -674,34 +1112,56 @@ class ModelAgent:
             definition_dimensions = definition_parameter["dimensions"]
             symbol = MMLExpression(definition_parameter["symbol"]).to_numpy()
             formula = MMLExpression(self.entity["definition"][definition_parameter["definition"]]["formula"]).to_numpy()
+            if vectorized:
+                formula = scipy_model_code.reduce_last_axis(formula)
             if "Stream" not in definition_dimensions:
                 scipy_model_code.add(f'{symbol} = {formula}', 2)
             else:
-                scipy_model_code.add(f'{symbol} = np.zeros(({len(liquid_streams)}, ), dtype=np.float64)', 2)
+                scipy_model_code.add(f'{symbol} = np.zeros({node_shape}({len(liquid_streams)}, ), dtype=np.float64)', 2)
                 model_variables = list(set([mv for mv in self.entity["definition"][definition_parameter["definition"]]["model_variables"]]))
                 parameters = [self.entity["model_variable"][mv] for mv in model_variables]
                 symbols = [MMLExpression(p["symbol"]).to_numpy() for p in parameters]
                 for stream_index, stream in enumerate(liquid_streams):
+                    stream_subscript = f"[{node_index}{stream_index}]"
+                    # each stream is subscripted from the unsubscripted definition
+                    stream_formula = formula
                     for p, s in zip(parameters, symbols):
                         if "Stream" in p["dimensions"]:
-                            formula = re.sub(f'-{s} ', f'-{s}[{stream_index}] ', formula)
-                            formula = re.sub(f'{s},', f'{s}[{stream_index}],', formula)
-                            formula = re.sub(f' {s}\)', f' {s}[{stream_index}])', formula)
-                            formula = re.sub(f'\({s} ', f'({s}[{stream_index}] ', formula)
-                            formula = re.sub(f' {s} ', f' {s}[{stream_index}] ', formula)
-                            formula = re.sub(f'^{s}$', f'{s}[{stream_index}]', formula)
-                            formula = re.sub(f'\[{s}', f'[{s}[{stream_index}]', formula)
-                            formula = re.sub(f'{s}(\[[^ <>\[\]]+(\[[:0-9]+\])* [<>] 0\])', f'{s}[{stream_index}]\\1', formula)
-                    scipy_model_code.add(f'{symbol}[{stream_index}] = {formula}', 2)
+                            parameter_subscript = f"[..., {stream_index}, :]" if vectorized and "Species" in p["dimensions"] else stream_subscript
+                            stream_formula = re.sub(f'-{s} ', f'-{s}{parameter_subscript} ', stream_formula)
+                            stream_formula = re.sub(f'{s},', f'{s}{parameter_subscript},', stream_formula)
+                            stream_formula = re.sub(f' {s}\)', f' {s}{parameter_subscript})', stream_formula)
+                            stream_formula = re.sub(f'\({s} ', f'({s}{parameter_subscript} ', stream_formula)
+                            stream_formula = re.sub(f' {s} ', f' {s}{parameter_subscript} ', stream_formula)
+                            stream_formula = re.sub(f'^{s}$', f'{s}{parameter_subscript}', stream_formula)
+                            stream_formula = re.sub(f'\[{s}', f'[{s}{parameter_subscript}', stream_formula)
+                            stream_formula = re.sub(f'{s}(\[[^ <>\[\]]+(\[[:0-9]+\])* [<>] 0\])', f'{s}{parameter_subscript}\\1', stream_formula)
+                    if vectorized:
+                        stream_formula = re.sub(r'\]\[([^ <>\[\]]+(\[[:0-9]+\])* [<>] 0)\]', r'][..., \1]', stream_formula)
+                        scipy_model_code.check_vectorized(stream_formula, {
+                            s: f"[..., {stream_index}, :]" if "Species" in p["dimensions"] else stream_subscript
+                            for p, s in zip(parameters, symbols) if "Stream" in p["dimensions"]
+                        })
+                    scipy_model_code.add(f'{symbol}{stream_subscript} = {stream_formula}', 2)
         scipy_model_code.add("", 0)
         for stream_index, stream in enumerate(liquid_streams):
             for reaction_index, reaction in enumerate(reactions):
                 if reaction not in self.model_context["information"]["streams"][stream]["reactions"]: continue
                 solvent_index = solvents.index(self.model_context["information"]["streams"][stream]["solvent"])
                 scipy_model_code.add(f"# stream: {stream}  reaction: {reaction}", 2)
+                stream_subscript = f"[{node_index}{stream_index}]"
+                if vectorized:
+                    stream_species_subscript = f"[..., {stream_index}, :{len(species)}]"
+                elif formula_integrated_with_accumulation:
+                    stream_species_subscript = f"[{stream_index}][:{len(species)}]"
+                else:
+                    stream_species_subscript = f"[{stream_index}]"
+                reaction_rate_subscript = f"[..., {stream_index}, {reaction_index}]" if vectorized else f"[{stream_index}][{reaction_index}]"
                 laws = reaction_laws[reaction]
                 reaction_formulas = [self.entity["law"][l]["formula"] for l in laws if "specifically defined" not in self.entity["law"][l]["formula"]]
                 reaction_formulas = [MMLExpression(f).to_numpy() for f in reaction_formulas]
+                if vectorized:
+                    reaction_formulas = [scipy_model_code.reduce_last_axis(f) for f in reaction_formulas]
                 parameters = [self.entity["model_variable"][mv] for l in laws for mv in self.entity["law"][l]["model_variables"]]
                 symbols = [MMLExpression(p["symbol"]).to_numpy() for p in parameters]
                 
@@ -715,40 +1175,43 @@ class ModelAgent:
                     formula = [s if '=' in s or ':' in s else re.sub('^( *)([^ ].*)$', r'\1return \2', s) for s in formula.split('\n')]
                     scipy_model_code.add("def " + formula_fun + ":", 2)
                     scipy_model_code.add(formula, 3)
+                    if vectorized:
+                        formula_fun_name = formula_fun.split("(")[0]
+                        scipy_model_code.add(f"{formula_fun_name} = np.vectorize({formula_fun_name}, otypes=[np.float64])", 2)
                     reaction_formulas.append(formula_fun)
                 
                 for p, s in zip(parameters, symbols):
                     if "Stream" in p["dimensions"] and "Species" not in p["dimensions"]:
-                        reaction_formulas = [re.sub(f'-{s} ', f'-{s}[{stream_index}] ', f) for f in reaction_formulas]
-                        reaction_formulas = [re.sub(f'{s},', f'{s}[{stream_index}],', f) for f in reaction_formulas]
-                        reaction_formulas = [re.sub(f' {s}\)', f' {s}[{stream_index}])', f) for f in reaction_formulas]
-                        reaction_formulas = [re.sub(f'\({s} ', f'({s}[{stream_index}] ', f) for f in reaction_formulas]
-                        reaction_formulas = [re.sub(f'\({s}\)', f'({s}[{stream_index}])', f) for f in reaction_formulas]
-                        reaction_formulas = [re.sub(f' {s} ', f' {s}[{stream_index}] ', f) for f in reaction_formulas]
-                        reaction_formulas = [re.sub(f'^{s}$', f'{s}[{stream_index}]', f) for f in reaction_formulas]
-                        reaction_formulas = [re.sub(f'\[{s}', f'[{s}[{stream_index}]', f) for f in reaction_formulas]
-                        reaction_formulas = [re.sub(f'{s}(\[[^ <>\[\]]+(\[[:0-9]+\])* [<>] 0\])', f'{s}[{stream_index}]\\1', f) for f in reaction_formulas]
+                        reaction_formulas = [re.sub(f'-{s} ', f'-{s}{stream_subscript} ', f) for f in reaction_formulas]
+                        reaction_formulas = [re.sub(f'{s},', f'{s}{stream_subscript},', f) for f in reaction_formulas]
+                        reaction_formulas = [re.sub(f' {s}\)', f' {s}{stream_subscript})', f) for f in reaction_formulas]
+                        reaction_formulas = [re.sub(f'\({s} ', f'({s}{stream_subscript} ', f) for f in reaction_formulas]
+                        reaction_formulas = [re.sub(f'\({s}\)', f'({s}{stream_subscript})', f) for f in reaction_formulas]
+                        reaction_formulas = [re.sub(f' {s} ', f' {s}{stream_subscript} ', f) for f in reaction_formulas]
+                        reaction_formulas = [re.sub(f'^{s}$', f'{s}{stream_subscript}', f) for f in reaction_formulas]
+                        reaction_formulas = [re.sub(f'\[{s}', f'[{s}{stream_subscript}', f) for f in reaction_formulas]
+                        reaction_formulas = [re.sub(f'{s}(\[[^ <>\[\]]+(\[[:0-9]+\])* [<>] 0\])', f'{s}{stream_subscript}\\1', f) for f in reaction_formulas]
                     if "Stream" in p["dimensions"] and "Species" in p["dimensions"]:
                         if formula_integrated_with_accumulation:
-                            reaction_formulas = [re.sub(f'-{s} ', f'-{s}[{stream_index}][:{len(species)}] ', f) for f in reaction_formulas]
-                            reaction_formulas = [re.sub(f'{s},', f'{s}[{stream_index}][:{len(species)}],', f) for f in reaction_formulas]
-                            reaction_formulas = [re.sub(f' {s}\)', f' {s}[{stream_index}][:{len(species)}])', f) for f in reaction_formulas]
-                            reaction_formulas = [re.sub(f'\({s} ', f'({s}[{stream_index}][:{len(species)}] ', f) for f in reaction_formulas]
-                            reaction_formulas = [re.sub(f'\({s}\)', f'({s}[{stream_index}][:{len(species)}])', f) for f in reaction_formulas]
-                            reaction_formulas = [re.sub(f' {s} ', f' {s}[{stream_index}][:{len(species)}] ', f) for f in reaction_formulas]
-                            reaction_formulas = [re.sub(f'^{s}$', f'{s}[{stream_index}][:{len(species)}]', f) for f in reaction_formulas]
-                            reaction_formulas = [re.sub(f'\[{s}', f'[{s}[{stream_index}][:{len(species)}]', f) for f in reaction_formulas]
-                            reaction_formulas = [re.sub(f'{s}(\[[^ <>\[\]]+(\[[:0-9]+\])* [<>] 0\])', f'{s}[{stream_index}][:{len(species)}]\\1', f) for f in reaction_formulas]
+                            reaction_formulas = [re.sub(f'-{s} ', f'-{s}{stream_species_subscript} ', f) for f in reaction_formulas]
+                            reaction_formulas = [re.sub(f'{s},', f'{s}{stream_species_subscript},', f) for f in reaction_formulas]
+                            reaction_formulas = [re.sub(f' {s}\)', f' {s}{stream_species_subscript})', f) for f in reaction_formulas]
+                            reaction_formulas = [re.sub(f'\({s} ', f'({s}{stream_species_subscript} ', f) for f in reaction_formulas]
+                            reaction_formulas = [re.sub(f'\({s}\)', f'({s}{stream_species_subscript})', f) for f in reaction_formulas]
+                            reaction_formulas = [re.sub(f' {s} ', f' {s}{stream_species_subscript} ', f) for f in reaction_formulas]
+                            reaction_formulas = [re.sub(f'^{s}$', f'{s}{stream_species_subscript}', f) for f in reaction_formulas]
+                            reaction_formulas = [re.sub(f'\[{s}', f'[{s}{stream_species_subscript}', f) for f in reaction_formulas]
+                            reaction_formulas = [re.sub(f'{s}(\[[^ <>\[\]]+(\[[:0-9]+\])* [<>] 0\])', f'{s}{stream_species_subscript}\\1', f) for f in reaction_formulas]
                         else:
-                            reaction_formulas = [re.sub(f'-{s} ', f'-{s}[{stream_index}] ', f) for f in reaction_formulas]
-                            reaction_formulas = [re.sub(f'{s},', f'{s}[{stream_index}],', f) for f in reaction_formulas]
-                            reaction_formulas = [re.sub(f' {s}\)', f' {s}[{stream_index}])', f) for f in reaction_formulas]
-                            reaction_formulas = [re.sub(f'\({s} ', f'({s}[{stream_index}] ', f) for f in reaction_formulas]
-                            reaction_formulas = [re.sub(f'\({s}\)', f'({s}[{stream_index}])', f) for f in reaction_formulas]
-                            reaction_formulas = [re.sub(f' {s} ', f' {s}[{stream_index}] ', f) for f in reaction_formulas]
-                            reaction_formulas = [re.sub(f'^{s}$', f'{s}[{stream_index}]', f) for f in reaction_formulas]
-                            reaction_formulas = [re.sub(f'\[{s}', f'[{s}[{stream_index}]', f) for f in reaction_formulas]
-                            reaction_formulas = [re.sub(f'{s}(\[[^ <>\[\]]+(\[[:0-9]+\])* [<>] 0\])', f'{s}[{stream_index}]\\1', f) for f in reaction_formulas]
+                            reaction_formulas = [re.sub(f'-{s} ', f'-{s}{stream_species_subscript} ', f) for f in reaction_formulas]
+                            reaction_formulas = [re.sub(f'{s},', f'{s}{stream_species_subscript},', f) for f in reaction_formulas]
+                            reaction_formulas = [re.sub(f' {s}\)', f' {s}{stream_species_subscript})', f) for f in reaction_formulas]
+                            reaction_formulas = [re.sub(f'\({s} ', f'({s}{stream_species_subscript} ', f) for f in reaction_formulas]
+                            reaction_formulas = [re.sub(f'\({s}\)', f'({s}{stream_species_subscript})', f) for f in reaction_formulas]
+                            reaction_formulas = [re.sub(f' {s} ', f' {s}{stream_species_subscript} ', f) for f in reaction_formulas]
+                            reaction_formulas = [re.sub(f'^{s}$', f'{s}{stream_species_subscript}', f) for f in reaction_formulas]
+                            reaction_formulas = [re.sub(f'\[{s}', f'[{s}{stream_species_subscript}', f) for f in reaction_formulas]
+                            reaction_formulas = [re.sub(f'{s}(\[[^ <>\[\]]+(\[[:0-9]+\])* [<>] 0\])', f'{s}{stream_species_subscript}\\1', f) for f in reaction_formulas]
                     if "Reaction" in p["dimensions"] and "Solvent" not in p["dimensions"]:
                         reaction_formulas = [re.sub(f'-{s} ', f'-{s}[{reaction_index}] ', f) for f in reaction_formulas]
                         reaction_formulas = [re.sub(f'{s},', f'{s}[{reaction_index}],', f) for f in reaction_formulas]
@@ -769,7 +1232,14 @@ class ModelAgent:
                         reaction_formulas = [re.sub(f'^{s}$', f'{s}[{reaction_index}][{solvent_index}]', f) for f in reaction_formulas]
                         reaction_formulas = [re.sub(f'\[{s}', f'[{s}[{reaction_index}][{solvent_index}]', f) for f in reaction_formulas]
                         reaction_formulas = [re.sub(f'{s}(\[[^ <>\[\]]+(\[[:0-9]+\])* [<>] 0\])', f'{s}[{reaction_index}][{solvent_index}]\\1', f) for f in reaction_formulas]
-                scipy_model_code.add(f'{reaction_rate_symbol}[{stream_index}][{reaction_index}] = {" * ".join(reaction_formulas)}', 2)
+                if vectorized:
+                    reaction_formulas = [re.sub(r'\]\[([^ <>\[\]]+(\[[:0-9]+\])* [<>] 0)\]', r'][..., \1]', f) for f in reaction_formulas]
+                    for f in reaction_formulas:
+                        scipy_model_code.check_vectorized(f, {
+                            s: stream_species_subscript if "Species" in p["dimensions"] else stream_subscript
+                            for p, s in zip(parameters, symbols) if "Stream" in p["dimensions"]
+                        })
+                scipy_model_code.add(f'{reaction_rate_symbol}{reaction_rate_subscript} = {" * ".join(reaction_formulas)}', 2)
                 scipy_model_code.add("", 0)
         scipy_model_code.add("", 0)
 
@@ -781,20 +1251,46 @@ class ModelAgent:
             symbols = [MMLExpression(p["symbol"]).to_numpy() for p in parameters]
             for model_variable in [mv for mv in self.entity["model_variable"] if law in self.entity["model_variable"][mv]["laws"]]:
                 symbol = MMLExpression(self.entity["model_variable"][model_variable]["symbol"]).to_numpy()
-                scipy_model_code.add(f'{symbol} = np.zeros(({len(liquid_streams)}, {len(species)}), dtype=np.float64)', 2)
-                scipy_model_code.add("", 0)
                 code = MMLExpression(self.entity["law"][law]["formula"]).to_numpy()
+                # implicit laws whose inputs do not depend on the state are solved once per simulation in the parameter part
+                if "fsolve(inner_param_func, " in code and not set(symbols) & scipy_model_code.local_symbols(derivative_position, 2):
+                    implicit_code = ScipyModelCode()
+                    implicit_code.add(f'{symbol} = np.zeros(({len(liquid_streams)}, {len(species)}), dtype=np.float64)', 1)
+                    function_head = implicit_code.add_function(model_variable, symbols, code, 1)
+                    for species_index, s in enumerate(species):
+                        species_function_head = function_head
+                        for p, s in zip(parameters, symbols):
+                            if "Species" in p["dimensions"] and "Stream" not in p["dimensions"]:
+                                species_function_head = species_function_head.replace(f'{s},', f'{s}[{species_index}],')
+                                species_function_head = species_function_head.replace(f' {s})', f' {s}[{species_index}])')
+                            if "Species" in p["dimensions"] and "Stream" in p["dimensions"]:
+                                species_function_head = species_function_head.replace(f'{s},', f'{s}[:, {species_index}],')
+                                species_function_head = species_function_head.replace(f' {s})', f' {s}[:, {species_index}])')
+                        implicit_code.add(f"{symbol}[:, {species_index}] = {species_function_head}", 1)
+                    implicit_code.add("", 0)
+                    scipy_model_code.codes[derivative_position:derivative_position] = implicit_code.codes
+                    derivative_position += len(implicit_code.codes)
+                    continue
+                scipy_model_code.add(f'{symbol} = np.zeros({node_shape}({len(liquid_streams)}, {len(species)}), dtype=np.float64)', 2)
+                scipy_model_code.add("", 0)
+                if vectorized:
+                    code = scipy_model_code.reduce_last_axis(code, keepdims=True)
                 function_head = scipy_model_code.add_function(model_variable, symbols, code, 2)
                 for species_index, s in enumerate(species):
                     species_function_head = function_head
+                    species_subscript = f"..., {species_index}" if vectorized else f":, {species_index}"
                     for p, s in zip(parameters, symbols):
                         if "Species" in p["dimensions"] and "Stream" not in p["dimensions"]:
                             species_function_head = species_function_head.replace(f'{s},', f'{s}[{species_index}],')
                             species_function_head = species_function_head.replace(f' {s})', f' {s}[{species_index}])')
                         if "Species" in p["dimensions"] and "Stream" in p["dimensions"]:
-                            species_function_head = species_function_head.replace(f'{s},', f'{s}[:, {species_index}],')
-                            species_function_head = species_function_head.replace(f' {s})', f' {s}[:, {species_index}])')
-                    scipy_model_code.add(f"{symbol}[:, {species_index}] = {species_function_head}", 2)
+                            species_function_head = species_function_head.replace(f'{s},', f'{s}[{species_subscript}],')
+                            species_function_head = species_function_head.replace(f' {s})', f' {s}[{species_subscript}])')
+                    if vectorized:
+                        scipy_model_code.check_vectorized(species_function_head.split("(", 1)[1], {
+                            s: f"[{species_subscript}]" for p, s in zip(parameters, symbols) if "Species" in p["dimensions"] and "Stream" in p["dimensions"]
+                        })
+                    scipy_model_code.add(f"{symbol}[{species_subscript}] = {species_function_head}", 2)
                 scipy_model_code.add("", 0)
         scipy_model_code.add("", 0)
 
@@ -809,10 +1305,10 @@ class ModelAgent:
                 for s in symbols:
                     formula = re.sub(f'\[([^\[\]]*{s}[^\[\]]*)\]', r'\1', formula)
                 formula = re.sub('\[[^\[\]]*\]', '0', formula)
-                formula = formula.replace("dc / dz", f"c[:, {len(species)}:]")
-                scipy_model_code.add(f'dc = np.zeros(({len(liquid_streams)}, {len(species) * 2}), dtype=np.float64)', 2)
-                scipy_model_code.add(f'dc[:, :{len(species)}] = c[:, {len(species)}:]', 2)
-                scipy_model_code.add(f'dc[:, {len(species)}:] = {formula}', 2)
+                formula = formula.replace("dc / dz", f"c[{node_index or ':, '}{len(species)}:]")
+                scipy_model_code.add(f'dc = np.zeros({node_shape}({len(liquid_streams)}, {len(species) * 2}), dtype=np.float64)', 2)
+                scipy_model_code.add(f'dc[{node_index or ":, "}:{len(species)}] = c[{node_index or ":, "}{len(species)}:]', 2)
+                scipy_model_code.add(f'dc[{node_index or ":, "}{len(species)}:] = {formula}', 2)
             else:
                 formula = MMLExpression(self.entity["law"][accumulation_law]["formula"]).to_numpy()
                 for s in symbols:
@@ -832,10 +1328,19 @@ class ModelAgent:
             formula = formula.replace("c_0", "_c_0")
             scipy_model_code.add(f'dc = {formula} - c', 2)
         scipy_model_code.add("", 0)
-        scipy_model_code.add("dc = dc.reshape(-1, )", 2)
+        if vectorized:
+            scipy_model_code.add(f"dc = dc.reshape(-1, {len(liquid_streams) * len(species) * 2}).T", 2)
+        else:
+            scipy_model_code.add("dc = dc.reshape(-1, )", 2)
         scipy_model_code.add("return dc", 2)
+        if cse:
+            rhs_codes, cse_count, cse_saved = scipy_model_code.eliminate_common_subexpressions(scipy_model_code.codes[derivative_position + 1:], 2)
+            if cse_count:
+                rhs_codes.insert(0, " " * scipy_model_code.spaces * 2 + f"# COMMON SUBEXPRESSIONS: {cse_count}, {cse_saved} operations saved per evaluation")
+            scipy_model_code.codes[derivative_position + 1:] = rhs_codes
+            self.common_subexpressions = {"count": cse_count, "saved_operations": cse_saved}
         scipy_model_code.add("", 0)
-        if formula_integrated_with_accumulation:
+        if formula_integrated_with_accumulation and not vectorized:
             scipy_model_code.add("def derivative_axis(x, c):", 1)
             scipy_model_code.add("return np.stack([derivative(_x, _c) for _x, _c in zip(x, c.transpose(1, 0))], axis=1)", 2)
             scipy_model_code.add("", 0)
@@ -855,40 +1360,91 @@ class ModelAgent:
         if self.model_context["description"]["accumulation"] == "Continuous":
             differential_upper_limit = self.entity["law"][accumulation_law]["differential_upper_limit"]
             differential_upper_limit_symbol = MMLExpression(self.entity["model_variable"][differential_upper_limit]['symbol']).to_numpy().strip()
-            scipy_model_code.add(f"{differential_model_variable_symbol}_eval = np.linspace(0, {differential_upper_limit_symbol}, 201, dtype=np.float64)", 1)
             if formula_integrated_with_accumulation:
-                scipy_model_code.add(f"c = np.zeros(({len(liquid_streams) * len(species) * 2}, 201), dtype=np.float64)", 1)
-                scipy_model_code.add(f"res = solve_bvp(derivative_axis, boundary_function, {differential_model_variable_symbol}_eval, c)", 1)
+                scipy_model_code.add(f"{differential_model_variable_symbol}_eval = np.linspace(0, {differential_upper_limit_symbol}, {solver['n_eval']}, dtype=np.float64)", 1)
+                scipy_model_code.add(f"c = np.zeros(({len(liquid_streams) * len(species) * 2}, {solver['n_eval']}), dtype=np.float64)", 1)
+                scipy_model_code.add(f"res = solve_bvp({'derivative' if vectorized else 'derivative_axis'}, boundary_function, {differential_model_variable_symbol}_eval, c, tol={solver['rtol']})", 1)
+                scipy_model_code.add(f"if outlet:", 1)
+                scipy_model_code.add(f"if res.success and not np.isnan(res.y[:, -1]).any():", 2)
+                scipy_model_code.add(f"return [res.x[-1], res.y[:{len(liquid_streams) * len(species)}, -1], q]", 3)
+                scipy_model_code.add(f"return None", 2)
             else:
-                scipy_model_code.add(f"res = solve_ivp(derivative, (0, {differential_upper_limit_symbol}), c_0.reshape(-1, ), t_eval={differential_model_variable_symbol}_eval, method='LSODA', atol=1e-12)", 1)
+                scipy_model_code.add(f"if outlet:", 1)
+                scipy_model_code.add(f"res = solve_ivp(derivative, (0, {differential_upper_limit_symbol}), c_0.reshape(-1, ), method='{solver['method']}', rtol={solver['rtol']}, atol={solver['atol']})", 2)
+                scipy_model_code.add(f"if res.success and not np.isnan(res.y[:, -1]).any():", 2)
+                scipy_model_code.add(f"return [res.t[-1], res.y[:, -1], q]", 3)
+                scipy_model_code.add(f"return None", 2)
+                if solver["adaptive"]:
+                    scipy_model_code.add(f"res = solve_ivp(derivative, (0, {differential_upper_limit_symbol}), c_0.reshape(-1, ), method='{solver['method']}', rtol={solver['rtol']}, atol={solver['atol']}, dense_output=True)", 1)
+                    scipy_model_code.add(f"if res.success:", 1)
+                    scipy_model_code.add(f"res.t = adaptive_output_grid(res.t, res.y, {solver['n_eval']})", 2)
+                    scipy_model_code.add(f"res.y = res.sol(res.t)", 2)
+                else:
+                    scipy_model_code.add(f"{differential_model_variable_symbol}_eval = np.linspace(0, {differential_upper_limit_symbol}, {solver['n_eval']}, dtype=np.float64)", 1)
+                    scipy_model_code.add(f"res = solve_ivp(derivative, (0, {differential_upper_limit_symbol}), c_0.reshape(-1, ), t_eval={differential_model_variable_symbol}_eval, method='{solver['method']}', rtol={solver['rtol']}, atol={solver['atol']})", 1)
             scipy_model_code.add(f"if res.success:", 1)
             scipy_model_code.add(f"if np.isnan(res.y).any():", 2)
             scipy_model_code.add(f"return None", 3)
             scipy_model_code.add(f"else:", 2)
             if formula_integrated_with_accumulation:
-                scipy_model_code.add(f"return [res.x.round(6), res.y.round(6)[:{len(liquid_streams) * len(species)}], q]", 3)
+                scipy_model_code.add(f"return [res.x{rounding}, res.y{rounding}[:{len(liquid_streams) * len(species)}], q]", 3)
             else:
-                scipy_model_code.add(f"return [res.t.round(6), res.y.round(6), q]", 3)
+                scipy_model_code.add(f"return [res.t{rounding}, res.y{rounding}, q]", 3)
         if self.model_context["description"]["accumulation"] == "Batch":
             differential_upper_limit = self.entity["law"][accumulation_law]["differential_upper_limit"]
             differential_upper_limit_symbol = MMLExpression(self.entity["model_variable"][differential_upper_limit]['symbol']).to_numpy().strip()
-            scipy_model_code.add(f"{differential_model_variable_symbol}_eval = np.linspace(0, {differential_upper_limit_symbol}, 201, dtype=np.float64)", 1)
-            scipy_model_code.add(f"res = solve_ivp(derivative, (0, {differential_upper_limit_symbol}), c_0.reshape(-1, ), t_eval={differential_model_variable_symbol}_eval, method='LSODA', atol=1e-12)", 1)
+            scipy_model_code.add(f"if outlet:", 1)
+            scipy_model_code.add(f"res = solve_ivp(derivative, (0, {differential_upper_limit_symbol}), c_0.reshape(-1, ), method='{solver['method']}', rtol={solver['rtol']}, atol={solver['atol']})", 2)
+            scipy_model_code.add(f"if res.success and not np.isnan(res.y[:, -1]).any():", 2)
+            scipy_model_code.add(f"return [res.t[-1] / 60, res.y[:, -1], np.array([1, ])]", 3)
+            scipy_model_code.add(f"return None", 2)
+            if solver["adaptive"]:
+                scipy_model_code.add(f"res = solve_ivp(derivative, (0, {differential_upper_limit_symbol}), c_0.reshape(-1, ), method='{solver['method']}', rtol={solver['rtol']}, atol={solver['atol']}, dense_output=True)", 1)
+                scipy_model_code.add(f"if res.success:", 1)
+                scipy_model_code.add(f"res.t = adaptive_output_grid(res.t, res.y, {solver['n_eval']})", 2)
+                scipy_model_code.add(f"res.y = res.sol(res.t)", 2)
+            else:
+                scipy_model_code.add(f"{differential_model_variable_symbol}_eval = np.linspace(0, {differential_upper_limit_symbol}, {solver['n_eval']}, dtype=np.float64)", 1)
+                scipy_model_code.add(f"res = solve_ivp(derivative, (0, {differential_upper_limit_symbol}), c_0.reshape(-1, ), t_eval={differential_model_variable_symbol}_eval, method='{solver['method']}', rtol={solver['rtol']}, atol={solver['atol']})", 1)
             scipy_model_code.add(f"if res.success:", 1)
             scipy_model_code.add(f"if np.isnan(res.y).any():", 2)
             scipy_model_code.add(f"return None", 3)
             scipy_model_code.add(f"else:", 2)
-            scipy_model_code.add(f"return [(res.t / 60).round(6), res.y.round(6), np.array([1, ])]", 3)
+            scipy_model_code.add(f"return [(res.t / 60){rounding}, res.y{rounding}, np.array([1, ])]", 3)
         if self.model_context["description"]["accumulation"] == "CSTR":
             scipy_model_code.add(f"res = fsolve(conversion, (c_0 / 2).reshape(-1, ))", 1)
+            scipy_model_code.add(f"if outlet:", 1)
+            scipy_model_code.add(f"return None if np.isnan(res).any() else [V * 1e6, res, q]", 2)
             scipy_model_code.add(f"if not np.isnan(res).any():", 1)
-            scipy_model_code.add(f"return [[0, V * 1e6], np.concatenate((c_0.round(6).reshape(-1, 1), res.round(6).reshape(-1, 1)), axis=1), q]", 2)        
+            scipy_model_code.add(f"return [[0, V * 1e6], np.concatenate((c_0{rounding}.reshape(-1, 1), res{rounding}.reshape(-1, 1)), axis=1), q]", 2)        
         scipy_model_code.add(f"else:", 1)
         scipy_model_code.add(f"return None", 2)
+        if layout:
+            # keys unused by the model are written to a trailing scratch slot, as unknown dict keys are ignored
+            theta_index = [len(parameter_value_keys) if i is None else i for i in self.parameter_index(theta_keys or [])]
+            operating_index = [len(parameter_value_keys) if i is None else i for i in self.parameter_index(operating_keys or [])]
+            scipy_model_code.add("", 0)
+            scipy_model_code.add("parameter_vector = np.array([np.nan if v is None else v for v in parameter_value_dict.values()] + [np.nan], dtype=np.float64)", 0)
+            scipy_model_code.add(f"theta_index = np.array({theta_index}, dtype=np.intp)", 0)
+            scipy_model_code.add(f"operating_index = np.array({operating_index}, dtype=np.intp)", 0)
+            scipy_model_code.add("", 0)
+            scipy_model_code.add("def simulate(theta, operating, outlet=False):", 0)
+            scipy_model_code.add("p = parameter_vector.copy()", 1)
+            scipy_model_code.add("p[theta_index] = theta", 1)
+            scipy_model_code.add("p[operating_index] = operating", 1)
+            scipy_model_code.add("return simulation_vector(p, outlet)", 1)
+            scipy_model_code.add("", 0)
+            scipy_model_code.add("def simulation(parameter_value_dict, outlet=False):", 0)
+            scipy_model_code.add("return simulation_vector(list(parameter_value_dict.values()), outlet)", 1)
+        if any("solve_implicit(" in c for c in scipy_model_code.codes):
+            implicit_code = ScipyModelCode()
+            implicit_code.add_implicit_solver()
+            scipy_model_code.codes[lib_position:lib_position] = implicit_code.codes
         return scipy_model_code.get_model()
     
 
     def to_pyomo_model(self):
+        self.translate_entity()
         pyomo_model_code = PyomoModelCode()
         # pyomo_model_code.add_header(self.model_context)
         pyomo_model_code.add_lib()
@@ -1285,6 +1841,7 @@ class ModelAgent:
             str: converted julia model
         """
 
+        self.translate_entity()
         julia_model_code = JuliaModelCode()
         # julia_model_code.add_header(self.model_context)
         julia_model_code.add_lib()
@@ -14,6 +14,8 @@ class ModelCalibrationAgent:
     Possible calibration parameters included in the input data:
         - molecular transport-related parameters
         - reaction kinetics-related parameters
+
+    Optional `solver` settings of the request override `SCIPY_SOLVER_OPTIONS` of the generated model.
     """
 
     def __init__(self, entity, model_calibration_request):
@@ -27,17 +29,22 @@ class ModelCalibrationAgent:
             - `calibration_parameters`: boundary function for solving
             - `data`: represents input operating parameters
         """
-        exec(self.model_agent.to_scipy_model())
-        local_simulation = locals()["simulation"]
-        local_parameter_value_dict = locals()["parameter_value_dict"]
+        scipy_model = {}
+        exec(self.model_agent.to_scipy_model(vectorized=True, solver=self.model_calibration_request.get("solver")), scipy_model)
+        local_simulation = scipy_model["simulation"]
+        local_parameter_value_dict = scipy_model["parameter_value_dict"]
         parameter_key = []
         parameter_bounds = []
+        fixed_parameter_key = []
+        fixed_parameter_value = []
         for key, init_value, min_value, max_value in zip(self.model_calibration_request["parameter"]["key"], 
                                                          self.model_calibration_request["parameter"]["init"],
                                                          self.model_calibration_request["parameter"]["min"],
                                                          self.model_calibration_request["parameter"]["max"]):
             if init_value == min_value and min_value == max_value:
                 local_parameter_value_dict[tuple(key)] = init_value
+                fixed_parameter_key.append(key)
+                fixed_parameter_value.append(init_value)
             else:
                 parameter_key.append(key)
                 parameter_bounds.append((min_value, max_value))
@@ -49,28 +56,32 @@ class ModelCalibrationAgent:
         reals = np.array([[v if isinstance(v, (float, int)) else np.nan for v in record[-len(species):]] 
                             for record in self.model_calibration_request["data"]["value"]], dtype=np.float64)
         atol = 0.1 * reals[~np.isnan(reals)].min()
+        # operating columns of data records, the outlet columns are not model parameters
+        operating_columns = [i for i, index in enumerate(self.model_agent.parameter_index(self.model_calibration_request["data"]["key"])) if index is not None]
+        operating_key = [self.model_calibration_request["data"]["key"][i] for i in operating_columns]
+        operating_value = np.array([[record[i] for i in operating_columns] for record in self.model_calibration_request["data"]["value"]], dtype=np.float64)
         
         calibration_code = ScipyModelCode()
         calibration_code.codes.append("import os")
         calibration_code.codes.append("import pickle")
         calibration_code.codes.append("from scipy.optimize import differential_evolution")
-        calibration_code.codes.extend(self.model_agent.to_scipy_model().split("\n"))
+        # the calibration script evaluates the right-hand side for every candidate and condition, so shared subexpressions pay off
+        calibration_code.codes.extend(self.model_agent.to_scipy_model(vectorized=True, theta_keys=parameter_key, operating_keys=operating_key,
+                                                                          solver=self.model_calibration_request.get("solver"), cse=True).split("\n"))
         calibration_code.add("", 0)
-        calibration_code.add(f"parameter_key = {parameter_key}", 0)
-        calibration_code.add(f"data_key = {self.model_calibration_request['data']['key']}", 0)
-        calibration_code.add(f"data_value = {self.model_calibration_request['data']['value']}", 0)
+        if fixed_parameter_key:
+            fixed_parameter_index = [i for i in self.model_agent.parameter_index(fixed_parameter_key) if i is not None]
+            fixed_parameter_value = [v for i, v in zip(self.model_agent.parameter_index(fixed_parameter_key), fixed_parameter_value) if i is not None]
+            calibration_code.add(f"parameter_vector[{fixed_parameter_index}] = {fixed_parameter_value}", 0)
+        calibration_code.add(f"operating_value = np.array({str(operating_value.tolist()).replace('nan', 'np.nan')}, dtype=np.float64)", 0)
         calibration_code.add(f"reals = np.array({str(reals.tolist()).replace('nan', 'np.nan')}, dtype=np.float64)", 0)
         calibration_code.add([
             "def calc_mse(p):",
-            "    for k, v in zip(parameter_key, p):",
-            "        parameter_value_dict[tuple(k)] = v",
             "    preds = []",
-            "    for value in data_value:",
-            "        for k, v in zip(data_key, value):",
-            "            parameter_value_dict[tuple(k)] = v",
-            "        res = simulation(parameter_value_dict)",
+            "    for operating in operating_value:",
+            f"        res = simulate(p[:{len(parameter_key)}], operating, outlet=True)",
             "        if res:",
-            f"            average = (res[1].reshape({len(streams)}, {len(species)}, -1) * res[2].reshape(-1, 1, 1)).sum(axis=0)[:, -1] / res[2].sum()",
+            f"            average = (res[1].reshape({len(streams)}, {len(species)}) * res[2].reshape(-1, 1)).sum(axis=0) / res[2].sum()",
             "        else:",
             f"            average = np.array([np.nan] * {len(species)})",
             "        preds.append(average)",
@@ -115,6 +126,7 @@ class ModelCalibrationAgent:
             response = {
                 "parameter": {"key": parameter_key, "value": res.x.tolist()},
                 "rmse": res.fun.item() ** 0.5,
+                "common_subexpressions": self.model_agent.common_subexpressions,
             }
             for k, v in zip(parameter_key, res.x.tolist()):
                 local_parameter_value_dict[tuple(k)] = v
@@ -1,9 +1,26 @@
 import re
+import threading
+
+import openai
 from openai import OpenAI
 
+from .http_client import HttpClient
+
+
+# host of the OpenAI API
+OPENAI_HOST = "api.openai.com"
+# maximum number of OpenAI clients kept, one per API key
+OPENAI_CLIENTS = 64
+
 
 class ModelChatGPTAgent:
-    """Model chatgpt agent for language querying using OpenAI API with preloaded knowledge graph."""
+    """Model chatgpt agent for language querying using OpenAI API with preloaded knowledge graph.
+
+    One OpenAI client is kept per API key, so that its connections are reused across requests, and completions
+    are requested through `HttpClient.call` within the limits, retries and metrics of the OpenAI host.
+    """
+    clients = {}
+    lock = threading.Lock()
 
     def __init__(self, entity, model_chatgpt_request):
         self.entity = entity
@@ -63,15 +80,29 @@ class ModelChatGPTAgent:
         print("\n".join(phenomenon_context + formula_context))
         return "\n".join(phenomenon_context + formula_context)
 
+    @staticmethod
+    def get_client(api_key):
+        with ModelChatGPTAgent.lock:
+            if api_key not in ModelChatGPTAgent.clients:
+                if len(ModelChatGPTAgent.clients) >= OPENAI_CLIENTS:
+                    ModelChatGPTAgent.clients.clear()
+                # retried by `HttpClient.call` instead of the client
+                ModelChatGPTAgent.clients[api_key] = OpenAI(api_key=api_key, timeout=HttpClient.timeout, max_retries=0)
+            return ModelChatGPTAgent.clients[api_key]
+
     def query(self):
         context = self.context()
-        client = OpenAI(api_key=self.model_chatgpt_request["api_key"])
+        client = ModelChatGPTAgent.get_client(self.model_chatgpt_request["api_key"])
         content = "Known:\n" + context + "\n" + \
             "Reaction kinetics phenomena can be combined to describe a single reaction.\n" + \
             "Usually do not consider **Instantenous** phenomenon.\n" + \
             "Answer in short length.\n" + \
             self.model_chatgpt_request["query"]
-        chat_completion = client.chat.completions.create(messages=[{"role": "user", "content": content}], model="gpt-4o",)
+        chat_completion = HttpClient.call(
+            OPENAI_HOST,
+            lambda: client.chat.completions.create(messages=[{"role": "user", "content": content}], model="gpt-4o",),
+            (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError),
+        )
         answer = chat_completion.choices[0].message.content
         response = {"answer": answer}
         return response
@@ -4,8 +4,17 @@ import multiprocessing
 from .model_calibration_agent import ModelCalibrationAgent
 
 
-def _calibration_scipy(model_calibration_agent):
-    return model_calibration_agent.calibration_scipy()
+# entity of the calibration workers, sent once per worker by `_init_worker` instead of once per task
+_worker_entity = None
+
+
+def _init_worker(entity):
+    global _worker_entity
+    _worker_entity = entity
+
+
+def _calibration_scipy(model_calibration_request):
+    return ModelCalibrationAgent(_worker_entity, model_calibration_request).calibration_scipy()
 
 
 class ModelExplorationAgent:
@@ -28,7 +37,7 @@ class ModelExplorationAgent:
         """
         flow_pattern_phenomena = self.model_exploration_request["model_context"]["description"]["flow_pattern"]
         all_molecular_transport_phenomena = self.model_exploration_request["model_context"]["description"]["molecular_transport"]
-        model_calibration_agents = []
+        model_calibration_requests = []
         model_contexts = []
         cand_molecular_transport_phenomena = []
         for i in range(len(all_molecular_transport_phenomena) + 1):
@@ -119,19 +128,20 @@ class ModelExplorationAgent:
                         "parameter": calibration_parameter,
                         "model_type": self.model_exploration_request["model_type"],
                         "model_context": calibration_model_context,
+                        "solver": self.model_exploration_request.get("solver"),
                     }
                     model_contexts.append(calibration_model_context)
-                    model_calibration_agents.append(ModelCalibrationAgent(self.entity, model_calibration_request))
+                    model_calibration_requests.append(model_calibration_request)
 
         # FOR MULTIPROCESSING
-        pool = multiprocessing.Pool(8)
-        model_calibration_results = pool.map(_calibration_scipy, model_calibration_agents)
+        pool = multiprocessing.Pool(8, initializer=_init_worker, initargs=(self.entity, ))
+        model_calibration_results = pool.map(_calibration_scipy, model_calibration_requests)
         pool.close()
 
         # FOR SINGLE PROCESSING
         # model_calibration_results = []
-        # for model_calibration_agent in model_calibration_agents:
-        #     model_calibration_results.append(model_calibration_agent.calibration_scipy())
+        # for model_calibration_request in model_calibration_requests:
+        #     model_calibration_results.append(ModelCalibrationAgent(self.entity, model_calibration_request).calibration_scipy())
         
         return {
             "model_contexts": model_contexts,
@@ -11,6 +11,9 @@ class ModelSimulationAgent:
         - temperature
         - flow rate
         - initial concentration
+
+    Optional `solver` settings of the request override `SCIPY_SOLVER_OPTIONS` of the generated model.
+    Parameter values and the operating values of data records must be numbers, otherwise `ValueError` is raised.
     """
 
     def __init__(self, entity, model_simulation_request):
@@ -18,28 +21,57 @@ class ModelSimulationAgent:
         self.model_simulation_request = model_simulation_request
         self.model_agent = ModelAgent(entity, model_simulation_request["model_context"])
 
+    @staticmethod
+    def to_vector(values, size, name):
+        """Convert values of the request to a float vector.
+
+        Args:
+            values (list): values of the request
+            size (int): expected number of values
+            name (str): name of the values in error messages
+
+        Returns:
+            np.ndarray: values as float vector
+
+        Raises:
+            ValueError: if the values are not a list of `size` numbers
+        """
+        if not isinstance(values, list) or len(values) != size:
+            raise ValueError(f"Expected {size} values of {name}, got: {values}")
+        if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+            raise ValueError(f"Non-numeric values of {name}: {values}")
+        return np.array(values, dtype=np.float64)
+
     def simulate_scipy(self):
         """Generate and run simulation for data.
             - `scipy_model`: includes`parameter_value_dict`, `derivative`, `boundary` and `simulation`
             - `boundary`: boundary function for solving
             - `data`: represents input operating parameters
         """
-        exec(self.model_agent.to_scipy_model())
-        local_simulation = locals()["simulation"]
-        local_parameter_value_dict = locals()["parameter_value_dict"]
-        for k, v in zip(self.model_simulation_request["parameter"]["key"], self.model_simulation_request["parameter"]["value"]):
-            local_parameter_value_dict[tuple(k)] = v
+        # operating columns of data records, other columns are not model parameters
+        operating_columns = [i for i, index in enumerate(self.model_agent.parameter_index(self.model_simulation_request["data"]["key"])) if index is not None]
+        operating_key = [self.model_simulation_request["data"]["key"][i] for i in operating_columns]
+        # values from front end, checked before the model is generated
+        theta = self.to_vector(self.model_simulation_request["parameter"]["value"], len(self.model_simulation_request["parameter"]["key"]), "parameter")
+        operatings = []
+        for data in self.model_simulation_request["data"]["value"]:
+            if not isinstance(data, list) or len(data) != len(self.model_simulation_request["data"]["key"]):
+                raise ValueError(f"Expected {len(self.model_simulation_request['data']['key'])} values of data record, got: {data}")
+            operatings.append(self.to_vector([data[i] for i in operating_columns], len(operating_columns), "operating parameters"))
+        scipy_model = {}
+        exec(self.model_agent.to_scipy_model(vectorized=True,
+                                             theta_keys=self.model_simulation_request["parameter"]["key"],
+                                             operating_keys=operating_key,
+                                             solver=self.model_simulation_request.get("solver")), scipy_model)
+        local_simulate = scipy_model["simulate"]
 
         results = []
         streams = [s for s in self.model_agent.model_context["basic"]["streams"] 
                    if self.model_agent.model_context["information"]["streams"][s]["state"] == "liquid"]
         species = self.model_agent.model_context["basic"]["species"]
-        for data in self.model_simulation_request["data"]["value"]:
+        for operating in operatings:
             result = []
-            # parameter setting from front end, without checking
-            for k, v in zip(self.model_simulation_request["data"]["key"], data):
-                local_parameter_value_dict[tuple(k)] = v
-            res = local_simulation(local_parameter_value_dict)
+            res = local_simulate(theta, operating)
             if res:
                 for i, s in enumerate(streams):
                     for j, sp in enumerate(species):
@@ -1,8 +1,16 @@
-import re
+import html
 
-import pubchempy as pcp
+import lxml.html
 import requests
-from bs4 import BeautifulSoup
+
+from .compound_cache import CompoundCache
+from .http_client import HttpClient
+from .property_cache import PropertyCache
+from .property_database import PropertyDatabase
+
+
+# tags without closing tag in the rendered values of Wikipedia
+WIKIPEDIA_VOID_TAGS = ["br", "hr", "img", "wbr"]
 
 
 class PhysicalPropertyAgent():
@@ -10,6 +18,12 @@ class PhysicalPropertyAgent():
     - PubChem: https://pubchem.ncbi.nlm.nih.gov
     - ChemSpider: http://www.chemspider.com
     - Wikipedia: https://en.wikipedia.org
+
+    Compounds, and then their pages, are fetched concurrently through the shared `HttpClient`, each page once per query.
+    Compounds and results are first looked up in the local `PropertyDatabase`, the sources are only queried for the
+    others. Results are cached by `PropertyCache`, only compounds without cached results are fetched, see `query_cached`.
+    Only properties absent from pages of a success status are cached as missing; compounds whose pages fail to load,
+    answer an error status or an unexpected body are left out of the results, and fetched again by the next query.
     """
 
     def __init__(self, entity):
@@ -18,50 +32,140 @@ class PhysicalPropertyAgent():
         self.chemspider_search_url = entity["data_source"]["ChemSpider"]["url"].split("|")[1]
         self.chemspider_url = entity["data_source"]["ChemSpider"]["url"].split("|")[0]
         self.wikipedia_url = entity["data_source"]["Wikipedia"]["url"]
+
+
+    def get_compounds(self, names):
+        """Compounds of names from the database or the cache, others resolved concurrently, names without compound are left out."""
+        compounds = {}
+        for name in names:
+            compound = PropertyDatabase.get_compound(name)
+            if compound is None:
+                cached, compound = CompoundCache.lookup(name, "name")
+                compound = compound if cached else False
+            compounds[name] = compound
+        unresolved = [name for name, compound in compounds.items() if compound is False]
+        compounds.update(zip(unresolved, HttpClient.map(CompoundCache.get_compound, unresolved)))
+        return {name: compounds[name] for name in names if compounds[name]}
     
 
-    def query_pubchem(self, names, properties):
+    def query_cached(self, source, fetch, names, properties):
+        """Query properties of names from `PropertyDatabase` or `PropertyCache`, fetching compounds without results by `fetch`.
+
+        Stale results are served, and their compounds are refetched in the background.
+
+        Args:
+            source (str): data source of the results
+            fetch (callable): `fetch(compounds, properties)` returning `{cid: {property: result}}` of the compounds
+                fetched successfully, failed compounds and properties are left out and not stored
+            names (list of str): names of compounds
+            properties (list of str): properties to query
+
+        Returns:
+            dict: `canonical_smiles` and `property` results of each name, properties without result are left out
+        """
         property_res = {name: {} for name in names}
-        for name in names:
-            compound = pcp.get_compounds(name, namespace="name")
-            if not compound: continue
-            compound = compound[0]
-            property_res[name]["canonical_smiles"] = compound.canonical_smiles
-            property_res[name]["property"] = {}
+        compounds = self.get_compounds(names)
+        results = {}
+        missing_compounds = {}
+        stale_compounds = {}
+        for name, compound in compounds.items():
             for property in properties:
-                pubchem_url = self.pubchem_url.replace("{cid}", str(compound.cid)).replace("{property}", property)
-                pubchem_res = requests.get(pubchem_url).json()["Record"]["Section"][0]["Section"][0]["Section"][0]
-                property_res[name]["property"][property] = [{
+                found, result = PropertyDatabase.get_property(source, compound["cid"], property)
+                if found:
+                    results[(compound["cid"], property)] = result
+                    continue
+                result, freshness = PropertyCache.get(source, compound["cid"], property)
+                if freshness is None:
+                    missing_compounds[name] = compound
+                if freshness == "stale":
+                    stale_compounds[name] = compound
+                results[(compound["cid"], property)] = result
+        if missing_compounds:
+            for cid, cid_results in fetch(missing_compounds, properties).items():
+                for property, result in cid_results.items():
+                    PropertyCache.store(source, cid, property, result)
+                    results[(cid, property)] = result
+        # compounds with a missing property were just fetched with all properties
+        stale_compounds = {name: compound for name, compound in stale_compounds.items() if name not in missing_compounds}
+        if stale_compounds:
+            PropertyCache.revalidate(source, [compound["cid"] for compound in stale_compounds.values()], lambda cids: fetch(
+                {name: compound for name, compound in stale_compounds.items() if compound["cid"] in cids}, properties))
+        for name, compound in compounds.items():
+            property_res[name]["canonical_smiles"] = compound["canonical_smiles"]
+            property_res[name]["property"] = {property: results[(compound["cid"], property)] for property in properties
+                                              if results[(compound["cid"], property)] is not None}
+        return property_res
+    
+
+    def query_pubchem(self, names, properties):
+        return self.query_cached("pubchem", self.fetch_pubchem, names, properties)
+    
+
+    def fetch_pubchem(self, compounds, properties):
+        property_res = {}
+        pubchem_urls = {(name, property): self.pubchem_url.replace("{cid}", str(compound["cid"])).replace("{property}", property)
+                        for name, compound in compounds.items() for property in properties}
+        pubchem_responses = self.fetch_pages(pubchem_urls.values())
+        for name, compound in compounds.items():
+            cid_res = {}
+            for property in properties:
+                if pubchem_urls[(name, property)] not in pubchem_responses: continue
+                try:
+                    pubchem_res = pubchem_responses[pubchem_urls[(name, property)]].json()["Record"]["Section"][0]["Section"][0]["Section"][0]
+                    information = pubchem_res["Information"]
+                except (ValueError, KeyError, IndexError):
+                    continue
+                cid_res[property] = [{
                     "reference": res["Reference"][0],
                     "value": res["Value"]["StringWithMarkup"][0]["String"].replace(r"\u00b0", "&deg;"),
-                } for res in pubchem_res["Information"] 
+                } for res in information 
                 if "Reference" in res and "Value" in res and "StringWithMarkup" in res["Value"] and "Markup" not in res["Value"]["StringWithMarkup"][0]]
+            if cid_res:
+                property_res[compound["cid"]] = cid_res
         return property_res
     
 
     def query_chemspider(self, names, properties):
-        property_res = {name: {} for name in names}
-        for name in names:
-            compound = pcp.get_compounds(name, namespace="name")
-            if not compound: continue
-            compound = compound[0]
-            property_res[name]["canonical_smiles"] = compound.canonical_smiles
-            property_res[name]["property"] = {}
-            chemspider_id = requests.get(
-                self.chemspider_search_url.replace("{name}", name), 
-                headers={"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"}
-            ).json()["Records"][0]["ChemSpiderId"]
+        return self.query_cached("chemspider", self.fetch_chemspider, names, properties)
+    
+
+    def fetch_chemspider(self, compounds, properties):
+        property_res = {}
+        headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"}
+        search_urls = {name: self.chemspider_search_url.replace("{name}", name) for name in compounds}
+        search_responses = self.fetch_pages(search_urls.values(), headers)
+        chemspider_urls = {}
+        for name, compound in compounds.items():
+            if search_urls[name] not in search_responses: continue
+            try:
+                records = search_responses[search_urls[name]].json()["Records"]
+                chemspider_id = records[0]["ChemSpiderId"] if records else None
+            except (ValueError, KeyError, IndexError):
+                continue
+            if chemspider_id is None:
+                # compounds not found by the search have none of the properties
+                property_res[compound["cid"]] = {property: None for property in properties}
+                continue
+            chemspider_urls[name] = self.chemspider_url.replace("{cid}", str(chemspider_id))
+        chemspider_responses = self.fetch_pages(chemspider_urls.values(), headers)
+        for name, compound in compounds.items():
+            if chemspider_urls.get(name) not in chemspider_responses: continue
+            try:
+                chemspider_res = chemspider_responses[chemspider_urls[name]].json()
+            except ValueError:
+                continue
+            if not isinstance(chemspider_res, dict): continue
+            property_res[compound["cid"]] = {}
             for property in properties:
-                chemspider_res = requests.get(
-                    self.chemspider_url.replace("{cid}", str(chemspider_id)), 
-                    headers={"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"}
-                ).json()
                 datasource_names = []
-                property_res[name]["property"][property] = []
+                if not isinstance(chemspider_res.get(property + "Properties"), list):
+                    property_res[compound["cid"]][property] = None
+                    continue
+                property_res[compound["cid"]][property] = []
                 for res in chemspider_res[property + "Properties"]:
                     if "DatasourceName" in res and "ExternalUrl" in res and "LowValue" in res and "Unit" in res and \
                         res["DatasourceName"] in ["Sigma-Aldrich"] and res["DatasourceName"] not in datasource_names:
-                        property_res[name]["property"][property].append({
+                        property_res[compound["cid"]][property].append({
                             "reference": res["DatasourceName"] + " " + res["ExternalUrl"],
                             "value": str(res["LowValue"]) + " " + res["Unit"],
                         })
@@ -70,69 +174,117 @@ class PhysicalPropertyAgent():
     
 
     def query_wikipedia(self, names, properties):
-        property_res = {name: {} for name in names}
-        for name in names:
-            compound = pcp.get_compounds(name, namespace="name")
-            if not compound: continue
-            compound = compound[0]
-            property_res[name]["canonical_smiles"] = compound.canonical_smiles
-            property_res[name]["property"] = {}
-            headers = {'User-Agent': 'CoolBot/0.0 (https://example.org/coolbot/; coolbot@example.org)'}
-            soup = BeautifulSoup(requests.get(self.wikipedia_url.replace("{name}", name), headers=headers).text, features="lxml")
-            trs = [tr for tr in soup.find_all("tr") if len(tr.find_all("td", recursive=False)) == 2]
-            wikipedia_res = {}
-            for tr in trs:
-                parameter_dict = []
-                if tr.select("td")[1].find("ul"):
-                    for li in tr.select("td")[1].find_all("li")[:3]:
-                        if ":" in li.text: continue
-                        value = repr(li).strip().replace("\xa0", " ")
-                        for sup in li.findChildren("sup" , recursive=False):
-                            if sup.find("a"):
-                                value = value.replace(repr(sup), "")
-                        value = re.sub(r"<li[^<>]*>", "", value)
-                        value = re.sub(r"</li>", "", value)
-                        value = re.sub(r"<span[^<>]*>", "", value)
-                        value = re.sub(r"</span>", "", value)
-                        value = re.sub(r"<a[^<>]*>", "", value)
-                        value = re.sub(r"</a>", "", value)
-                        value = re.sub(r"<sup[^<>]*>[ \n]*</sup>", "", value)
-                        value = value.strip()
-                        if li.find("a"):
-                            if li.find("a").attrs["href"].startswith("/"):
-                                reference = ""
-                            elif li.find("a").attrs["href"].startswith("#"):
-                                reference = soup.find(id=li.find("a").attrs["href"][1:]).select("span")[1].text
-                            else:
-                                reference = li.find("a").attrs["href"]
-                        else:
-                            reference = ""
-                        parameter_dict.append({"value": value, "reference": reference})
-                else:
-                    value = repr(tr.select("td")[1]).strip().replace("\xa0", " ")
-                    for sup in tr.select("td")[1].findChildren("sup" , recursive=False):
-                        if sup.find("a"):
-                            value = value.replace(repr(sup), "")
-                    value = re.sub(r"<td[^<>]*>", "", value)
-                    value = re.sub(r"</td>", "", value)
-                    value = re.sub(r"<span[^<>]*>", "", value)
-                    value = re.sub(r"</span>", "", value)
-                    value = re.sub(r"<a[^<>]*>", "", value)
-                    value = re.sub(r"</a>", "", value)
-                    value = re.sub(r"<sup[^<>]*>[ \n]*</sup>", "", value)
-                    value = value.strip()
-                    if tr.select("td")[1].find("a"):
-                        if tr.select("td")[1].find("a").attrs["href"].startswith("/"):
-                            reference = ""
-                        elif tr.select("td")[1].find("a").attrs["href"].startswith("#"):
-                            reference = soup.find(id=tr.select("td")[1].find("a").attrs["href"][1:]).select("span")[1].text
-                        else:
-                            reference = tr.select("td")[1].find("a").attrs["href"]
-                    else:
-                        reference = ""
-                    parameter_dict.append({"value": value, "reference": reference})
-                wikipedia_res[tr.select("td")[0].text.strip().replace("\xa0", " ")] = parameter_dict
-            for property in properties:
-                if property in wikipedia_res:
-                    property_res[name]["property"][property] = wikipedia_res[property]
+        return self.query_cached("wikipedia", self.fetch_wikipedia, names, properties)
+    
+
+    def fetch_wikipedia(self, compounds, properties):
+        property_res = {}
+        headers = {'User-Agent': 'CoolBot/0.0 (https://example.org/coolbot/; coolbot@example.org)'}
+        wikipedia_urls = {name: self.wikipedia_url.replace("{name}", name) for name in compounds}
+        wikipedia_responses = self.fetch_pages(wikipedia_urls.values(), headers)
+        for name, compound in compounds.items():
+            if wikipedia_urls[name] not in wikipedia_responses: continue
+            wikipedia_res = self.parse_wikipedia(wikipedia_responses[wikipedia_urls[name]].text, properties)
+            # properties missing from a page of success status are cached as None
+            property_res[compound["cid"]] = {property: wikipedia_res.get(property) for property in properties}
         return property_res
+
+
+    @staticmethod
+    def fetch_pages(urls, headers=None):
+        """Pages of URLs fetched concurrently through `HttpClient`, each unique URL once.
+
+        Args:
+            urls (list of str): URLs to fetch, possibly repeated
+            headers (dict): request headers of all URLs
+
+        Returns:
+            dict: responses of a success status keyed by URL, URLs failing to load or answering an error status are left out
+        """
+        def fetch_page(url):
+            try:
+                response = HttpClient.get(url, headers)
+                response.raise_for_status()
+                return response
+            except requests.RequestException:
+                return None
+        urls = list(dict.fromkeys(urls))
+        return {url: response for url, response in zip(urls, HttpClient.map(fetch_page, urls)) if response is not None}
+
+
+    @staticmethod
+    def parse_wikipedia(text, properties):
+        """Values and references of properties from the chembox of a Wikipedia page.
+
+        Rows of two cells are located by XPath and only those labelled by a requested property are rendered,
+        the last row of a property wins. The value cell is rendered as HTML without `span` and `a` tags and without
+        reference `sup` tags, a cell with a list gives its first three items without `:`.
+
+        Args:
+            text (str): HTML of the page
+            properties (list of str): labels of the rows, e.g. `Density`
+
+        Returns:
+            dict: list of `value` and `reference` of each property found on the page
+        """
+        wikipedia_res = {}
+        if not text.strip():
+            return wikipedia_res
+        root = lxml.html.fromstring(text)
+        for tr in root.xpath("//tr[count(td) = 2]"):
+            tds = tr.xpath(".//td")
+            property = tds[0].text_content().strip().replace("\xa0", " ")
+            if property not in properties:
+                continue
+            items = tds[1].xpath(".//li")[:3] if tds[1].xpath(".//ul") else [tds[1]]
+            wikipedia_res[property] = [{
+                "value": PhysicalPropertyAgent.render_wikipedia_value(item),
+                "reference": PhysicalPropertyAgent.get_wikipedia_reference(root, item),
+            } for item in items if item.tag == "td" or ":" not in item.text_content()]
+        return wikipedia_res
+
+
+    @staticmethod
+    def render_wikipedia_value(elem, top=True):
+        """Inner HTML of a chembox cell or list item, see `parse_wikipedia`."""
+        value = html.escape(elem.text or "", quote=False)
+        for child in elem:
+            if not isinstance(child.tag, str):
+                value += lxml.html.tostring(child, encoding="unicode", with_tail=False)
+            elif child.tag == "sup" and top and child.xpath(".//a"):
+                pass
+            elif child.tag in ["span", "a"]:
+                value += PhysicalPropertyAgent.render_wikipedia_value(child, False)
+            else:
+                inner = PhysicalPropertyAgent.render_wikipedia_value(child, False)
+                attributes = "".join(f" {key}={PhysicalPropertyAgent.quote_wikipedia_attribute(' '.join(val.split()) if key == 'class' else val)}"
+                                     for key, val in sorted(child.attrib.items()))
+                if child.tag in WIKIPEDIA_VOID_TAGS:
+                    value += f"<{child.tag}{attributes}/>"
+                elif child.tag != "sup" or inner.strip(" \n"):
+                    value += f"<{child.tag}{attributes}>{inner}</{child.tag}>"
+            value += html.escape(child.tail or "", quote=False)
+        value = value.replace("\xa0", " ")
+        return value.strip() if top else value
+
+
+    @staticmethod
+    def quote_wikipedia_attribute(value):
+        """Quoted attribute value, in single quotes if it contains only double ones."""
+        value = html.escape(value, quote=False)
+        if '"' not in value:
+            return f'"{value}"'
+        if "'" not in value:
+            return f"'{value}'"
+        return '"' + value.replace('"', "&quot;") + '"'
+
+
+    @staticmethod
+    def get_wikipedia_reference(root, elem):
+        """Reference of a chembox cell or list item from its first link, footnotes are resolved to their text."""
+        links = elem.xpath(".//a")
+        if not links or links[0].attrib["href"].startswith("/"):
+            return ""
+        if links[0].attrib["href"].startswith("#"):
+            return root.xpath("//*[@id = $id]", id=links[0].attrib["href"][1:])[0].xpath(".//span")[1].text_content()
+        return links[0].attrib["href"]
@@ -0,0 +1,188 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+# default path of the property cache, outside of the read-only app directory of the container
+PROPERTY_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "kg4dt", "property_cache.sqlite")
+# seconds before a property result is revalidated, and after which it is not served while revalidating anymore
+PROPERTY_CACHE_TTL = 30 * 24 * 3600
+PROPERTY_CACHE_STALE_TTL = 365 * 24 * 3600
+# sources and properties queried by the physical property routes, prewarmed for the solvent catalogue
+PROPERTY_CACHE_PREWARM = {"pubchem": ["Density", "Viscosity"], "chemspider": ["Density"], "wikipedia": ["Density", "Viscosity"]}
+
+
+class PropertyCache:
+    """
+    Persistent cache of physical property results keyed by `(source, cid, property)`, shared by all requests.
+
+    Results are kept in SQLite and mirrored in memory, so that a lookup is a dictionary access. A result is fresh
+    for `ttl` seconds; afterwards it is stale and still served until `stale_ttl` seconds, while `revalidate` refetches
+    it in the background. Results of a property missing from the source are cached as None.
+
+    The cache is opened by `open`, lazily at `PROPERTY_CACHE_PATH` if not configured, see `cache_info` for hit and
+    miss counters. The solvents of the miscibility table are prewarmed by:
+        python -m app.utils.property_cache --prewarm app/data/solvent_miscibility_table.csv
+    """
+    connection = None
+    ttl = PROPERTY_CACHE_TTL
+    stale_ttl = PROPERTY_CACHE_STALE_TTL
+    lock = threading.RLock()
+    results = {}
+    revalidating = set()
+    counters = {"hits": 0, "stale_hits": 0, "misses": 0, "revalidations": 0}
+
+
+    @staticmethod
+    def open(path=PROPERTY_CACHE_PATH, ttl=PROPERTY_CACHE_TTL, stale_ttl=PROPERTY_CACHE_STALE_TTL):
+        """Open (or create) the SQLite cache and load its results in memory.
+
+        Args:
+            path (str): path of the SQLite database, or `:memory:`
+            ttl (float): seconds before a result is revalidated
+            stale_ttl (float): seconds before a result is not served anymore
+        """
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with PropertyCache.lock:
+            if PropertyCache.connection is not None:
+                PropertyCache.connection.close()
+            PropertyCache.connection = sqlite3.connect(path, check_same_thread=False)
+            PropertyCache.connection.execute(
+                "CREATE TABLE IF NOT EXISTS property ("
+                "source TEXT, cid INTEGER, property TEXT, result TEXT, updated REAL, PRIMARY KEY (source, cid, property))"
+            )
+            PropertyCache.connection.commit()
+            PropertyCache.ttl = ttl
+            PropertyCache.stale_ttl = stale_ttl
+            PropertyCache.results = {
+                (source, cid, property): (json.loads(result), updated)
+                for source, cid, property, result, updated in PropertyCache.connection.execute("SELECT * FROM property")
+            }
+
+
+    @staticmethod
+    def get(source, cid, property):
+        """Cached result of a property and its freshness.
+
+        Args:
+            source (str): data source, e.g. `pubchem`
+            cid (int): PubChem CID of the compound
+            property (str): property, e.g. `Density`
+
+        Returns:
+            tuple: result and `fresh`, `stale` or None if not cached (or expired)
+        """
+        if PropertyCache.connection is None:
+            PropertyCache.open()
+        entry = PropertyCache.results.get((source, cid, property))
+        age = time.time() - entry[1] if entry else None
+        with PropertyCache.lock:
+            if entry and age < PropertyCache.ttl:
+                PropertyCache.counters["hits"] += 1
+                return entry[0], "fresh"
+            if entry and age < PropertyCache.stale_ttl:
+                PropertyCache.counters["stale_hits"] += 1
+                return entry[0], "stale"
+            PropertyCache.counters["misses"] += 1
+        return None, None
+
+
+    @staticmethod
+    def store(source, cid, property, result):
+        updated = time.time()
+        with PropertyCache.lock:
+            if PropertyCache.connection is None:
+                PropertyCache.open()
+            PropertyCache.results[(source, cid, property)] = (result, updated)
+            PropertyCache.connection.execute(
+                "INSERT OR REPLACE INTO property VALUES (?, ?, ?, ?, ?)",
+                (source, cid, property, json.dumps(result, ensure_ascii=False), updated),
+            )
+            PropertyCache.connection.commit()
+
+
+    @staticmethod
+    def revalidate(source, cids, fetch):
+        """Refetch stale results of compounds in a background thread, at most once at a time per compound.
+
+        Args:
+            source (str): data source of the results
+            cids (list of int): PubChem CIDs of the compounds to refetch
+            fetch (callable): function returning `{cid: {property: result}}` of the compounds
+        """
+        with PropertyCache.lock:
+            cids = [cid for cid in cids if (source, cid) not in PropertyCache.revalidating]
+            PropertyCache.revalidating.update((source, cid) for cid in cids)
+        if not cids:
+            return
+
+        def refetch():
+            try:
+                for cid, results in fetch(cids).items():
+                    for property, result in results.items():
+                        PropertyCache.store(source, cid, property, result)
+                with PropertyCache.lock:
+                    PropertyCache.counters["revalidations"] += 1
+            finally:
+                with PropertyCache.lock:
+                    PropertyCache.revalidating.difference_update((source, cid) for cid in cids)
+        threading.Thread(target=refetch, daemon=True).start()
+
+
+    @staticmethod
+    def cache_info():
+        """Counters of the process and number of cached results.
+
+        Returns:
+            dict: `hits`, `stale_hits`, `misses`, `revalidations` and `size`
+        """
+        with PropertyCache.lock:
+            return {**PropertyCache.counters, "size": len(PropertyCache.results)}
+
+
+    @staticmethod
+    def cache_clear():
+        """Remove all cached results and reset the counters."""
+        with PropertyCache.lock:
+            if PropertyCache.connection is not None:
+                PropertyCache.connection.execute("DELETE FROM property")
+                PropertyCache.connection.commit()
+            PropertyCache.results = {}
+            PropertyCache.counters.update({"hits": 0, "stale_hits": 0, "misses": 0, "revalidations": 0})
+
+
+if __name__ == "__main__":
+    from app.config import Config
+    from app.utils.compound_cache import CompoundCache
+    from app.utils.graphdb_handler import GraphdbHandler
+    from app.utils.physical_property_agent import PhysicalPropertyAgent
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--path", default=Config.PROPERTY_CACHE, help="Path of the SQLite property cache")
+    parser.add_argument("--prewarm", help="Path of a CSV file whose header lists the solvents to prewarm")
+    args = parser.parse_args()
+
+    CompoundCache.open(Config.COMPOUND_CACHE, Config.COMPOUND_CACHE_TTL)
+    PropertyCache.open(args.path, Config.PROPERTY_CACHE_TTL, Config.PROPERTY_CACHE_STALE_TTL)
+    if args.prewarm:
+        with open(args.prewarm, encoding="utf-8-sig") as f:
+            solvents = [solvent.strip() for solvent in f.readline().split(",")[1:]]
+        graphdb_handler = GraphdbHandler(Config)
+        physical_property_agent = PhysicalPropertyAgent(graphdb_handler.query())
+        graphdb_handler.close()
+        for source, properties in PROPERTY_CACHE_PREWARM.items():
+            start = time.perf_counter()
+            prewarmed = 0
+            # one solvent at a time, so that a solvent unknown to a source does not fail the others
+            for solvent in solvents:
+                try:
+                    getattr(physical_property_agent, f"query_{source}")([solvent], properties)
+                    prewarmed += 1
+                except Exception as e:
+                    print(f"Skipping {solvent} on {source} ({type(e).__name__}: {e})")
+            print(f"Prewarmed {source} for {prewarmed} of {len(solvents)} solvents in {time.perf_counter() - start:.1f} s")
+    print(PropertyCache.cache_info())
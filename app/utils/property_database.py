@@ -0,0 +1,261 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+
+from .compound_cache import CompoundCache
+
+
+# default path of the property database, next to the solvent miscibility table
+PROPERTY_DATABASE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "property_database.sqlite")
+# sources and properties of the physical property routes, fetched into the database by `--fetch`
+PROPERTY_DATABASE_FETCH = {"pubchem": ["Density", "Viscosity"], "chemspider": ["Density"], "wikipedia": ["Density", "Viscosity"]}
+
+
+class PropertyDatabase:
+    """
+    Local database of compounds and their physical property results, consulted before the public databases.
+
+    Compounds are kept by CID with their SMILES and looked up by normalized name (lower case, single spaces),
+    results by `(source, cid, property)` in the format of the `PhysicalPropertyAgent` queries, None for a property
+    missing from the source. Lookups are indexed SQLite queries; the database never expires and is only changed
+    in bulk by `import_json`, e.g. with a file exported by `export_json` on a machine with access to the sources.
+
+    The database is opened by `open`, lazily at `PROPERTY_DATABASE_PATH` if not configured, and is empty (without
+    creating a file) if it does not exist when opened.
+
+    Usage:
+        python -m app.utils.property_database --fetch app/data/solvent_miscibility_table.csv --export properties.json
+        python -m app.utils.property_database --import properties.json
+    """
+    connection = None
+    path = PROPERTY_DATABASE_PATH
+    opened = False
+    lock = threading.RLock()
+    counters = {"compound_hits": 0, "property_hits": 0}
+
+
+    @staticmethod
+    def open(path=PROPERTY_DATABASE_PATH, create=False):
+        """Open the SQLite database, shared by all threads of the process.
+
+        Args:
+            path (str): path of the SQLite database, or `:memory:`
+            create (bool): whether to create the database if it does not exist, otherwise it is empty
+        """
+        with PropertyDatabase.lock:
+            if PropertyDatabase.connection is not None:
+                PropertyDatabase.connection.close()
+                PropertyDatabase.connection = None
+            PropertyDatabase.path = path
+            PropertyDatabase.opened = True
+            if path != ":memory:" and not os.path.exists(path):
+                if not create:
+                    return
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            PropertyDatabase.connection = sqlite3.connect(path, check_same_thread=False)
+            PropertyDatabase.connection.executescript(
+                "CREATE TABLE IF NOT EXISTS compound (cid INTEGER PRIMARY KEY, canonical_smiles TEXT, connectivity_smiles TEXT);"
+                "CREATE TABLE IF NOT EXISTS name (name TEXT PRIMARY KEY, cid INTEGER);"
+                "CREATE TABLE IF NOT EXISTS property (source TEXT, cid INTEGER, property TEXT, result TEXT, PRIMARY KEY (source, cid, property));"
+            )
+            PropertyDatabase.connection.commit()
+
+
+    @staticmethod
+    def cursor(create=False):
+        if PropertyDatabase.connection is None and (create or not PropertyDatabase.opened):
+            PropertyDatabase.open(PropertyDatabase.path, create)
+        return PropertyDatabase.connection
+
+
+    @staticmethod
+    def normalize(name):
+        return " ".join(name.lower().split())
+
+
+    @staticmethod
+    def get_compound(name):
+        """Compound of a name, see `CompoundCache.get_compound`.
+
+        Args:
+            name (str): name of the compound
+
+        Returns:
+            dict: `cid`, `canonical_smiles` and `connectivity_smiles`, or None if not in the database
+        """
+        with PropertyDatabase.lock:
+            if PropertyDatabase.cursor() is None:
+                return None
+            row = PropertyDatabase.connection.execute(
+                "SELECT compound.cid, canonical_smiles, connectivity_smiles FROM name JOIN compound ON name.cid = compound.cid WHERE name = ?",
+                (PropertyDatabase.normalize(name), ),
+            ).fetchone()
+            if row is None:
+                return None
+            PropertyDatabase.counters["compound_hits"] += 1
+            return {"cid": row[0], "canonical_smiles": row[1], "connectivity_smiles": row[2]}
+
+
+    @staticmethod
+    def get_property(source, cid, property):
+        """Result of a property, see `PropertyCache.get`.
+
+        Args:
+            source (str): data source, e.g. `pubchem`
+            cid (int): PubChem CID of the compound
+            property (str): property, e.g. `Density`
+
+        Returns:
+            tuple: whether the result is in the database, and the result
+        """
+        with PropertyDatabase.lock:
+            if PropertyDatabase.cursor() is None:
+                return False, None
+            row = PropertyDatabase.connection.execute(
+                "SELECT result FROM property WHERE source = ? AND cid = ? AND property = ?", (source, cid, property),
+            ).fetchone()
+            if row is None:
+                return False, None
+            PropertyDatabase.counters["property_hits"] += 1
+            return True, json.loads(row[0])
+
+
+    @staticmethod
+    def store(compound, names=(), results=None):
+        """Store a compound, its names and its results, replacing previous ones.
+
+        Args:
+            compound (dict): `cid`, `canonical_smiles` and `connectivity_smiles`
+            names (list of str): names of the compound
+            results (dict): results `{source: {property: result}}`
+        """
+        with PropertyDatabase.lock:
+            connection = PropertyDatabase.cursor(create=True)
+            connection.execute(
+                "INSERT OR REPLACE INTO compound VALUES (?, ?, ?)",
+                (compound["cid"], compound["canonical_smiles"], compound["connectivity_smiles"]),
+            )
+            connection.executemany("INSERT OR REPLACE INTO name VALUES (?, ?)", [(PropertyDatabase.normalize(name), compound["cid"]) for name in names])
+            connection.executemany("INSERT OR REPLACE INTO property VALUES (?, ?, ?, ?)", [
+                (source, compound["cid"], property, json.dumps(result, ensure_ascii=False))
+                for source, source_results in (results or {}).items() for property, result in source_results.items()
+            ])
+
+
+    @staticmethod
+    def import_json(path):
+        """Import compounds exported by `export_json` in one transaction.
+
+        Args:
+            path (str): path of the JSON file, a list of `{"cid", "canonical_smiles", "connectivity_smiles", "names", "results"}`
+
+        Returns:
+            int: number of imported compounds
+        """
+        with open(path, "r") as f:
+            compounds = json.load(f)
+        with PropertyDatabase.lock:
+            for compound in compounds:
+                PropertyDatabase.store(compound, compound.get("names", []), compound.get("results", {}))
+            PropertyDatabase.cursor(create=True).commit()
+        return len(compounds)
+
+
+    @staticmethod
+    def export_json(path):
+        """Export all compounds for `import_json`.
+
+        Args:
+            path (str): path of the JSON file
+        """
+        compounds = {}
+        with PropertyDatabase.lock:
+            if PropertyDatabase.cursor() is not None:
+                for cid, canonical_smiles, connectivity_smiles in PropertyDatabase.connection.execute("SELECT * FROM compound ORDER BY cid"):
+                    compounds[cid] = {"cid": cid, "canonical_smiles": canonical_smiles, "connectivity_smiles": connectivity_smiles, "names": [], "results": {}}
+                for name, cid in PropertyDatabase.connection.execute("SELECT * FROM name ORDER BY name"):
+                    compounds[cid]["names"].append(name)
+                for source, cid, property, result in PropertyDatabase.connection.execute("SELECT * FROM property"):
+                    compounds[cid]["results"].setdefault(source, {})[property] = json.loads(result)
+        with open(path, "w") as f:
+            json.dump(list(compounds.values()), f, indent=2, ensure_ascii=False)
+
+
+    @staticmethod
+    def fetch(physical_property_agent, names, sources=PROPERTY_DATABASE_FETCH):
+        """Fetch names from the public databases into the database, bypassing the database and the property cache.
+
+        Args:
+            physical_property_agent (PhysicalPropertyAgent): agent with the `data_source` URLs
+            names (list of str): names of the compounds
+            sources (dict): properties of each source
+
+        Returns:
+            int: number of compounds stored
+        """
+        compounds = {}
+        for name in names:
+            try:
+                compounds[name] = CompoundCache.get_compound(name, "name")
+            except ValueError as e:
+                print(f"Skipping {name} ({e})")
+        compounds = {name: compound for name, compound in compounds.items() if compound}
+        results = {compound["cid"]: {} for compound in compounds.values()}
+        for source, properties in sources.items():
+            # one compound at a time, so that a compound unknown to a source does not fail the others
+            for name, compound in compounds.items():
+                try:
+                    source_results = getattr(physical_property_agent, f"fetch_{source}")({name: compound}, properties)
+                    results[compound["cid"]][source] = source_results[compound["cid"]]
+                except Exception as e:
+                    print(f"Skipping {name} on {source} ({type(e).__name__}: {e})")
+        with PropertyDatabase.lock:
+            for name, compound in compounds.items():
+                PropertyDatabase.store(compound, [name], results[compound["cid"]])
+            PropertyDatabase.cursor(create=True).commit()
+        return len(compounds)
+
+
+    @staticmethod
+    def database_info():
+        """Hit counters of the process and number of compounds, names and results.
+
+        Returns:
+            dict: `compound_hits`, `property_hits`, `compounds`, `names` and `results`
+        """
+        with PropertyDatabase.lock:
+            sizes = {"compounds": 0, "names": 0, "results": 0}
+            if PropertyDatabase.cursor() is not None:
+                for key, table in [("compounds", "compound"), ("names", "name"), ("results", "property")]:
+                    sizes[key] = PropertyDatabase.connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            return {**PropertyDatabase.counters, **sizes}
+
+
+if __name__ == "__main__":
+    from app.config import Config
+    from app.utils.graphdb_handler import GraphdbHandler
+    from app.utils.physical_property_agent import PhysicalPropertyAgent
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--path", default=Config.PROPERTY_DATABASE, help="Path of the SQLite property database")
+    parser.add_argument("--import", dest="import_path", help="Path of a JSON file of compounds to import")
+    parser.add_argument("--fetch", help="Path of a CSV file whose header lists the solvents to fetch from the public databases")
+    parser.add_argument("--export", help="Path of the JSON file to export compounds to")
+    args = parser.parse_args()
+
+    PropertyDatabase.open(args.path, create=True)
+    if args.import_path:
+        print(f"Imported {PropertyDatabase.import_json(args.import_path)} compounds")
+    if args.fetch:
+        CompoundCache.open(Config.COMPOUND_CACHE, Config.COMPOUND_CACHE_TTL)
+        with open(args.fetch, encoding="utf-8-sig") as f:
+            solvents = [solvent.strip() for solvent in f.readline().split(",")[1:]]
+        graphdb_handler = GraphdbHandler(Config)
+        physical_property_agent = PhysicalPropertyAgent(graphdb_handler.query())
+        graphdb_handler.close()
+        print(f"Fetched {PropertyDatabase.fetch(physical_property_agent, solvents)} compounds")
+    if args.export:
+        PropertyDatabase.export_json(args.export)
+    print(PropertyDatabase.database_info())
@@ -0,0 +1,209 @@
+import argparse
+import json
+import re
+import threading
+from functools import lru_cache
+
+import numpy as np
+
+
+# tokens of a SMILES string: bracket atoms, two-letter halogens, atoms, bonds, branches and ring closures
+SMILES_TOKEN = re.compile(r"\[[^\]]+\]|Cl|Br|[BCNOPSFI]|[bcnops]|[=#$]|[()]|%\d{2}|\d")
+# descriptors counted from the tokens of a SMILES string, with the number of heavy atoms and the fraction of N, O
+# and S atoms among them, see `SolubilitySurrogate.descriptors`
+SMILES_ATOMS = ["C", "c", "N", "n", "O", "o", "S", "F", "Cl", "Br", "I"]
+SMILES_DESCRIPTORS = SMILES_ATOMS + ["=", "#", "ring", "branch", "charge", "heavy", "polar"]
+# maximum number of cached SMILES descriptors
+SMILES_DESCRIPTORS_CACHE_SIZE = 4096
+# ridge penalty of the standardized features
+SOLUBILITY_SURROGATE_ALPHA = 10.0
+# largest standard deviation (log10 units) of a prediction still trusted, others are fetched from RMG
+SOLUBILITY_SURROGATE_MAX_STD = 0.5
+
+
+class SolubilitySurrogate:
+    """
+    Local surrogate of the RMG solubility predictions, a ridge regression of log solubility over solvent and
+    solute descriptors trained on cached RMG results.
+
+    The descriptors of a compound are token counts of its SMILES, its size and polarity, and the features of a pair are the outer product
+    of the standardized solvent descriptors (with `1000 / T`) and solute descriptors, each with a constant,
+    i.e. solvent, solute and interaction terms. The log solubility of all pairs of solvents and solutes is then
+    the matrix product `S @ W @ U.T`. The standard deviation of a prediction is the leave-one-out residual standard
+    deviation scaled by the leverage of the pair, pairs above `max_std` or with an unknown SMILES are not confident.
+
+    The model is trained by `fit`, kept as class state, and saved and loaded by `save` and `load`. Pairs exported
+    by `SoluteSolubilityAgent.export_rmg` are trained by:
+        python -m app.utils.solubility_surrogate --train rmg_solubility.json --output solubility_surrogate.npz
+    """
+    model = None
+    max_std = SOLUBILITY_SURROGATE_MAX_STD
+    lock = threading.Lock()
+
+
+    @staticmethod
+    def descriptors(smiles):
+        """Token counts of a SMILES string, in the order of `SMILES_DESCRIPTORS`.
+
+        Args:
+            smiles (str): SMILES string
+
+        Returns:
+            np.ndarray: counts (read-only, cached by SMILES), or None if the SMILES is unknown (`-`)
+        """
+        return SolubilitySurrogate._descriptors(smiles)
+
+
+    @staticmethod
+    @lru_cache(maxsize=SMILES_DESCRIPTORS_CACHE_SIZE)
+    def _descriptors(smiles):
+        if not smiles or smiles == "-":
+            return None
+        counts = dict.fromkeys(SMILES_DESCRIPTORS, 0)
+        for token in SMILES_TOKEN.findall(smiles):
+            if token.startswith("["):
+                element = re.match(r"\[\d*([A-Z][a-z]?|[a-z]{1,2})", token)
+                if element and element.group(1) in counts:
+                    counts[element.group(1)] += 1
+                if "+" in token or "-" in token:
+                    counts["charge"] += 1
+            elif token in counts:
+                counts[token] += 1
+            elif token == "s":
+                counts["S"] += 1
+            elif token == "(":
+                counts["branch"] += 1
+            elif token[-1].isdigit():
+                counts["ring"] += 0.5
+        counts["heavy"] = sum(counts[atom] for atom in SMILES_ATOMS)
+        counts["polar"] = sum(counts[atom] for atom in ["N", "n", "O", "o", "S"]) / max(counts["heavy"], 1)
+        descriptors = np.array([counts[descriptor] for descriptor in SMILES_DESCRIPTORS], dtype=float)
+        descriptors.flags.writeable = False
+        return descriptors
+
+
+    @staticmethod
+    def featurize(smis, model, temperature=None):
+        """Standardized descriptors of compounds with a constant (and `1000 / T` for solvents), and whether known.
+
+        Args:
+            smis (list of str): SMILES strings
+            model (dict): model of `fit`
+            temperature (float or list of float): temperature of all or of each compound, only for solvents
+
+        Returns:
+            tuple: features (n x d) and known (n) arrays
+        """
+        descriptors = [SolubilitySurrogate.descriptors(smi) for smi in smis]
+        known = np.array([descriptor is not None for descriptor in descriptors])
+        features = np.zeros((len(smis), len(SMILES_DESCRIPTORS)))
+        if known.any():
+            features[known] = np.array([descriptor for descriptor in descriptors if descriptor is not None])
+        columns = [np.ones((len(smis), 1)), features]
+        if temperature is not None:
+            columns.append(np.broadcast_to(1000 / np.asarray(temperature, dtype=float), (len(smis), )).reshape(-1, 1))
+        features = np.hstack(columns)
+        prefix = "solv" if temperature is not None else "solu"
+        return (features - model[f"{prefix}_mean"]) / model[f"{prefix}_std"], known
+
+
+    @staticmethod
+    def fit(pairs, log_solubility, alpha=SOLUBILITY_SURROGATE_ALPHA):
+        """Train the model on RMG results.
+
+        Args:
+            pairs (list of tuple): `(solvent SMILES, solute SMILES, temperature)` pairs
+            log_solubility (list of float): log solubility of each pair
+            alpha (float): ridge penalty
+
+        Returns:
+            dict: model, also set as `SolubilitySurrogate.model`
+        """
+        known = [SolubilitySurrogate.descriptors(pair[0]) is not None and SolubilitySurrogate.descriptors(pair[1]) is not None for pair in pairs]
+        log_solubility = np.array([value for value, pair_known in zip(log_solubility, known) if pair_known], dtype=float)
+        pairs = [pair for pair, pair_known in zip(pairs, known) if pair_known]
+        if not pairs:
+            raise ValueError("No pair of known SMILES to train the solubility surrogate")
+        model = {}
+        for prefix, smis, temperature in [("solv", [pair[0] for pair in pairs], [float(pair[2]) for pair in pairs]), ("solu", [pair[1] for pair in pairs], None)]:
+            # standardize against the training pairs, the constant column is kept as is
+            model[f"{prefix}_mean"], model[f"{prefix}_std"] = 0, 1
+            raw, _ = SolubilitySurrogate.featurize(smis, model, temperature)
+            model[f"{prefix}_mean"] = np.concatenate([[0], raw[:, 1:].mean(axis=0)])
+            model[f"{prefix}_std"] = np.concatenate([[1], np.where(raw[:, 1:].std(axis=0) > 0, raw[:, 1:].std(axis=0), 1)])
+        solv_features, _ = SolubilitySurrogate.featurize([pair[0] for pair in pairs], model, [float(pair[2]) for pair in pairs])
+        solu_features, _ = SolubilitySurrogate.featurize([pair[1] for pair in pairs], model)
+        features = np.einsum("ia,ib->iab", solv_features, solu_features).reshape(len(pairs), -1)
+        gram = features.T @ features + alpha * np.eye(features.shape[1])
+        gram_inv = np.linalg.inv(gram)
+        weights = gram_inv @ features.T @ log_solubility
+        # leave-one-out residuals, so that the standard deviation is not underestimated by the training fit
+        residuals = (log_solubility - features @ weights) / (1 - np.einsum("ia,ab,ib->i", features, gram_inv, features))
+        model.update({
+            "weights": weights.reshape(solv_features.shape[1], solu_features.shape[1]),
+            "gram_inv": gram_inv.reshape(solv_features.shape[1], solu_features.shape[1], solv_features.shape[1], solu_features.shape[1]),
+            "residual_std": np.sqrt(np.mean(residuals ** 2)),
+            "pairs": len(pairs),
+        })
+        with SolubilitySurrogate.lock:
+            SolubilitySurrogate.model = model
+        return model
+
+
+    @staticmethod
+    def predict(solv_smis, solu_smis, temperature):
+        """Log solubility of all pairs of solvents and solutes, with their confidence.
+
+        Args:
+            solv_smis (list of str): SMILES of the solvents
+            solu_smis (list of str): SMILES of the solutes
+            temperature (float): temperature (K)
+
+        Returns:
+            tuple: log solubility, standard deviation and confident (solvents x solutes) arrays, or None without model
+        """
+        model = SolubilitySurrogate.model
+        if model is None:
+            return None
+        solv_features, solv_known = SolubilitySurrogate.featurize(solv_smis, model, float(temperature))
+        solu_features, solu_known = SolubilitySurrogate.featurize(solu_smis, model)
+        log_solubility = solv_features @ model["weights"] @ solu_features.T
+        leverage = np.einsum("ia,jb,abcd,ic,jd->ij", solv_features, solu_features, model["gram_inv"], solv_features, solu_features, optimize=True)
+        std = model["residual_std"] * np.sqrt(1 + leverage)
+        confident = (std <= SolubilitySurrogate.max_std) & solv_known[:, None] & solu_known[None, :]
+        return log_solubility, std, confident
+
+
+    @staticmethod
+    def save(path):
+        with SolubilitySurrogate.lock:
+            np.savez(path, **SolubilitySurrogate.model)
+
+
+    @staticmethod
+    def load(path, max_std=SOLUBILITY_SURROGATE_MAX_STD):
+        """Load a model saved by `save`.
+
+        Args:
+            path (str): path of the `.npz` file
+            max_std (float): largest standard deviation of a confident prediction
+        """
+        with np.load(path) as data:
+            model = {key: data[key] for key in data.files}
+        with SolubilitySurrogate.lock:
+            SolubilitySurrogate.model = model
+            SolubilitySurrogate.max_std = max_std
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--train", required=True, help="Path of a JSON file of RMG results `[[solvent SMILES, solute SMILES, temperature, log solubility], ...]`")
+    parser.add_argument("--output", required=True, help="Path of the .npz file to save the model to")
+    parser.add_argument("--alpha", type=float, default=SOLUBILITY_SURROGATE_ALPHA, help="Ridge penalty")
+    args = parser.parse_args()
+
+    with open(args.train, "r") as f:
+        results = json.load(f)
+    model = SolubilitySurrogate.fit([result[:3] for result in results], [result[3] for result in results], args.alpha)
+    SolubilitySurrogate.save(args.output)
+    print(f"Trained on {int(model['pairs'])} pairs, residual standard deviation {float(model['residual_std']):.3f}")
@@ -1,14 +1,31 @@
-import pubchempy as pcp
-import requests
-from bs4 import BeautifulSoup
+import json
 import re
-from multiprocessing.pool import ThreadPool
+import threading
+
+import lxml.html
+import requests
+
+from .compound_cache import CompoundCache
+from .http_client import HttpClient
+from .solubility_surrogate import SolubilitySurrogate
+
+
+# maximum length of an RMG search URL, longer searches are split into chunks
+RMG_URL_MAX_LENGTH = 4000
+# maximum number of cached pair solubilities, the cache is cleared when full
+RMG_CACHE_SIZE = 65536
 
 
 class SoluteSolubilityAgent():
     """Agent for predicting solute solubility of species in chemical processes.
     - RMG-py: https://rmg.mit.edu/database/solvation/searchSolubility
+
+    Solubilities are cached per `(solvent SMILES, solute SMILES, temperature)` pair by the process, only pairs
+    not cached are sent to RMG, in chunks of bounded URL length fetched concurrently by `HttpClient`. With a
+    `SolubilitySurrogate` model loaded, only pairs predicted without confidence are sent to RMG, see `query_rmg`.
     """
+    rmg_solubility = {}
+    lock = threading.Lock()
     
     def __init__(self, entity):
         self.entity = entity
@@ -18,47 +35,165 @@ class SoluteSolubilityAgent():
 
     def get_compound(self, item):
         search_item = re.sub(r"<[^<>]*>", "", item)
-        compounds = []
+        compound = None
         try:
-            compounds.extend(pcp.get_compounds(search_item, namespace="formula"))
+            compound = CompoundCache.get_compound(search_item, "formula")
         except:
             try:
-                compounds.extend(pcp.get_compounds(search_item, namespace="name"))
+                compound = CompoundCache.get_compound(search_item, "name")
             except:
                 pass
 
-        if compounds:
-            return compounds[0]
+        if compound:
+            return compound
         else:
             return "-"
 
 
+    def get_rmg_url(self, pairs):
+        """URL of the RMG solubility search of `(solvent SMILES, solute SMILES, temperature)` pairs."""
+        none_span = "_".join(["None"] * len(pairs))
+        return self.rmg_url.replace("{solv}", "_".join(pair[0] for pair in pairs)).replace("{solu}", "_".join(pair[1] for pair in pairs)) \
+            .replace("{temperature}", "_".join(pair[2] for pair in pairs)) \
+            .replace("{ref_solv}", none_span).replace("{ref_s}", none_span).replace("{ref_t}", none_span) \
+            .replace("{h_sub}", none_span).replace("{c_pg}", none_span).replace("{c_ps}", none_span) \
+            .replace("#", "%23")
+
+
+    def chunk_rmg_pairs(self, pairs):
+        """Split pairs into chunks whose URLs are at most `RMG_URL_MAX_LENGTH` long (or of one pair)."""
+        base_length = len(self.get_rmg_url([]))
+        chunks = []
+        url_length = None
+        for pair in pairs:
+            # each further pair adds its own spans and one separator in each of the 9 spans
+            pair_length = len(self.get_rmg_url([pair])) - base_length + 9
+            if url_length is None or url_length + pair_length > RMG_URL_MAX_LENGTH:
+                chunks.append([])
+                url_length = base_length - 9
+            chunks[-1].append(pair)
+            url_length += pair_length
+        return chunks
+
+
+    def get_rmg_solubility(self, pairs, retries=None):
+        """Log solubility of pairs predicted by RMG, only pairs not cached are sent, in chunks fetched concurrently.
+
+        Args:
+            pairs (list of tuple): `(solvent SMILES, solute SMILES, temperature)` pairs
+            retries (int): retries of a failing chunk, `HttpClient.retries` if None
+
+        Returns:
+            list of str: log solubility of each pair, or `-` if not predicted
+
+        Raises:
+            requests.RequestException: if RMG is unreachable or answers a chunk with an error status
+            ValueError: if RMG answers a chunk with another number of solubilities than pairs
+        """
+        log_solubility = {}
+        with SoluteSolubilityAgent.lock:
+            for pair in pairs:
+                if pair in SoluteSolubilityAgent.rmg_solubility:
+                    log_solubility[pair] = SoluteSolubilityAgent.rmg_solubility[pair]
+        chunks = self.chunk_rmg_pairs([pair for pair in dict.fromkeys(pairs) if pair not in log_solubility])
+        urls = [self.get_rmg_url(chunk) for chunk in chunks]
+        responses = HttpClient.get_many(urls, retries=retries)
+        for chunk, url in zip(chunks, urls):
+            responses[url].raise_for_status()
+            chunk_solubility = [tr.xpath(".//td")[11].text_content() for tr in lxml.html.fromstring(responses[url].text).xpath("//tr")[1:]]
+            if len(chunk_solubility) != len(chunk):
+                raise ValueError(f"RMG returned {len(chunk_solubility)} solubilities for {len(chunk)} pairs: {url}")
+            log_solubility.update(zip(chunk, chunk_solubility))
+            with SoluteSolubilityAgent.lock:
+                if len(SoluteSolubilityAgent.rmg_solubility) + len(chunk) > RMG_CACHE_SIZE:
+                    SoluteSolubilityAgent.rmg_solubility.clear()
+                SoluteSolubilityAgent.rmg_solubility.update(zip(chunk, chunk_solubility))
+        return [log_solubility[pair] for pair in pairs]
+
+
+    @staticmethod
+    def export_rmg(path):
+        """Export the cached RMG solubilities for `SolubilitySurrogate` training.
+
+        Args:
+            path (str): path of the JSON file `[[solvent SMILES, solute SMILES, temperature, log solubility], ...]`
+
+        Returns:
+            int: number of exported pairs
+        """
+        with SoluteSolubilityAgent.lock:
+            results = [[*pair, float(value)] for pair, value in SoluteSolubilityAgent.rmg_solubility.items() if value != "-"]
+        with open(path, "w") as f:
+            json.dump(results, f)
+        return len(results)
+
+
+    @staticmethod
+    def train_surrogate():
+        """Train `SolubilitySurrogate` on the cached RMG solubilities, see `SolubilitySurrogate.fit`."""
+        with SoluteSolubilityAgent.lock:
+            results = [(pair, float(value)) for pair, value in SoluteSolubilityAgent.rmg_solubility.items() if value != "-"]
+        return SolubilitySurrogate.fit([pair for pair, _ in results], [value for _, value in results])
+
+
+    def query_surrogate(self, solv_smis, solu_smis, temperature, pairs):
+        """Log solubility of pairs from the loaded `SolubilitySurrogate`, pairs without confidence from RMG.
+
+        If RMG is unreachable or fails, pairs without confidence keep their prediction (`-` for unknown compounds),
+        without retrying RMG, as the prediction is already at hand.
+
+        Args:
+            solv_smis (list of str): SMILES of the solvents
+            solu_smis (list of str): SMILES of the solutes
+            temperature (float): temperature (K)
+            pairs (list of tuple): pairs of the solvents and solutes, row by row
+
+        Returns:
+            tuple: log solubility, whether predicted by the surrogate, and whether without confidence, of each pair
+        """
+        log_solubility, _, confident = SolubilitySurrogate.predict(solv_smis, solu_smis, temperature)
+        log_solubility, confident = log_solubility.ravel(), confident.ravel()
+        uncertain_pairs = [pair for k, pair in enumerate(pairs) if not confident[k]]
+        try:
+            rmg_solubility = dict(zip(uncertain_pairs, self.get_rmg_solubility(uncertain_pairs, retries=0)))
+        except (requests.RequestException, ValueError):
+            rmg_solubility = {}
+        with SoluteSolubilityAgent.lock:
+            rmg_solubility.update((pair, SoluteSolubilityAgent.rmg_solubility[pair]) for pair in pairs if pair in SoluteSolubilityAgent.rmg_solubility)
+        solubility, surrogate, uncertain = [], [], []
+        for k, pair in enumerate(pairs):
+            if pair in rmg_solubility:
+                solubility.append(rmg_solubility[pair])
+            else:
+                solubility.append("-" if "-" in pair[:2] else str(log_solubility[k]))
+            surrogate.append(pair not in rmg_solubility)
+            uncertain.append(pair not in rmg_solubility and not confident[k])
+        return solubility, surrogate, uncertain
+
+
     def query_rmg(self, solution):
-        pool = ThreadPool(8)
-        solv_compounds = pool.map(self.get_compound, solution["solvents"])
-        solu_compounds = pool.map(self.get_compound, solution["solutes"])
-        pool.close()
-        solv_smis = [compound.connectivity_smiles if isinstance(compound, pcp.Compound) else "-" for compound in solv_compounds]
-        solu_smis = [compound.connectivity_smiles if isinstance(compound, pcp.Compound) else "-" for compound in solu_compounds]
+        compounds = HttpClient.map(self.get_compound, solution["solvents"] + solution["solutes"])
+        solv_compounds, solu_compounds = compounds[:len(solution["solvents"])], compounds[len(solution["solvents"]):]
+        solv_smis = [compound["connectivity_smiles"] if isinstance(compound, dict) else "-" for compound in solv_compounds]
+        solu_smis = [compound["connectivity_smiles"] if isinstance(compound, dict) else "-" for compound in solu_compounds]
         if "temperature" not in solution:
             temperature = 298
         else:
             temperature = solution["temperature"]
-        solv_span = "_".join(["_".join([solv_smi] * len(solu_compounds)) for solv_smi in solv_smis])
-        solu_span = "_".join(["_".join(solu_smis)] * len(solv_compounds))
-        temperature_span = "_".join([str(temperature)] * (len(solu_compounds) * len(solv_compounds)))
-        none_span = "_".join(["None"] * (len(solu_compounds) * len(solv_compounds)))
-        url = self.rmg_url.replace("{solv}", solv_span).replace("{solu}", solu_span).replace("{temperature}", temperature_span) \
-            .replace("{ref_solv}", none_span).replace("{ref_s}", none_span).replace("{ref_t}", none_span) \
-            .replace("{h_sub}", none_span).replace("{c_pg}", none_span).replace("{c_ps}", none_span) \
-            .replace("#", "%23")
-        soup = BeautifulSoup(requests.get(url).text, features="lxml")
-        solubility = [tr.find_all("td")[11].text for tr in soup.find_all("tr")[1:]]
+        pairs = [(solv_smi, solu_smi, str(temperature)) for solv_smi in solv_smis for solu_smi in solu_smis]
+        if SolubilitySurrogate.model is None:
+            solubility = self.get_rmg_solubility(pairs)
+        else:
+            solubility, surrogate, uncertain = self.query_surrogate(solv_smis, solu_smis, temperature, pairs)
         solubility = [
             [
                 str(round(10 ** float(solubility[i * len(solu_compounds) + j]), 3)) if solubility[i * len(solu_compounds) + j] != "-" else "-"
                 for j in range(len(solu_compounds))
             ] for i in range(len(solv_compounds))
         ]
-        solute_solubility = {"value": solubility, "reference": url}
-        return solute_solubility
\ No newline at end of file
+        solute_solubility = {"value": solubility, "reference": self.get_rmg_url(pairs)}
+        if SolubilitySurrogate.model is not None:
+            # flags of values predicted locally, and of those predicted without confidence as RMG was unreachable or failed
+            solute_solubility["surrogate"] = [surrogate[i * len(solu_compounds):(i + 1) * len(solu_compounds)] for i in range(len(solv_compounds))]
+            solute_solubility["uncertain"] = [uncertain[i * len(solu_compounds):(i + 1) * len(solu_compounds)] for i in range(len(solv_compounds))]
+        return solute_solubility
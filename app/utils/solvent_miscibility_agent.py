@@ -1,27 +1,128 @@
+import itertools
+import os
+import threading
+
 import numpy as np
 
 
 class SolventMiscibilityAgent():
     """Solvent miscibility agent for determining miscibility by table data, including
     - Sigma Aldrich: https://www.sigmaaldrich.com/GB/en/technical-documents/technical-article/analytical-chemistry/purification/solvent-miscibility-table
+
+    A table is loaded once per process by `load_table` into a name to index dictionary and a bit matrix packed
+    by `np.packbits`, so that a pair is checked by `is_miscible` in constant time. Solvents of more than two
+    solvents are miscible if all their pairs are miscible. Many solvent sets are screened at once by `query_many`.
     """
+    tables = {}
+    lock = threading.Lock()
 
     def __init__(self, entity, solvent_miscibility_table_path):
         self.entity = entity
-        with open(solvent_miscibility_table_path) as f:
-            self.solvents = [solvent.lower() for solvent in f.readline().split(",")[1:]]
-        self.solvent_miscibility_table = np.loadtxt(solvent_miscibility_table_path, delimiter=",", skiprows=1, usecols=range(1, len(self.solvents)+1), dtype=np.int32)
+        self.solvents, self.solvent_index, self.solvent_miscibility_bits = SolventMiscibilityAgent.load_table(solvent_miscibility_table_path)
+
+    @staticmethod
+    def load_table(solvent_miscibility_table_path):
+        """Solvents, name to index dictionary and packed bit matrix of a table, loaded once per process.
+
+        Args:
+            solvent_miscibility_table_path (str): path of the CSV table, solvents as header and first column
+
+        Returns:
+            tuple: solvents (lower case), index of each solvent and bit matrix (row i, bit j of miscible pairs)
+        """
+        path = os.path.abspath(solvent_miscibility_table_path)
+        with SolventMiscibilityAgent.lock:
+            if path not in SolventMiscibilityAgent.tables:
+                with open(path, encoding="utf-8-sig") as f:
+                    solvents = [solvent.strip().lower() for solvent in f.readline().split(",")[1:]]
+                solvent_miscibility_table = np.loadtxt(path, delimiter=",", skiprows=1, usecols=range(1, len(solvents)+1), dtype=np.int32)
+                SolventMiscibilityAgent.tables[path] = (
+                    solvents,
+                    {solvent: i for i, solvent in enumerate(solvents)},
+                    np.packbits(solvent_miscibility_table == 1, axis=1),
+                )
+            return SolventMiscibilityAgent.tables[path]
+
+    def is_miscible(self, i, j):
+        return bool(self.solvent_miscibility_bits[i, j >> 3] >> (7 - (j & 7)) & 1)
 
     def query_sigmaaldrich(self, solvents):
         solvents = [solvent.lower() for solvent in solvents]
         if len(solvents) == 1:
             return [f"Chemical process with only single solvent: {solvents[0]}", ""]
-        if len(solvents) > 2:
+        if any(solvent not in self.solvent_index for solvent in solvents):
+            if len(solvents) == 2:
+                return [f"Unknown miscibility: {', '.join(solvents)}", ""]
             return [f"Unknown miscibility on {len(solvents)} solvents: {', '.join(solvents)}", ""]
-        if solvents[0] not in self.solvents or solvents[1] not in self.solvents:
-            return [f"Unknown miscibility: {', '.join(solvents)}", ""]
-        else:
-            if self.solvent_miscibility_table[self.solvents.index(solvents[0])][self.solvents.index(solvents[1])] == 1:
-                return [f"Miscible: {', '.join(solvents)}", self.entity["data_source"]["SigmaAldrich"]["url"]]
+        immiscible_pairs = [
+            (solvent_a, solvent_b) for solvent_a, solvent_b in itertools.combinations(solvents, 2)
+            if not self.is_miscible(self.solvent_index[solvent_a], self.solvent_index[solvent_b])
+        ]
+        if not immiscible_pairs:
+            return [f"Miscible: {', '.join(solvents)}", self.entity["data_source"]["SigmaAldrich"]["url"]]
+        if len(solvents) == 2:
+            return [f"Immiscible: {', '.join(solvents)}", self.entity["data_source"]["SigmaAldrich"]["url"]]
+        immiscible_pairs = "; ".join(f"{solvent_a} - {solvent_b}" for solvent_a, solvent_b in immiscible_pairs)
+        return [f"Immiscible: {', '.join(solvents)} ({immiscible_pairs})", self.entity["data_source"]["SigmaAldrich"]["url"]]
+
+    def validate_solvent_sets(self, solvent_sets):
+        """Check solvent sets of a request before screening them by `query_many`.
+
+        Args:
+            solvent_sets (list of list of str): solvent sets, e.g. `[["Water", "Ethanol"], ["Water", "Hexane", "Toluene"]]`
+
+        Raises:
+            ValueError: if the solvent sets are not a list of lists of names, or a name is not in the table
+        """
+        if not isinstance(solvent_sets, list) or not all(isinstance(solvents, list) and all(isinstance(solvent, str) for solvent in solvents)
+                                                         for solvents in solvent_sets):
+            raise ValueError(f"Expected a list of lists of solvent names, got: {solvent_sets}")
+        unknown_solvents = sorted(set(solvent for solvents in solvent_sets for solvent in solvents if solvent.lower() not in self.solvent_index))
+        if unknown_solvents:
+            raise ValueError(f"Unknown solvents: {', '.join(unknown_solvents)}")
+
+    def query_many(self, solvent_sets):
+        """Miscibility of many solvent sets in one vectorized pass over the bit matrix.
+
+        A set is immiscible if any pair of known solvents is immiscible, otherwise unknown if any solvent is not
+        in the table, otherwise miscible (or single with one solvent).
+
+        Args:
+            solvent_sets (list of list of str): solvent sets, e.g. `[["Water", "Ethanol"], ["Water", "Hexane", "Toluene"]]`
+
+        Returns:
+            dict: `result` of each set with `solvents`, `miscibility`, `immiscible_pairs` and `unknown_pairs`, and `reference`
+        """
+        solvent_sets = [[solvent.lower() for solvent in solvents] for solvents in solvent_sets]
+        size = max([len(solvents) for solvents in solvent_sets] + [2])
+        # indices of the solvents, -1 for unknown solvents and -2 for padding
+        lengths = np.array([len(solvents) for solvents in solvent_sets], dtype=np.int64)
+        indices = np.full((len(solvent_sets), size), -2, dtype=np.int64)
+        indices[np.repeat(np.arange(len(solvent_sets)), lengths), np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)] = \
+            [self.solvent_index.get(solvent, -1) for solvents in solvent_sets for solvent in solvents]
+        a, b = np.triu_indices(size, 1)
+        indices_a, indices_b = indices[:, a], indices[:, b]
+        pairs = (indices_a != -2) & (indices_b != -2)
+        unknown = pairs & ((indices_a == -1) | (indices_b == -1))
+        known = pairs & ~unknown
+        indices_a, indices_b = np.where(known, indices_a, 0), np.where(known, indices_b, 0)
+        miscible = (self.solvent_miscibility_bits[indices_a, indices_b >> 3] >> (7 - (indices_b & 7))) & 1
+        immiscible = known & (miscible == 0)
+        set_immiscible, set_unknown = immiscible.any(axis=1).tolist(), unknown.any(axis=1).tolist()
+
+        result = []
+        for k, solvents in enumerate(solvent_sets):
+            if set_immiscible[k]:
+                miscibility = "Immiscible"
+            elif set_unknown[k] or not solvents or solvents[0] not in self.solvent_index:
+                miscibility = "Unknown"
+            elif len(solvents) == 1:
+                miscibility = "Single"
             else:
-                return [f"Immiscible: {', '.join(solvents)}", self.entity["data_source"]["SigmaAldrich"]["url"]]
+                miscibility = "Miscible"
+            result.append({"solvents": solvents, "miscibility": miscibility, "immiscible_pairs": [], "unknown_pairs": []})
+        a, b = a.tolist(), b.tolist()
+        for key, mask in [("immiscible_pairs", immiscible), ("unknown_pairs", unknown)]:
+            for k, p in zip(*(index.tolist() for index in np.nonzero(mask))):
+                result[k][key].append([solvent_sets[k][a[p]], solvent_sets[k][b[p]]])
+        return {"result": result, "reference": self.entity["data_source"]["SigmaAldrich"]["url"]}
@@ -0,0 +1,44 @@
+"""Benchmark of the node-vectorized `derivative` of dispersion (solve_bvp) models.
+
+Usage (with graphdb running):
+    python -m benchmarks.bvp_vectorized
+"""
+import time
+
+import numpy as np
+
+from app.utils.model_agent import ModelAgent
+from .cases import load_case, query_entity
+
+
+def run(simulation, parameter_value_dict, keys, values, repeat):
+    results = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        results = []
+        for value in values:
+            parameter_value_dict.update(zip(keys, value))
+            results.append(simulation(parameter_value_dict))
+    return (time.perf_counter() - start) / repeat, results
+
+
+def main(repeat=3):
+    entity = query_entity()
+    model_context, keys, values = load_case("esterification")
+
+    timings, outputs = {}, {}
+    for vectorized in [False, True]:
+        scipy_model = {}
+        exec(ModelAgent(entity, model_context).to_scipy_model(vectorized=vectorized), scipy_model)
+        timings[vectorized], outputs[vectorized] = run(
+            scipy_model["simulation"], scipy_model["parameter_value_dict"], keys, values, repeat)
+
+    deviation = max(np.abs(a[1] - b[1]).max() for a, b in zip(outputs[False], outputs[True]) if a and b)
+    print(f"{len(values)} operating conditions, {repeat} repeats")
+    print(f"derivative_axis loop:   {timings[False]:.3f} s")
+    print(f"vectorized derivative:  {timings[True]:.3f} s  (x{timings[False] / timings[True]:.1f})")
+    print(f"max concentration deviation: {deviation:.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Bundled cases shared by the benchmarks."""
+import csv
+import json
+
+from app.config import Config
+from app.utils.graphdb_handler import GraphdbHandler
+
+
+# model context and experimental data of bundled cases
+CASES = {
+    "esterification": ("app/cases/esterification/model_context_moore.json", "app/cases/esterification/data_mecn_360rpm.csv"),
+    "dushman": ("app/cases/dushman/model_context.json", "app/cases/dushman/data.csv"),
+}
+# column headers of operating parameters in case csv files
+OPERATING_PARAMETERS = {
+    "ω (rad/s)": "Rotational_Angular_Velocity",
+    "q (mL/min)": "Flow_Rate",
+    "q<sub>g</sub> (L/min)": "Flow_Rate_Gas",
+    "c<sub>0</sub> (mol/L)": "Initial_Concentration",
+}
+
+
+def query_entity(mode=None):
+    graphdb_handler = GraphdbHandler(Config)
+    entity = graphdb_handler.query(mode)
+    graphdb_handler.close()
+    return entity
+
+
+def load_case(case):
+    """Load the model context and operating conditions of a bundled case.
+
+    Args:
+        case (str): case name in `CASES`
+
+    Returns:
+        tuple: model context, operating parameter keys and operating condition rows
+    """
+    model_context_path, data_path = CASES[case]
+    model_context = json.load(open(model_context_path))
+    with open(data_path, encoding="utf-8-sig") as f:
+        rows = list(csv.reader(f))
+    keys = []
+    parameter, stream, species_index = None, None, 0
+    for column, (head, stream_head) in enumerate(zip(rows[0], rows[1])):
+        if head:
+            parameter = OPERATING_PARAMETERS.get(head)
+            species_index = 0
+        if stream_head and stream_head != "-":
+            stream = stream_head
+            species_index = 0
+        if not parameter:
+            break
+        if parameter == "Initial_Concentration":
+            keys.append((parameter, model_context["basic"]["species"][species_index], None, stream, None))
+            species_index += 1
+        elif stream_head == "-":
+            keys.append((parameter, None, None, None, None))
+        else:
+            keys.append((parameter, None, None, stream, None))
+    values = [[float(v) for v in row[:len(keys)]] for row in rows[3:] if row]
+    return model_context, keys, values
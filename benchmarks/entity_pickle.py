@@ -0,0 +1,40 @@
+"""Benchmark of the bytes pickled to calibration workers of model exploration.
+
+Each task used to pickle a `ModelCalibrationAgent` with the full entity, now the entity is sent once per worker
+by the pool initializer and each task pickles only its calibration request. The entity is measured as queried,
+with interned names, and as a copy with a string object per occurrence.
+
+Usage (with graphdb running):
+    python -m benchmarks.entity_pickle
+"""
+import json
+import pickle
+
+from app.utils.model_calibration_agent import ModelCalibrationAgent
+from .cases import CASES, load_case, query_entity
+
+
+# workers of the pool of `ModelExplorationAgent`
+WORKERS = 8
+
+
+def main(tasks=64):
+    entity = query_entity()
+    entity_copy = json.loads(json.dumps(entity))
+    entity_size, entity_copy_size = len(pickle.dumps(entity)), len(pickle.dumps(entity_copy))
+    print(f"entity: {entity_copy_size / 1e3:.1f} kB, interned {entity_size / 1e3:.1f} kB")
+    print(f"{'case':16}{'task before (kB)':>18}{'task after (kB)':>17}{f'{tasks} tasks before (MB)':>24}{f'{tasks} tasks after (MB)':>23}")
+    for case in CASES:
+        model_context, keys, values = load_case(case)
+        model_calibration_request = {
+            "task": "calibration",
+            "data": {"key": keys, "value": values},
+            "model_context": model_context,
+        }
+        before = len(pickle.dumps(ModelCalibrationAgent(entity_copy, model_calibration_request)))
+        after = len(pickle.dumps(model_calibration_request))
+        print(f"{case:16}{before / 1e3:>18.1f}{after / 1e3:>17.1f}{tasks * before / 1e6:>24.2f}{(tasks * after + WORKERS * entity_size) / 1e6:>23.2f}")
+
+
+if __name__ == "__main__":
+    main()
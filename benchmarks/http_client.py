@@ -0,0 +1,86 @@
+"""Behaviour of the shared HTTP client against a local fake of flaky external services.
+
+A `FakeSession` answers each URL after `LATENCY` seconds, the first attempt of a part of the URLs with a 503
+(some with a `Retry-After` header), and counts the requests in flight per host. `HttpClient.get_many` is timed on
+a host limited by `HttpClient.host_concurrency` and on one that is not, and on a real port without server (as an
+unreachable RMG) with and without retries. The time, peak concurrency per host and `HttpClient.metrics_info` are
+reported.
+
+Usage:
+    python -m benchmarks.http_client
+"""
+import socket
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+
+from app.utils.http_client import HTTP_BACKOFF, FakeSession, HttpClient
+
+
+LATENCY = 0.05
+URLS = 32
+# every `FLAKY`-th URL fails on its first attempt
+FLAKY = 4
+
+
+class FlakyHandler:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.attempts = {}
+        self.in_flight = {}
+        self.peak = {}
+
+    def __call__(self, url, headers):
+        host = urlparse(url).netloc
+        with self.lock:
+            self.attempts[url] = self.attempts.get(url, 0) + 1
+            self.in_flight[host] = self.in_flight.get(host, 0) + 1
+            self.peak[host] = max(self.peak.get(host, 0), self.in_flight[host])
+            attempt = self.attempts[url]
+        time.sleep(LATENCY)
+        with self.lock:
+            self.in_flight[host] -= 1
+        if attempt == 1 and int(url.rsplit("/", 1)[1]) % FLAKY == 0:
+            return 503, "busy"
+        return 200, url
+
+
+def main():
+    handler = FlakyHandler()
+    previous = HttpClient.set_session(FakeSession(handler))
+    HttpClient.host_concurrency["limited.example"] = 2
+    # no `Retry-After` header in the fake, the backoff of the first retry applies
+    print(f"{URLS} URLs per host, {LATENCY * 1e3:.0f} ms latency, every {FLAKY}th failing once, first backoff {HTTP_BACKOFF * 1e3:.0f} ms")
+    print(f"{'host':28}{'time (ms)':>11}{'peak':>6}{'all 200':>9}")
+    for host in ["limited.example", "open.example"]:
+        start = time.perf_counter()
+        responses = HttpClient.get_many([f"http://{host}/{i}" for i in range(URLS)])
+        timing = time.perf_counter() - start
+        ok = all(response.status_code == 200 for response in responses.values())
+        print(f"{host:28}{timing * 1e3:>11.1f}{handler.peak[host]:>6}{str(ok):>9}")
+    HttpClient.set_session(previous)
+
+    # a local port without server, as RMG unreachable
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    for retries in [None, 0]:
+        start = time.perf_counter()
+        try:
+            HttpClient.get_many([f"http://127.0.0.1:{port}/search"], retries=retries)
+        except requests.ConnectionError:
+            pass
+        label = f"unreachable, {HttpClient.retries if retries is None else retries} retries"
+        print(f"{label:28}{(time.perf_counter() - start) * 1e3:>11.1f}")
+
+    print(f"{'host':18}{'requests':>10}{'failures':>10}{'retries':>9}{'mean (ms)':>11}{'max (ms)':>10}")
+    for host, metrics in HttpClient.metrics_info().items():
+        print(f"{host:18}{metrics['requests']:>10}{metrics['failures']:>10}{metrics['retries']:>9}"
+              f"{metrics['mean_latency'] * 1e3:>11.1f}{metrics['max_latency'] * 1e3:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""Latency of physical property queries against a local mock of PubChem, ChemSpider and Wikipedia.
+
+Every mock response is delayed by `LATENCY` seconds. The queries of `PhysicalPropertyAgent` are timed against
+the serial loops they replaced, which fetch one URL at a time (ChemSpider compounds once per property),
+and the number of requests received by the mock is reported. Compounds are preloaded in an in-memory
+`CompoundCache`, so that PubChem itself is never queried. Repeated queries are then answered by an in-memory
+`PropertyCache`, fresh ones without request and stale ones while refetched in background.
+
+Usage:
+    python -m benchmarks.http_fetch
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+from app.utils.compound_cache import CompoundCache
+from app.utils.physical_property_agent import PhysicalPropertyAgent
+from app.utils.property_cache import PropertyCache
+
+
+LATENCY = 0.05
+NAMES = ["water", "toluene", "acetonitrile", "methanol", "ethanol", "hexane", "acetone", "chloroform"]
+PROPERTIES = ["Density", "Viscosity"]
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    requests = 0
+
+    def do_GET(self):
+        MockHandler.requests += 1
+        time.sleep(LATENCY)
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+        if parts[0] == "pubchem":
+            information = [{"Reference": [f"mock {parts[1]}"], "Value": {"StringWithMarkup": [{"String": f"{parts[2]} of {parts[1]}"}]}}]
+            body = json.dumps({"Record": {"Section": [{"Section": [{"Section": [{"Information": information}]}]}]}})
+        elif parts[0] == "chemspider" and parts[1] == "search":
+            body = json.dumps({"Records": [{"ChemSpiderId": NAMES.index(parse_qs(url.query)["value"][0])}]})
+        elif parts[0] == "chemspider":
+            record = {"DatasourceName": "Sigma-Aldrich", "ExternalUrl": "mock", "LowValue": int(parts[1]), "Unit": "g/mL"}
+            body = json.dumps({property + "Properties": [record] for property in PROPERTIES})
+        else:
+            rows = "".join(f"<tr><td>{property}</td><td>{property} of {parts[1]}</td></tr>" for property in PROPERTIES)
+            body = f"<html><body><table>{rows}</table></body></html>"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body.encode())))
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serial_pubchem(agent, names, properties):
+    property_res = {name: {} for name in names}
+    for name in names:
+        compound = CompoundCache.get_compound(name, "name")
+        property_res[name]["canonical_smiles"] = compound["canonical_smiles"]
+        property_res[name]["property"] = {}
+        for property in properties:
+            pubchem_url = agent.pubchem_url.replace("{cid}", str(compound["cid"])).replace("{property}", property)
+            pubchem_res = requests.get(pubchem_url).json()["Record"]["Section"][0]["Section"][0]["Section"][0]
+            property_res[name]["property"][property] = [{
+                "reference": res["Reference"][0],
+                "value": res["Value"]["StringWithMarkup"][0]["String"],
+            } for res in pubchem_res["Information"]]
+    return property_res
+
+
+def serial_chemspider(agent, names, properties):
+    property_res = {name: {} for name in names}
+    for name in names:
+        compound = CompoundCache.get_compound(name, "name")
+        property_res[name]["canonical_smiles"] = compound["canonical_smiles"]
+        property_res[name]["property"] = {}
+        chemspider_id = requests.get(agent.chemspider_search_url.replace("{name}", name)).json()["Records"][0]["ChemSpiderId"]
+        for property in properties:
+            chemspider_res = requests.get(agent.chemspider_url.replace("{cid}", str(chemspider_id))).json()
+            property_res[name]["property"][property] = [{
+                "reference": res["DatasourceName"] + " " + res["ExternalUrl"],
+                "value": str(res["LowValue"]) + " " + res["Unit"],
+            } for res in chemspider_res[property + "Properties"]]
+    return property_res
+
+
+def run(query, names, properties):
+    MockHandler.requests = 0
+    start = time.perf_counter()
+    res = query(names, properties)
+    return time.perf_counter() - start, MockHandler.requests, res
+
+
+def run_cached(query, names, properties, repeats=100):
+    MockHandler.requests = 0
+    start = time.perf_counter()
+    for _ in range(repeats):
+        res = query(names, properties)
+    return (time.perf_counter() - start) / repeats, MockHandler.requests, res
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host = f"http://127.0.0.1:{server.server_port}"
+    entity = {"data_source": {
+        "PubChem": {"url": host + "/pubchem/{cid}/{property}"},
+        "ChemSpider": {"url": host + "/chemspider/{cid}|" + host + "/chemspider/search?value={name}"},
+        "Wikipedia": {"url": host + "/wiki/{name}"},
+    }}
+    CompoundCache.open(":memory:")
+    PropertyCache.open(":memory:")
+    for i, name in enumerate(NAMES):
+        CompoundCache.store("name", name, {"cid": i, "canonical_smiles": name.upper(), "connectivity_smiles": name.upper()})
+    agent = PhysicalPropertyAgent(entity)
+
+    print(f"{len(NAMES)} compounds, {len(PROPERTIES)} properties, {LATENCY * 1e3:.0f} ms per response")
+    print(f"{'source':12}{'serial (s)':>12}{'requests':>10}{'concurrent (s)':>16}{'requests':>10}{'same':>6}")
+    for source, serial, concurrent in [
+        ("pubchem", lambda *args: serial_pubchem(agent, *args), agent.query_pubchem),
+        ("chemspider", lambda *args: serial_chemspider(agent, *args), agent.query_chemspider),
+        ("wikipedia", None, agent.query_wikipedia),
+    ]:
+        PropertyCache.cache_clear()
+        timing, count, res = run(concurrent, NAMES, PROPERTIES)
+        if serial:
+            serial_timing, serial_count, serial_res = run(serial, NAMES, PROPERTIES)
+            print(f"{source:12}{serial_timing:>12.3f}{serial_count:>10}{timing:>16.3f}{count:>10}{str(serial_res == res):>6}")
+        else:
+            print(f"{source:12}{'':>12}{'':>10}{timing:>16.3f}{count:>10}")
+
+    print(f"{'source':12}{'fresh (us)':>12}{'requests':>10}{'stale (us)':>12}{'requests':>10}{'same':>6}")
+    for source, query in [("pubchem", agent.query_pubchem), ("chemspider", agent.query_chemspider), ("wikipedia", agent.query_wikipedia)]:
+        res = query(NAMES, PROPERTIES)
+        fresh_timing, fresh_count, fresh_res = run_cached(query, NAMES, PROPERTIES)
+        PropertyCache.ttl = 0
+        stale_timing, _, stale_res = run_cached(query, NAMES, PROPERTIES)
+        PropertyCache.ttl = PropertyCache.stale_ttl
+        # wait for the background revalidation started by the first stale query
+        while PropertyCache.revalidating:
+            time.sleep(LATENCY)
+        same = fresh_res == res and stale_res == res
+        print(f"{source:12}{fresh_timing * 1e6:>12.1f}{fresh_count:>10}{stale_timing * 1e6:>12.1f}{MockHandler.requests:>10}{str(same):>6}")
+    print(PropertyCache.cache_info())
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
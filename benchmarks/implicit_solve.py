@@ -0,0 +1,74 @@
+"""Benchmark of cached implicit equations (SOLVE START/SOLVE END laws) of generated scipy models.
+
+Implicit laws whose inputs do not depend on the state are solved in the parameter part, once per simulation,
+by `solve_implicit`, which caches roots across simulations by the inputs of the law. For every bundled case with
+implicit laws, the model is simulated repeatedly on all operating conditions, as in calibration, with
+`solve_implicit` and with the cold `fsolve` it replaces, counting and timing the `fsolve` calls of both. As cached
+roots are solved from the same initial guess, the benchmark fails if the outlets of both differ.
+
+Usage (with graphdb running):
+    python -m benchmarks.implicit_solve
+"""
+import time
+
+import numpy as np
+from scipy.optimize import fsolve
+
+from app.utils.model_agent import ModelAgent
+from .cases import CASES, load_case, query_entity
+
+
+class CountedSolve:
+    """`fsolve` counting its calls and their time."""
+
+    def __init__(self):
+        self.calls = 0
+        self.time = 0
+
+    def __call__(self, *args, **kwargs):
+        start = time.perf_counter()
+        res = fsolve(*args, **kwargs)
+        self.time += time.perf_counter() - start
+        self.calls += 1
+        return res
+
+
+def run(scipy_model, values, repeat, cached):
+    counted_solve = CountedSolve()
+    scipy_model["fsolve"] = counted_solve
+    scipy_model["implicit_solutions"].clear()
+    solve_implicit = scipy_model["solve_implicit"]
+    if not cached:
+        scipy_model["solve_implicit"] = lambda name, func, x0, inputs: counted_solve(func, x0, xtol=1e-6, maxfev=1000)[0]
+    outlets = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for value in values:
+            res = scipy_model["simulate"](np.array([]), np.array(value, dtype=np.float64), outlet=True)
+            outlets.append(res[1] if res else np.nan)
+    timing = time.perf_counter() - start
+    scipy_model["solve_implicit"] = solve_implicit
+    return timing, counted_solve, np.array(outlets, dtype=np.float64)
+
+
+def main(repeat=10):
+    entity = query_entity()
+    print(f"{'case':16}{'simulations':>13}{'fsolve cold':>13}{'fsolve cached':>15}{'cold (s)':>10}{'cached (s)':>12}{'total (s)':>11}")
+    for case in CASES:
+        model_context, keys, values = load_case(case)
+        code = ModelAgent(entity, model_context).to_scipy_model(vectorized=True, operating_keys=keys)
+        if "solve_implicit(" not in code:
+            print(f"{case:16}{repeat * len(values):>13}{0:>13}{0:>15}")
+            continue
+        scipy_model = {}
+        exec(code, scipy_model)
+        timing_cold, solve_cold, outlets_cold = run(scipy_model, values, repeat, cached=False)
+        timing, solve, outlets = run(scipy_model, values, repeat, cached=True)
+        print(f"{case:16}{repeat * len(values):>13}{solve_cold.calls:>13}{solve.calls:>15}"
+              f"{solve_cold.time:>10.3f}{solve.time:>12.3f}{timing:>11.3f}")
+        if not np.array_equal(outlets, outlets_cold, equal_nan=True):
+            raise SystemExit(f"Outlets of {case} changed by cached implicit solves")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Benchmark of the content-keyed MathML translation caches during code generation.
+
+Without the caches every `MMLExpression` call parses its MathML, so the number of
+parses before equals the number of calls; with the caches only misses are parsed.
+
+Usage (with graphdb running):
+    python -m benchmarks.mml_cache
+"""
+import time
+
+from app.utils.mml_expression import MMLExpression
+from app.utils.model_agent import ModelAgent
+from .cases import CASES, load_case, query_entity
+
+
+# generation modes used by the simulation and calibration agents
+MODES = [{}, {"vectorized": True}, {"vectorized": True, "theta_keys": []}]
+
+
+def generate(entity, model_contexts):
+    start = time.perf_counter()
+    for model_context, keys in model_contexts:
+        for mode in MODES:
+            ModelAgent(entity, model_context).to_scipy_model(operating_keys=keys if "theta_keys" in mode else None, **mode)
+    return time.perf_counter() - start
+
+
+def report(name, info, timings):
+    calls = info.hits + info.misses
+    print(f"{name:10}{calls:>8}{info.misses:>8}{calls / max(info.misses, 1):>8.1f}"
+          f"{timings[0]:>12.3f}{timings[1]:>12.3f}")
+
+
+def main():
+    print(f"{'target':10}{'calls':>8}{'parses':>8}{'ratio':>8}{'cold (s)':>12}{'warm (s)':>12}")
+    MMLExpression.cache_clear()
+    entity = query_entity()
+    model_contexts = [load_case(case)[:2] for case in CASES]
+    timings = [generate(entity, model_contexts), generate(entity, model_contexts)]
+    report("numpy", MMLExpression.cache_info()["numpy"], timings)
+
+    for mode in ["sidebar", "mainpage"]:
+        timings = []
+        for _ in range(2):
+            start = time.perf_counter()
+            query_entity(mode)
+            timings.append(time.perf_counter() - start)
+        report(mode, MMLExpression.cache_info()[mode], timings)
+
+
+if __name__ == "__main__":
+    main()
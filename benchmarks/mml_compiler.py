@@ -0,0 +1,232 @@
+"""Conformance and timing of the MathML-to-numpy compiler against the previous conversion.
+
+The previous conversion re-parsed every nested element with iterparse and sanitized the expression of every
+level with regular expressions, the compiler walks the parsed tree once into tokens and prints them once.
+Every law, definition and model variable symbol of the ontology is converted by both implementations,
+with and without postfix, and the expressions and variables must be identical.
+
+Usage (with graphdb running):
+    python -m benchmarks.mml_compiler
+"""
+import re
+import time
+from io import BytesIO
+
+from lxml import etree
+
+from app.utils.mml_expression import MMLExpression
+from .cases import query_entity
+
+
+def legacy_sanitize_numpy(numpy_expr):
+    """Previous `MMLExpression.sanitize_numpy`, sanitizing numpy expression by adjusting spaces and brackets"""
+    sanitize_numpy_expr = []
+    for sub_numpy_expr in numpy_expr.split("\n"):
+        match = re.match(r"^ +", sub_numpy_expr)
+        pos = match.span()[1] if match else 0
+        sub_numpy_expr = sub_numpy_expr[:pos] + re.sub(" +", " ", sub_numpy_expr[pos:])
+        sub_numpy_expr = sub_numpy_expr.rstrip(" ")
+        sub_numpy_expr = re.sub(r" *:", ":", sub_numpy_expr)
+        sub_numpy_expr = re.sub(r" *\[ *", " [", sub_numpy_expr)
+        sub_numpy_expr = re.sub(r" *\] *", "] ", sub_numpy_expr)
+        sub_numpy_expr = re.sub(r"\( *", "(", sub_numpy_expr)
+        sub_numpy_expr = re.sub(r" *\)", ")", sub_numpy_expr)
+        sub_numpy_expr = re.sub(r"\(\(([^\(\)]*)\)\)", r"(\1)", sub_numpy_expr)
+        sub_numpy_expr = re.sub(r"\(\(([^\(\)]*)\(([^\(\)]*)\)\)\)", r"(\1(\2))", sub_numpy_expr)
+        sub_numpy_expr = re.sub(r" *(\[[^ <>\[\]]+(\[[:0-9]+\])* [<>] 0\])", r"\1", sub_numpy_expr)
+        sub_numpy_expr = re.sub(r"\(\(((\(([^\(\)]*)\)([^\(\)]*))+)\)\)", r"(\1)", sub_numpy_expr)
+        sub_numpy_expr = re.sub(r"\(np.sum\(([^\(\)]+)\)\)", r"np.sum(\1)", sub_numpy_expr)
+        sub_numpy_expr = re.sub(r"\(np.prod\(([^\(\)]+)\)\)", r"np.prod(\1)", sub_numpy_expr)
+        sub_numpy_expr = re.sub(r"(?<!len)(?<!np\.exp)(?<!np\.sum)(?<!np\.prod)(?<!np\.maximum)(?<!np\.matmul)\(([^\+\-\*\/\,]*)\)", r"\1", sub_numpy_expr)
+        sanitize_numpy_expr.append(sub_numpy_expr)
+    sanitize_numpy_expr = "\n".join(sanitize_numpy_expr)
+    return sanitize_numpy_expr
+
+
+def legacy_mml2numpy(mml_str, postfix=""):
+    """Previous `MMLExpression.mml2numpy`, re-serializing and re-parsing every nested element"""
+    expr = ""
+    vars = []
+    level = 0
+    context = etree.iterparse(BytesIO(mml_str), events=("start", "end"))
+    for action, elem in context:
+        # tag:mfrac
+        if action == "start" and elem.tag == "mfrac":
+            if level == 0:
+                l_mml_str = etree.tostring(elem[0])
+                r_mml_str = etree.tostring(elem[1])
+                l_expr, l_vars = legacy_mml2numpy(l_mml_str, postfix)
+                r_expr, r_vars = legacy_mml2numpy(r_mml_str, postfix)
+                expr += f"({l_expr}) / ({r_expr}) "
+                vars.extend(l_vars + r_vars)
+            level += 1
+        if action == "end" and elem.tag == "mfrac":
+            level -= 1
+        # tag:mi
+        if action == "start" and elem.tag == "mi" and level == 0:
+            mi_expr = elem.text.strip(" ")
+            expr += f"{mi_expr}{postfix} "
+            vars.append(mi_expr)
+        # tag:mn
+        if action == "start" and elem.tag == "mn" and level == 0:
+            mn_expr = elem.text.strip(" ")
+            for k, v in MMLExpression.mml_numpy_map.items():
+                mn_expr = mn_expr.replace(k, v)
+            expr += f"{mn_expr} "
+        # tag:mo
+        if action == "start" and elem.tag == "mo" and level == 0:
+            mo_expr = elem.text.strip(" ")
+            for k, v in MMLExpression.mml_numpy_map.items():
+                mo_expr = mo_expr.replace(k, v)
+            expr += f"{mo_expr} "
+        # tag:mrow
+        if action == "start" and elem.tag == "mrow":
+            if level == 0:
+                if elem[0].tag == "mo":
+                    l_mml_str = elem[0].text.strip(" ")
+                    l_expr, l_vars = legacy_mml2numpy(b"<math>" + etree.tostring(elem[0]) + b"</math>")
+                    r_mml_str = b"".join([etree.tostring(e) for e in elem[1:]])
+                    r_mml_str = b"<math>" + r_mml_str + b"</math>"
+                    r_expr, r_vars = legacy_mml2numpy(r_mml_str, postfix)
+                    if l_mml_str == "[":
+                        expr += f"{l_expr}{r_expr}"
+                    elif l_mml_str == "len":
+                        expr += f"len({r_expr}) "
+                        vars.extend(r_vars)
+                    elif l_mml_str == "exp":
+                        expr += f"np.exp({r_expr}) "
+                        vars.extend(r_vars)
+                    elif l_mml_str == "∑":
+                        expr += f"np.sum({r_expr}) "
+                        vars.extend(r_vars)
+                    elif l_mml_str == "∏":
+                        expr += f"np.prod({r_expr}) "
+                        vars.extend(r_vars)
+                        vars.extend(r_vars)
+                    elif l_mml_str == "maximum":
+                        first_mml_str = etree.tostring(elem[1])
+                        first_mml_str = b"<math>" + first_mml_str + b"</math>"
+                        first_expr, first_vars = legacy_mml2numpy(first_mml_str, postfix)
+                        second_mml_str = etree.tostring(elem[2])
+                        second_mml_str = b"<math>" + second_mml_str + b"</math>"
+                        second_expr, second_vars = legacy_mml2numpy(second_mml_str, postfix)
+                        expr += f"np.maximum({first_expr}, {second_expr})"
+                        vars.extend(first_vars)
+                        vars.extend(second_vars)
+                    elif l_mml_str == "matmul":
+                        first_mml_str = etree.tostring(elem[1])
+                        first_mml_str = b"<math>" + first_mml_str + b"</math>"
+                        first_expr, first_vars = legacy_mml2numpy(first_mml_str, postfix)
+                        second_mml_str = etree.tostring(elem[2])
+                        second_mml_str = b"<math>" + second_mml_str + b"</math>"
+                        second_expr, second_vars = legacy_mml2numpy(second_mml_str, postfix)
+                        expr += f"np.matmul({first_expr}, {second_expr})"
+                        vars.extend(first_vars)
+                        vars.extend(second_vars)
+                    else:
+                        expr += f"{l_expr}{r_expr}"
+                        vars.extend(r_vars)
+                elif len(elem) == 3 and elem[0].tag == "msub" and elem[1].tag == "mspace" and elem[2].tag == "mi":
+                    # for variables like k_La
+                    l_expr, l_vars = legacy_mml2numpy(b"<math>" + etree.tostring(elem[0]) + b"</math>")
+                    r_expr, r_vars = legacy_mml2numpy(b"<math>" + etree.tostring(elem[2]) + b"</math>")
+                    expr += f"{l_expr}{r_expr} "
+                    vars.extend(f"{l_expr}{r_expr}")
+                else:
+                    sub_mml_str = b"".join([etree.tostring(e) for e in elem])
+                    sub_mml_str = b"<math>" + sub_mml_str + b"</math>"
+                    sub_expr, sub_vars = legacy_mml2numpy(sub_mml_str, postfix)
+                    expr += f"{sub_expr} "
+                    vars.extend(sub_vars)
+            level += 1
+        if action == "end" and elem.tag == "mrow":
+            level -= 1
+        # tag:mspace
+        if action == "start" and elem.tag == "mspace":
+            expr += " " * int(elem.attrib["nspace"])
+        # tag:msqrt
+        if action == "start" and elem.tag == "msqrt":
+            if level == 0:
+                sub_mml_str = b"".join([etree.tostring(e) for e in elem])
+                sub_mml_str = b"<math>" + sub_mml_str + b"</math>"
+                sub_expr, sub_vars = legacy_mml2numpy(sub_mml_str, postfix)
+                expr += f"({sub_expr}) ** 0.5 "
+                vars.extend(sub_vars)
+            level += 1
+        if action == "end" and elem.tag == "msqrt":
+            level -= 1
+        # tag:msub
+        if action == "start" and elem.tag == "msub":
+            if level == 0:
+                l_mml_str = etree.tostring(elem[0])
+                r_mml_str = etree.tostring(elem[1])
+                l_expr, _ = legacy_mml2numpy(l_mml_str)
+                r_expr, _ = legacy_mml2numpy(r_mml_str)
+                expr += f"{l_expr}_{r_expr}{postfix} "
+                vars.append(f"{l_expr}_{r_expr}")
+            level += 1
+        if action == "end" and elem.tag == "msub":
+            level -= 1
+        # tag:msup
+        if action == "start" and elem.tag == "msup":
+            if level == 0:
+                l_mml_str = etree.tostring(elem[0])
+                r_mml_str = etree.tostring(elem[1])
+                l_expr, l_vars = legacy_mml2numpy(l_mml_str, postfix)
+                r_expr, r_vars = legacy_mml2numpy(r_mml_str, postfix)
+                expr += f"({l_expr}) ** ({r_expr}) "
+                vars.extend(l_vars + r_vars)
+            level += 1
+        if action == "end" and elem.tag == "msup":
+            level -= 1
+        # tag:mtext
+        if action == "start" and elem.tag == "mtext" and level == 0:
+            mtext_expr = elem.text.replace(",", "_").strip(" ")
+            expr += mtext_expr
+    expr = legacy_sanitize_numpy(expr)
+    vars = sorted(list(set(vars)))
+    return expr, vars
+
+
+def formulas(entity):
+    mml_strs = []
+    for law in entity["law"].values():
+        mml_strs.extend([law["formula"], law["formula_integrated_with_accumulation"]])
+    mml_strs.extend(definition["formula"] for definition in entity["definition"].values())
+    mml_strs.extend(model_variable["symbol"] for model_variable in entity["model_variable"].values())
+    return [mml_str for mml_str in mml_strs if mml_str]
+
+
+def main(repeat=5):
+    entity = query_entity()
+    elems = []
+    for mml_str in formulas(entity):
+        root = MMLExpression.sanitize_etree(etree.fromstring(mml_str))
+        elems.extend(root.getchildren())
+    mml_strs = [b"<math>" + etree.tostring(elem) + b"</math>" for elem in elems]
+
+    mismatches = 0
+    for elem, mml_str in zip(elems, mml_strs):
+        for postfix in ["", "_in"]:
+            if MMLExpression.elems2numpy([elem], postfix) != legacy_mml2numpy(mml_str, postfix):
+                mismatches += 1
+                print(f"mismatch ({postfix!r}): {mml_str.decode('utf-8')}")
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for mml_str in mml_strs:
+            legacy_mml2numpy(mml_str)
+    legacy_timing = (time.perf_counter() - start) / repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for elem in elems:
+            MMLExpression.elems2numpy([elem])
+    timing = (time.perf_counter() - start) / repeat
+
+    print(f"{len(elems)} expressions, {mismatches} mismatches")
+    print(f"previous conversion: {legacy_timing * 1e3:.2f} ms")
+    print(f"token compiler:      {timing * 1e3:.2f} ms  (x{legacy_timing / timing:.1f})")
+
+
+if __name__ == "__main__":
+    main()
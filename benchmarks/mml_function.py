@@ -0,0 +1,97 @@
+"""Conformance and timing of MathML closures against executed numpy source code.
+
+Every law and definition formula of the ontology is evaluated by `MMLExpression.to_function` and by the
+function `ScipyModelCode.add_function` generates from `to_numpy`, on the same random variables.
+Formulas which cannot be executed as source code (e.g. derivative notations) are skipped.
+
+Usage (with graphdb running):
+    python -m benchmarks.mml_function
+"""
+import re
+import time
+
+import numpy as np
+
+from app.utils.mml_expression import MMLExpression
+from app.utils.model_agent import ScipyModelCode
+from .cases import query_entity
+
+
+def formulas(entity):
+    for law in entity["law"].values():
+        yield law["formula"]
+        if law["formula_integrated_with_accumulation"]:
+            yield law["formula_integrated_with_accumulation"]
+    for definition in entity["definition"].values():
+        yield definition["formula"]
+
+
+def variables(numpy_code):
+    """Variables of numpy code, the `vars` of `mml2numpy` miss names like `k_La`"""
+    words = set(re.findall(r"(?<![\w.])[^\W\d]\w*", numpy_code))
+    return sorted(words - {"np", "len", "fsolve", "and", "or", "not", "if", "elif", "else", "def", "return", "xtol", "maxfev", "error"})
+
+
+def exec_function(mml_str, symbols):
+    code = ScipyModelCode()
+    code.codes = ["import numpy as np", "from scipy.optimize import fsolve"]
+    code.add_function("formula", symbols, MMLExpression(mml_str).to_numpy(), 0)
+    scipy_model = {}
+    exec(code.get_model(), scipy_model)
+    return scipy_model["calc_formula"]
+
+
+@np.errstate(all="ignore")
+def main(repeat=1000):
+    entity = query_entity()
+    rng = np.random.default_rng(0)
+    timings = {"exec build": 0., "closure build": 0., "exec call": 0., "closure call": 0.}
+    checked, skipped, mismatches = 0, 0, []
+    for mml_str in set(formulas(entity)):
+        if "specifically defined" in mml_str:
+            continue
+        symbols = variables(MMLExpression(mml_str).to_numpy())
+        try:
+            start = time.perf_counter()
+            function = exec_function(mml_str, symbols)
+            timings["exec build"] += time.perf_counter() - start
+        except SyntaxError:
+            skipped += 1
+            continue
+        # species vectors, or scalars for formulas with conditions
+        for shape in [3, None]:
+            namespace = {s: rng.uniform(0.5, 2.0, shape) for s in symbols}
+            namespace.update({s: np.array([-1, -1, 1]) for s in symbols if s == "ν" and shape})
+            try:
+                expected = function(**namespace)
+                break
+            except (ValueError, NameError):
+                expected = None
+        if expected is None:
+            skipped += 1
+            continue
+        start = time.perf_counter()
+        closure = MMLExpression(mml_str).to_function()
+        timings["closure build"] += time.perf_counter() - start
+        if not np.allclose(closure(namespace), expected, equal_nan=True):
+            mismatches.append(MMLExpression(mml_str).to_numpy())
+        checked += 1
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            function(**namespace)
+        timings["exec call"] += time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(repeat):
+            closure(namespace)
+        timings["closure call"] += time.perf_counter() - start
+
+    print(f"{checked} formulas, {skipped} skipped, {len(mismatches)} mismatches")
+    for numpy_code in mismatches:
+        print(numpy_code, "\n")
+    print(f"build:  exec {timings['exec build'] * 1e3:.2f} ms, closure {timings['closure build'] * 1e3:.2f} ms")
+    print(f"{repeat} calls: exec {timings['exec call'] * 1e3:.2f} ms, closure {timings['closure call'] * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
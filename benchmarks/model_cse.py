@@ -0,0 +1,56 @@
+"""Benchmark of common subexpression elimination in the right-hand side of generated scipy models.
+
+For every bundled case, the operations saved per evaluation are read from the generated model,
+and the simulations with and without elimination are timed and compared on all operating conditions.
+As a regression check of the elimination, the benchmark fails if their outlets differ by more than `RTOL`.
+
+Usage (with graphdb running):
+    python -m benchmarks.model_cse
+"""
+import re
+import time
+
+import numpy as np
+
+from app.utils.model_agent import ModelAgent
+from .cases import CASES, load_case, query_entity
+
+
+# relative tolerance of outlets with elimination, which only reorders the operations of shared subexpressions
+RTOL = 1e-9
+
+
+def load_simulate(entity, model_context, keys, cse):
+    code = ModelAgent(entity, model_context).to_scipy_model(vectorized=True, operating_keys=keys, cse=cse)
+    scipy_model = {}
+    exec(code, scipy_model)
+    return code, scipy_model["simulate"]
+
+
+def run(simulate, values):
+    outlets = []
+    start = time.perf_counter()
+    for value in values:
+        res = simulate(np.array([]), np.array(value, dtype=np.float64), outlet=True)
+        outlets.append(res[1] if res else np.nan)
+    return time.perf_counter() - start, np.array(outlets, dtype=np.float64)
+
+
+def main():
+    entity = query_entity()
+    print(f"{'case':16}{'shared':>8}{'ops saved':>11}{'before (s)':>12}{'after (s)':>11}{'max deviation':>15}")
+    for case in CASES:
+        model_context, keys, values = load_case(case)
+        _, simulate = load_simulate(entity, model_context, keys, cse=False)
+        code, simulate_cse = load_simulate(entity, model_context, keys, cse=True)
+        match = re.search(r"# COMMON SUBEXPRESSIONS: (\d+), (\d+) operations", code)
+        shared, ops = match.groups() if match else (0, 0)
+        timing, outlets = run(simulate, values)
+        timing_cse, outlets_cse = run(simulate_cse, values)
+        print(f"{case:16}{shared:>8}{ops:>11}{timing:>12.3f}{timing_cse:>11.3f}{np.nanmax(np.abs(outlets - outlets_cse)):>15.2e}")
+        if not np.allclose(outlets_cse, outlets, rtol=RTOL, atol=0, equal_nan=True):
+            raise SystemExit(f"Outlets of {case} changed by common subexpression elimination")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Latency of RMG solubility queries against a local stand-in of the RMG solubility search.
+
+The stand-in answers with a table row per pair after `LATENCY` seconds plus `PAIR_LATENCY` seconds per pair.
+`SoluteSolubilityAgent.query_rmg` is timed against the single URL of the full solvent x solute cross product it
+replaced, for a first query, the same query again and the query with one more solute, and the number of
+requests, pairs sent and longest URL are reported. Compounds are preloaded in an in-memory `CompoundCache`.
+
+Usage:
+    python -m benchmarks.rmg_fetch
+"""
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+from bs4 import BeautifulSoup
+
+from app.utils.compound_cache import CompoundCache
+from app.utils.http_client import HttpClient
+from app.utils.solute_solubility_agent import SoluteSolubilityAgent
+
+
+LATENCY = 0.05
+PAIR_LATENCY = 0.001
+SOLVENTS = ["water", "methanol", "ethanol", "acetone", "toluene", "hexane", "chloroform", "acetonitrile", "dmso", "thf", "ethyl acetate", "heptane"]
+SOLUTES = [f"solute {i}" for i in range(20)]
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    requests = 0
+    pairs = 0
+    url_length = 0
+
+    def do_GET(self):
+        spans = dict(span.split("=", 1) for span in unquote(self.path.split("searchSolubility/")[1]).split("__"))
+        pairs = list(zip(spans["solv"].split("_"), spans["solu"].split("_"), spans["T"].split("_")))
+        MockHandler.requests += 1
+        MockHandler.pairs += len(pairs)
+        MockHandler.url_length = max(MockHandler.url_length, len(self.path))
+        time.sleep(LATENCY + PAIR_LATENCY * len(pairs))
+        rows = ["<tr>" + "<th>x</th>" * 12 + "</tr>"]
+        for solv, solu, temperature in pairs:
+            log_solubility = "-" if "-" in [solv, solu] else f"{self.log_solubility(solv, solu, float(temperature)):.3f}"
+            rows.append("<tr>" + "<td>x</td>" * 11 + f"<td>{log_solubility}</td></tr>")
+        body = f"<html><body><table>{''.join(rows)}</table></body></html>"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body.encode())))
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_solubility(self, solv, solu, temperature):
+        return zlib.crc32(f"{solv} {solu} {temperature:g}".encode()) % 4000 / 1000 - 3
+
+    def log_message(self, format, *args):
+        pass
+
+
+def single_url_rmg(agent, solution):
+    solv_compounds = [agent.get_compound(solvent) for solvent in solution["solvents"]]
+    solu_compounds = [agent.get_compound(solute) for solute in solution["solutes"]]
+    solv_smis = [compound["connectivity_smiles"] if isinstance(compound, dict) else "-" for compound in solv_compounds]
+    solu_smis = [compound["connectivity_smiles"] if isinstance(compound, dict) else "-" for compound in solu_compounds]
+    temperature = solution.get("temperature", 298)
+    solv_span = "_".join(["_".join([solv_smi] * len(solu_compounds)) for solv_smi in solv_smis])
+    solu_span = "_".join(["_".join(solu_smis)] * len(solv_compounds))
+    temperature_span = "_".join([str(temperature)] * (len(solu_compounds) * len(solv_compounds)))
+    none_span = "_".join(["None"] * (len(solu_compounds) * len(solv_compounds)))
+    url = agent.rmg_url.replace("{solv}", solv_span).replace("{solu}", solu_span).replace("{temperature}", temperature_span) \
+        .replace("{ref_solv}", none_span).replace("{ref_s}", none_span).replace("{ref_t}", none_span) \
+        .replace("{h_sub}", none_span).replace("{c_pg}", none_span).replace("{c_ps}", none_span) \
+        .replace("#", "%23")
+    soup = BeautifulSoup(HttpClient.get(url).text, features="lxml")
+    solubility = [tr.find_all("td")[11].text for tr in soup.find_all("tr")[1:]]
+    solubility = [
+        [
+            str(round(10 ** float(solubility[i * len(solu_compounds) + j]), 3)) if solubility[i * len(solu_compounds) + j] != "-" else "-"
+            for j in range(len(solu_compounds))
+        ] for i in range(len(solv_compounds))
+    ]
+    return {"value": solubility, "reference": url}
+
+
+def run(query, solution):
+    MockHandler.requests, MockHandler.pairs, MockHandler.url_length = 0, 0, 0
+    start = time.perf_counter()
+    res = query(solution)
+    return time.perf_counter() - start, res
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    CompoundCache.open(":memory:")
+    for i, name in enumerate(SOLVENTS + SOLUTES):
+        # names are not formulas, as rejected by PubChem
+        CompoundCache.store("formula", name, None, error="mock")
+        CompoundCache.store("name", name, {"cid": i, "canonical_smiles": f"C{i}#N", "connectivity_smiles": f"C{i}#N"})
+    agent = SoluteSolubilityAgent({})
+    agent.rmg_url = agent.rmg_url.replace("https://rmg.mit.edu", f"http://127.0.0.1:{server.server_port}")
+
+    print(f"{len(SOLVENTS)} solvents x {len(SOLUTES)} solutes, {LATENCY * 1e3:.0f} ms + {PAIR_LATENCY * 1e3:.0f} ms per pair")
+    print(f"{'query':16}{'implementation':>16}{'time (s)':>10}{'requests':>10}{'pairs':>7}{'longest URL':>13}{'same':>6}")
+    for query, solution in [
+        ("first", {"solvents": SOLVENTS, "solutes": SOLUTES}),
+        ("same again", {"solvents": SOLVENTS, "solutes": SOLUTES}),
+        ("one more solute", {"solvents": SOLVENTS, "solutes": SOLUTES + ["water"]}),
+    ]:
+        single_timing, single_res = run(lambda solution: single_url_rmg(agent, solution), solution)
+        print(f"{query:16}{'single URL':>16}{single_timing:>10.3f}{MockHandler.requests:>10}{MockHandler.pairs:>7}{MockHandler.url_length:>13}")
+        timing, res = run(agent.query_rmg, solution)
+        print(f"{'':16}{'chunked':>16}{timing:>10.3f}{MockHandler.requests:>10}{MockHandler.pairs:>7}{MockHandler.url_length:>13}{str(res == single_res):>6}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Benchmark of the local solubility surrogate against a stand-in of the RMG solubility search.
+
+The stand-in predicts a synthetic log solubility, bilinear in polarity and size of solvent and solute (as the
+linear free energy relationships behind RMG, with solvent-specific coefficients), with a nonlinear term and noise.
+The surrogate is trained on the RMG results of a random part of the pairs, then a full solvent x solute matrix is
+queried with RMG only (cold cache), with the surrogate (pairs without confidence from RMG), and with the surrogate
+while RMG answers 503 or is unreachable. The time, the pairs sent to RMG and the error of the surrogate values are reported.
+
+Usage:
+    python -m benchmarks.solubility_surrogate
+"""
+import random
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import numpy as np
+
+from app.utils.compound_cache import CompoundCache
+from app.utils.http_client import FakeSession, HttpClient
+from app.utils.solubility_surrogate import SolubilitySurrogate
+from app.utils.solute_solubility_agent import SoluteSolubilityAgent
+from .rmg_fetch import MockHandler
+
+
+SOLVENTS = {
+    "water": "O", "methanol": "CO", "ethanol": "CCO", "1-propanol": "CCCO", "2-propanol": "CC(C)O", "1-butanol": "CCCCO",
+    "acetone": "CC(=O)C", "butanone": "CCC(=O)C", "acetonitrile": "CC#N", "dmso": "CS(=O)C", "dmf": "CN(C)C=O",
+    "thf": "C1CCOC1", "1,4-dioxane": "C1COCCO1", "ethyl acetate": "CCOC(=O)C", "diethyl ether": "CCOCC",
+    "dichloromethane": "C(Cl)Cl", "chloroform": "C(Cl)(Cl)Cl", "toluene": "CC1=CC=CC=C1", "benzene": "C1=CC=CC=C1",
+    "hexane": "CCCCCC", "heptane": "CCCCCCC", "cyclohexane": "C1CCCCC1", "acetic acid": "CC(=O)O", "pyridine": "C1=CC=NC=C1",
+}
+SOLUTES = {
+    "benzoic acid": "C1=CC=C(C=C1)C(=O)O", "naphthalene": "C1=CC=C2C=CC=CC2=C1", "anthracene": "C1=CC=C2C=C3C=CC=CC3=CC2=C1",
+    "phenol": "C1=CC=C(C=C1)O", "caffeine": "CN1C=NC2=C1C(=O)N(C(=O)N2C)C", "aspirin": "CC(=O)OC1=CC=CC=C1C(=O)O",
+    "ibuprofen": "CC(C)CC1=CC=C(C=C1)C(C)C(=O)O", "paracetamol": "CC(=O)NC1=CC=C(C=C1)O", "urea": "C(=O)(N)N",
+    "salicylic acid": "C1=CC=C(C(=C1)C(=O)O)O", "acetanilide": "CC(=O)NC1=CC=CC=C1", "biphenyl": "C1=CC=C(C=C1)C2=CC=CC=C2",
+    "hexadecane": "CCCCCCCCCCCCCCCC", "glycine": "C(C(=O)O)N", "succinic acid": "C(CC(=O)O)C(=O)O", "benzamide": "C1=CC=C(C=C1)C(=O)N",
+    "nitrobenzene": "C1=CC=C(C=C1)[N+](=O)[O-]", "4-chlorophenol": "C1=CC(=CC=C1O)Cl", "pyrene": "C1=CC2=C3C(=C1)C=CC4=CC=CC(=C43)C=C2",
+    "camphor": "CC1(C)C2CCC1(C)C(=O)C2", "hydroquinone": "C1=CC(=CC=C1O)O", "phenanthrene": "C1=CC=C2C(=C1)C=CC3=CC=CC=C32",
+    "adipic acid": "C(CCC(=O)O)CC(=O)O", "vanillin": "COC1=C(C=CC(=C1)C=O)O", "benzil": "C1=CC=C(C=C1)C(=O)C(=O)C2=CC=CC=C2",
+    "stearic acid": "CCCCCCCCCCCCCCCCCC(=O)O", "theophylline": "CN1C2=C(C(=O)N(C1=O)C)NC=N2", "cholesterol": "CC(C)CCCC(C)C1CCC2C1(CCC3C2CC=C4C3(CCC(C4)O)C)C",
+    "sulfanilamide": "C1=CC(=CC=C1N)S(=O)(=O)N", "fluorene": "C1C2=CC=CC=C2C3=CC=CC=C31",
+}
+
+
+class SyntheticHandler(MockHandler):
+
+    def log_solubility(self, solv, solu, temperature):
+        solv_polar, solu_polar = [np.mean([atom in "NnOoS" for atom in re.findall(r"Cl|Br|[A-Za-z]", smiles)]) for smiles in [solv, solu]]
+        solu_size = len(re.findall(r"Cl|Br|[A-Za-z]", solu))
+        noise = random.Random(f"{solv} {solu}").gauss(0, 0.1)
+        return 0.5 + 3 * solv_polar * solu_polar - 1.5 * solu_polar - 0.1 * solu_size * (1 - 0.5 * solv_polar) \
+            + 0.3 * np.tanh(solu_size / 10 - 1) - 1.2 * (1000 / temperature - 1000 / 298) + noise
+
+
+def run(agent, solution):
+    MockHandler.requests, MockHandler.pairs = 0, 0
+    start = time.perf_counter()
+    res = agent.query_rmg(solution)
+    return time.perf_counter() - start, res
+
+
+def main(train_fraction=0.3):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SyntheticHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    CompoundCache.open(":memory:")
+    for i, (name, smiles) in enumerate({**SOLVENTS, **SOLUTES}.items()):
+        # names are not formulas, as rejected by PubChem
+        CompoundCache.store("formula", name, None, error="mock")
+        CompoundCache.store("name", name, {"cid": i, "canonical_smiles": smiles, "connectivity_smiles": smiles})
+    agent = SoluteSolubilityAgent({})
+    agent.rmg_url = agent.rmg_url.replace("https://rmg.mit.edu", f"http://127.0.0.1:{server.server_port}")
+    solution = {"solvents": list(SOLVENTS), "solutes": list(SOLUTES)}
+
+    # train on the RMG results of a random part of the pairs
+    rng = random.Random(0)
+    for solvent in SOLVENTS:
+        agent.query_rmg({"solvents": [solvent], "solutes": rng.sample(list(SOLUTES), int(train_fraction * len(SOLUTES)))})
+    model = SoluteSolubilityAgent.train_surrogate()
+    print(f"{len(SOLVENTS)} solvents x {len(SOLUTES)} solutes, surrogate trained on {int(model['pairs'])} pairs, "
+          f"residual standard deviation {float(model['residual_std']):.3f}")
+
+    SoluteSolubilityAgent.rmg_solubility.clear()
+    model, SolubilitySurrogate.model = SolubilitySurrogate.model, None
+    rmg_timing, rmg_res = run(agent, solution)
+    rmg_pairs = MockHandler.pairs
+    truth = np.log10(np.array(rmg_res["value"], dtype=float))
+
+    print(f"{'query':22}{'time (ms)':>11}{'RMG pairs':>11}{'surrogate':>11}{'uncertain':>11}{'mean error':>12}{'max error':>11}")
+    print(f"{'RMG only':22}{rmg_timing * 1e3:>11.1f}{rmg_pairs:>11}")
+    for query in ["surrogate", "surrogate, RMG busy", "surrogate, RMG down"]:
+        SoluteSolubilityAgent.rmg_solubility.clear()
+        SolubilitySurrogate.model = model
+        if query == "surrogate, RMG busy":
+            previous = HttpClient.set_session(FakeSession(lambda url, headers: (503, "busy")))
+        if query == "surrogate, RMG down":
+            server.shutdown()
+            server.server_close()
+        timing, res = run(agent, solution)
+        if query == "surrogate, RMG busy":
+            HttpClient.set_session(previous)
+        surrogate, uncertain = np.array(res["surrogate"]), np.array(res["uncertain"])
+        error = np.abs(np.log10(np.array(res["value"], dtype=float)) - truth)
+        # error of the values predicted with confidence
+        error = error[surrogate & ~uncertain] if (surrogate & ~uncertain).any() else np.zeros(1)
+        print(f"{query:22}{timing * 1e3:>11.1f}{MockHandler.pairs:>11}{surrogate.sum():>11}{uncertain.sum():>11}{error.mean():>12.3f}{error.max():>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Benchmark of the `/solvent_miscibility` lookup, per request as constructed by the route.
+
+The agent used to read and parse the table with `np.loadtxt` on every request and to look solvents up by
+`list.index`, now the table is loaded once per process and pairs are checked in a packed bit matrix. All pairs
+of the table are compared with the previous lookup, except the last solvent whose header name kept its newline
+and was never found before. Random solvent sets, with some unknown solvents, are then screened by one `query_many`
+call and compared with a `query_sigmaaldrich` call per set, best of `repeats` runs.
+
+Usage:
+    python -m benchmarks.solvent_miscibility
+"""
+import random
+import time
+
+import numpy as np
+
+from app.utils.solvent_miscibility_agent import SolventMiscibilityAgent
+
+
+TABLE_PATH = "app/data/solvent_miscibility_table.csv"
+ENTITY = {"data_source": {"SigmaAldrich": {"url": "https://www.sigmaaldrich.com"}}}
+
+
+class PreviousAgent():
+
+    def __init__(self, entity, solvent_miscibility_table_path):
+        self.entity = entity
+        with open(solvent_miscibility_table_path) as f:
+            self.solvents = [solvent.lower() for solvent in f.readline().split(",")[1:]]
+        self.solvent_miscibility_table = np.loadtxt(solvent_miscibility_table_path, delimiter=",", skiprows=1, usecols=range(1, len(self.solvents)+1), dtype=np.int32)
+
+    def query_sigmaaldrich(self, solvents):
+        solvents = [solvent.lower() for solvent in solvents]
+        if solvents[0] not in self.solvents or solvents[1] not in self.solvents:
+            return [f"Unknown miscibility: {', '.join(solvents)}", ""]
+        if self.solvent_miscibility_table[self.solvents.index(solvents[0])][self.solvents.index(solvents[1])] == 1:
+            return [f"Miscible: {', '.join(solvents)}", self.entity["data_source"]["SigmaAldrich"]["url"]]
+        return [f"Immiscible: {', '.join(solvents)}", self.entity["data_source"]["SigmaAldrich"]["url"]]
+
+
+def run(agent_class, pairs):
+    start = time.perf_counter()
+    res = [agent_class(ENTITY, TABLE_PATH).query_sigmaaldrich(pair) for pair in pairs]
+    return (time.perf_counter() - start) / len(pairs), res
+
+
+def main(sets=10000, repeats=5):
+    solvents = SolventMiscibilityAgent.load_table(TABLE_PATH)[0]
+    pairs = [[solvent_a, solvent_b] for solvent_a in solvents[:-1] for solvent_b in solvents[:-1]]
+    previous_timing, previous_res = run(PreviousAgent, pairs)
+    timing, res = run(SolventMiscibilityAgent, pairs)
+    print(f"{len(pairs)} requests of a pair, per request: previous {previous_timing * 1e6:.0f} us, now {timing * 1e6:.1f} us, same: {res == previous_res}")
+    agent = SolventMiscibilityAgent(ENTITY, TABLE_PATH)
+    for query in [["Water", "Xylene"], ["Water", "Ethanol", "Methanol"], ["Water", "Ethanol", "Hexane", "Toluene"]]:
+        print(agent.query_sigmaaldrich(query)[0])
+
+    rng = random.Random(0)
+    names = solvents + ["unknown solvent"]
+    solvent_sets = [rng.sample(names, rng.randint(2, 4)) for _ in range(sets)]
+    single_timing, batch_timing = float("inf"), float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        single = [agent.query_sigmaaldrich(solvent_set)[0].split(":")[0].split(" ")[0] for solvent_set in solvent_sets]
+        single_timing = min(single_timing, time.perf_counter() - start)
+        start = time.perf_counter()
+        batch = agent.query_many(solvent_sets)["result"]
+        batch_timing = min(batch_timing, time.perf_counter() - start)
+    # a set immiscible by a known pair and with an unknown solvent is unknown for `query_sigmaaldrich`
+    same = all(res["miscibility"] == expected or (res["unknown_pairs"] and expected == "Unknown") for res, expected in zip(batch, single))
+    print(f"{sets} solvent sets of 2 to 4 solvents: per set {single_timing * 1e3:.1f} ms, batch {batch_timing * 1e3:.1f} ms, same: {same}, "
+          f"immiscible {sum(res['miscibility'] == 'Immiscible' for res in batch)}, unknown {sum(res['miscibility'] == 'Unknown' for res in batch)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Benchmark matrix of solver settings of generated scipy models on the bundled cases.
+
+Each setting is compared with a tight Radau reference on outlet concentrations.
+The esterification case is run as plug flow (no axial dispersion) so that it is
+integrated by solve_ivp like the dushman case.
+
+Usage (with graphdb running):
+    python -m benchmarks.solver_matrix
+"""
+import itertools
+import time
+
+import numpy as np
+
+from app.utils.model_agent import ModelAgent
+from .cases import load_case, query_entity
+
+
+METHODS = ["LSODA", "BDF", "Radau"]
+TOLERANCES = [(1e-3, 1e-12), (1e-6, 1e-12)]
+REFERENCE = {"method": "Radau", "rtol": 1e-10, "atol": 1e-14, "decimals": None}
+
+
+def load_simulate(entity, model_context, keys, solver):
+    scipy_model = {}
+    exec(ModelAgent(entity, model_context).to_scipy_model(operating_keys=keys, solver=solver), scipy_model)
+    return scipy_model["simulate"]
+
+
+def run(simulate, values):
+    outlets = []
+    start = time.perf_counter()
+    for value in values:
+        res = simulate(np.array([]), np.array(value, dtype=np.float64))
+        outlets.append(res[1][:, -1] if res else np.nan)
+    return time.perf_counter() - start, np.array(outlets, dtype=np.float64)
+
+
+def main():
+    entity = query_entity()
+    for case in ["esterification", "dushman"]:
+        model_context, keys, values = load_case(case)
+        model_context["description"]["molecular_transport"] = [p for p in model_context["description"]["molecular_transport"] if p != "Axial_Dispersion"]
+        model_context["description"]["parameter_law"].pop("Dispersion_Coefficient", None)
+        _, reference = run(load_simulate(entity, model_context, keys, REFERENCE), values)
+
+        print(f"{case}: {len(values)} operating conditions")
+        print(f"{'method':8}{'rtol':>8}{'adaptive':>10}{'time (s)':>10}{'max outlet error':>18}")
+        for method, (rtol, atol), adaptive in itertools.product(METHODS, TOLERANCES, [False, True]):
+            solver = {"method": method, "rtol": rtol, "atol": atol, "adaptive": adaptive, "decimals": None}
+            timing, outlets = run(load_simulate(entity, model_context, keys, solver), values)
+            print(f"{method:8}{rtol:>8.0e}{str(adaptive):>10}{timing:>10.3f}{np.nanmax(np.abs(outlets - reference)):>18.2e}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
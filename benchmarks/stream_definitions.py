@@ -0,0 +1,59 @@
+"""Regression check of the per-stream definitions of generated scipy models.
+
+Definitions with a stream dimension (e.g. the ionic strength `I` of the dushman case) are written once per liquid
+stream, and the definition of a stream must read the concentrations of that stream only. For every bundled case,
+scalar and node-vectorized models are generated, the stream of each such definition and of each concentration it
+reads are compared, and the check fails on the first mismatch.
+
+Usage (with graphdb running):
+    python -m benchmarks.stream_definitions
+"""
+import re
+
+from app.utils.model_agent import ModelAgent
+from .cases import CASES, load_case, query_entity
+
+
+# stream definition in `derivative`, e.g. `I[1] = ...` or `I[..., 1] = ...`
+DEFINITION = re.compile(r"^ {8}(\w+)\[(?:\.\.\., )?(\d+)\] = (.*)$")
+# concentrations of a stream, e.g. `c[1]` or `c[..., 1, :]`
+CONCENTRATION = re.compile(r"(?<![\w.])c\[(?:\.\.\., )?(\d+)")
+
+
+def check(code):
+    """Definitions of the code reading concentrations of another stream.
+
+    Args:
+        code (str): generated scipy model
+
+    Returns:
+        list of str: definitions reading another stream, as `stream: line`
+    """
+    mismatches = []
+    for line in code.split("\n"):
+        match = DEFINITION.match(line)
+        if not match:
+            continue
+        streams = CONCENTRATION.findall(match.group(3))
+        if any(stream != match.group(2) for stream in streams):
+            mismatches.append(f"{match.group(2)}: {line.strip()}")
+    return mismatches
+
+
+def main():
+    entity = query_entity()
+    print(f"{'case':16}{'mode':12}{'definitions':>13}{'mismatches':>12}")
+    for case in CASES:
+        model_context, keys, _ = load_case(case)
+        for mode, vectorized in [("scalar", False), ("vectorized", True)]:
+            # without cse, as shared subexpressions would be hoisted out of the definitions
+            code = ModelAgent(entity, model_context).to_scipy_model(vectorized=vectorized, operating_keys=keys, cse=False)
+            definitions = sum(bool(DEFINITION.match(line)) for line in code.split("\n"))
+            mismatches = check(code)
+            print(f"{case:16}{mode:12}{definitions:>13}{len(mismatches):>12}")
+            if mismatches:
+                raise SystemExit(f"Stream definitions of {case} read another stream:\n" + "\n".join(mismatches))
+
+
+if __name__ == "__main__":
+    main()
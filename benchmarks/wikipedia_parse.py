@@ -0,0 +1,122 @@
+"""Benchmark of the extraction of chembox properties from saved Wikipedia pages, fully offline.
+
+`PhysicalPropertyAgent.parse_wikipedia` locates the rows of the requested properties by XPath, and is compared
+with the BeautifulSoup parsing it replaced, which rendered every row of two cells by `repr` and regular
+expressions. Pages are saved once, as `<name>.html` in the corpus directory, by `--save`.
+
+Usage:
+    python -m benchmarks.wikipedia_parse --save benchmarks/wikipedia app/data/solvent_miscibility_table.csv
+    python -m benchmarks.wikipedia_parse benchmarks/wikipedia
+"""
+import argparse
+import glob
+import os
+import re
+import time
+
+from bs4 import BeautifulSoup
+
+from app.utils.http_client import HttpClient
+from app.utils.physical_property_agent import PhysicalPropertyAgent
+
+
+WIKIPEDIA_URL = "https://en.wikipedia.org/wiki/{name}"
+PROPERTIES = ["Density", "Viscosity"]
+
+
+def parse_bs4(text, properties):
+    soup = BeautifulSoup(text, features="lxml")
+    trs = [tr for tr in soup.find_all("tr") if len(tr.find_all("td", recursive=False)) == 2]
+    wikipedia_res = {}
+    for tr in trs:
+        parameter_dict = []
+        if tr.select("td")[1].find("ul"):
+            for li in tr.select("td")[1].find_all("li")[:3]:
+                if ":" in li.text: continue
+                value = repr(li).strip().replace("\xa0", " ")
+                for sup in li.findChildren("sup" , recursive=False):
+                    if sup.find("a"):
+                        value = value.replace(repr(sup), "")
+                value = re.sub(r"<li[^<>]*>", "", value)
+                value = re.sub(r"</li>", "", value)
+                value = re.sub(r"<span[^<>]*>", "", value)
+                value = re.sub(r"</span>", "", value)
+                value = re.sub(r"<a[^<>]*>", "", value)
+                value = re.sub(r"</a>", "", value)
+                value = re.sub(r"<sup[^<>]*>[ \n]*</sup>", "", value)
+                value = value.strip()
+                if li.find("a"):
+                    if li.find("a").attrs["href"].startswith("/"):
+                        reference = ""
+                    elif li.find("a").attrs["href"].startswith("#"):
+                        reference = soup.find(id=li.find("a").attrs["href"][1:]).select("span")[1].text
+                    else:
+                        reference = li.find("a").attrs["href"]
+                else:
+                    reference = ""
+                parameter_dict.append({"value": value, "reference": reference})
+        else:
+            value = repr(tr.select("td")[1]).strip().replace("\xa0", " ")
+            for sup in tr.select("td")[1].findChildren("sup" , recursive=False):
+                if sup.find("a"):
+                    value = value.replace(repr(sup), "")
+            value = re.sub(r"<td[^<>]*>", "", value)
+            value = re.sub(r"</td>", "", value)
+            value = re.sub(r"<span[^<>]*>", "", value)
+            value = re.sub(r"</span>", "", value)
+            value = re.sub(r"<a[^<>]*>", "", value)
+            value = re.sub(r"</a>", "", value)
+            value = re.sub(r"<sup[^<>]*>[ \n]*</sup>", "", value)
+            value = value.strip()
+            if tr.select("td")[1].find("a"):
+                if tr.select("td")[1].find("a").attrs["href"].startswith("/"):
+                    reference = ""
+                elif tr.select("td")[1].find("a").attrs["href"].startswith("#"):
+                    reference = soup.find(id=tr.select("td")[1].find("a").attrs["href"][1:]).select("span")[1].text
+                else:
+                    reference = tr.select("td")[1].find("a").attrs["href"]
+            else:
+                reference = ""
+            parameter_dict.append({"value": value, "reference": reference})
+        wikipedia_res[tr.select("td")[0].text.strip().replace("\xa0", " ")] = parameter_dict
+    return {property: wikipedia_res[property] for property in properties if property in wikipedia_res}
+
+
+def save(corpus, path):
+    with open(path, encoding="utf-8-sig") as f:
+        names = [name.strip() for name in f.readline().split(",")[1:]]
+    headers = {'User-Agent': 'CoolBot/0.0 (https://example.org/coolbot/; coolbot@example.org)'}
+    urls = {name: WIKIPEDIA_URL.replace("{name}", name) for name in names}
+    responses = HttpClient.get_many(urls.values(), headers)
+    os.makedirs(corpus, exist_ok=True)
+    for name, url in urls.items():
+        with open(os.path.join(corpus, f"{name}.html"), "w", encoding="utf-8") as f:
+            f.write(responses[url].text)
+    print(f"Saved {len(names)} pages to {corpus}")
+
+
+def main(corpus, repeats=5):
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(corpus, "*.html"))):
+        with open(path, encoding="utf-8") as f:
+            pages[os.path.basename(path)[:-5]] = f.read()
+    print(f"{len(pages)} pages, {sum(map(len, pages.values())) / 1e6:.1f} MB, properties {PROPERTIES}")
+    print(f"{'parser':10}{'per page (ms)':>15}")
+    results = {}
+    for parser, parse in [("bs4", parse_bs4), ("xpath", PhysicalPropertyAgent.parse_wikipedia)]:
+        start = time.perf_counter()
+        for _ in range(repeats):
+            results[parser] = {name: parse(text, PROPERTIES) for name, text in pages.items()}
+        print(f"{parser:10}{(time.perf_counter() - start) / repeats / len(pages) * 1e3:>15.2f}")
+    different = [name for name in pages if results["bs4"][name] != results["xpath"][name]]
+    print(f"same: {not different}" + (f", different: {different}" if different else ""))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpus", help="Directory of saved Wikipedia pages")
+    parser.add_argument("--save", help="Path of a CSV file whose header lists the solvent pages to save")
+    args = parser.parse_args()
+    if args.save:
+        save(args.corpus, args.save)
+    main(args.corpus)
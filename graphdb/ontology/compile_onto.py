@@ -0,0 +1,97 @@
+import re
+import json
+import rdflib
+import argparse
+from mml_expression import MMLExpression, MML_TRANSLATOR_VERSION
+from patch_onto import PREFIX, var_classes
+
+
+def translate(mml_str):
+    try:
+        return [mml_str, MMLExpression(mml_str).to_numpy()]
+    except Exception as e:
+        print(f"Skipping untranslatable MathML ({type(e).__name__}): {mml_str}")
+        return None
+
+
+def compile_law(rdf):
+    laws = {}
+    sparql = (
+        f"{PREFIX}"
+        f"SELECT ?l ?f ?af\n"
+        "WHERE {\n"
+        f"    ?l rdf:type process_model:Law .\n"
+        f"    ?l ontomo:hasFormula ?f .\n"
+        f"    optional{{?l ontomo:hasFormulaIntegratedWithAccumulation ?af .}}\n"
+        "}"
+    )
+    for res in rdf.query(sparql):
+        law = {}
+        # same sanitization as GraphdbHandler.query_law
+        law["formula"] = translate(re.sub(r' xmlns=".*"', "", str(res[1])))
+        if res[2]:
+            law["formula_integrated_with_accumulation"] = translate(re.sub(r' xmlns=".*"', "", str(res[2])))
+        laws[str(res[0])] = {k: v for k, v in law.items() if v}
+    return laws
+
+
+def compile_definition(rdf):
+    definitions = {}
+    sparql = (
+        f"{PREFIX}"
+        f"SELECT ?d ?f\n"
+        "WHERE {\n"
+        f"    ?d rdf:type ontomo:Definition .\n"
+        f"    ?d ontomo:hasFormula ?f .\n"
+        "}"
+    )
+    for res in rdf.query(sparql):
+        # same sanitization as GraphdbHandler.query_definition
+        formula = translate(re.sub(r' xmlns=".*"', "", str(res[1])))
+        definitions[str(res[0])] = {"formula": formula} if formula else {}
+    return definitions
+
+
+def compile_var(rdf):
+    variables = {}
+    for var_class in var_classes:
+        ns = "mathematical_model" if var_class == "Constant" else "ontomo"
+        sparql = (
+            f"{PREFIX}"
+            f"SELECT ?v ?s\n"
+            "WHERE {\n"
+            f"    ?v rdf:type {ns}:{var_class} .\n"
+            f"    ?v ontomo:hasSymbol ?s .\n"
+            "}"
+        )
+        for res in rdf.query(sparql):
+            # same sanitization as GraphdbHandler.query_model_variable
+            symbol = re.sub(r' xmlns="[^"]*"', "", str(res[1]))
+            symbol = translate(re.sub(r'\n *', "", symbol))
+            variables[str(res[0])] = {"symbol": symbol} if symbol else {}
+    return variables
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--in_rdf", help="Path of the input RDF file of model ontology")
+    parser.add_argument(
+        "--out_json", help="Path of the output JSON file of precompiled numpy translations"
+    )
+    args = parser.parse_args()
+
+    # load input model ontology
+    rdf = rdflib.Graph()
+    rdf.parse(args.in_rdf, format="xml")
+
+    # translate formulas and symbols keyed by IRI
+    artifact = {
+        "version": MML_TRANSLATOR_VERSION,
+        "law": compile_law(rdf),
+        "definition": compile_definition(rdf),
+        "model_variable": compile_var(rdf),
+    }
+
+    # save output artifact
+    with open(args.out_json, "w") as f:
+        json.dump(artifact, f, indent=2, ensure_ascii=False)
@@ -1,7 +1,19 @@
+import json
+import operator
+import os
 import re
-from io import BytesIO
+import threading
+from functools import lru_cache
 
+import numpy as np
 from lxml import etree
+from scipy.optimize import fsolve
+
+
+# maximum number of cached translations per target language
+MML_CACHE_SIZE = 4096
+# version of the numpy translation, to be increased whenever `to_numpy` output changes
+MML_TRANSLATOR_VERSION = 1
 
 
 class MMLExpression:
@@ -18,6 +30,14 @@ class MMLExpression:
     - Nested `∑` or `∏` is not supported.
     - `∑` and `∏` are applied all over the dimension without specified limits by default.
 
+    Translations are cached by MathML content, so that repeated symbols and laws are parsed only once.
+    See `cache_info` and `cache_clear`. The numpy cache can be seeded with translations precompiled from
+    the ontology by `graphdb/ontology/compile_onto.py`, see `load_precompiled`.
+    Many expressions, e.g. all formulas of the ontology, are converted in one pass by `convert_many`.
+
+    Besides numpy source code, `to_function` compiles the parsed tree to a callable evaluating the formula
+    over numpy arrays, for callers assembling models without `exec`.
+
     This class follows the implementation path:
         MathML --> ElementTree --> Other languages
     
@@ -38,6 +58,12 @@ class MMLExpression:
     mml_sanitize_skip_mos = ["maximum", "matmul"]
     mml_sanitize_skip_tags = ["math", "mfrac", "msub", "msup"]
     mml_sanitize_term_tags = ["mfenced", "mfrac", "mi", "mn", "mrow", "msqrt", "msub", "msup"]
+    numpy_precedences = {"or": 1, "and": 2, "<": 4, "<=": 4, ">": 4, ">=": 4, "==": 4, "!=": 4, "+": 5, "-": 5, "*": 6, "/": 6, "**": 8}
+    numpy_operators = {"<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge, "==": operator.eq, "!=": operator.ne,
+                       "+": operator.add, "-": operator.sub, "*": operator.mul, "/": operator.truediv, "**": operator.pow}
+    conversions = {"numpy": "to_numpy", "function": "to_function", "sidebar": "to_sidebar_mml", "mainpage": "to_mainpage_mml"}
+    precompiled_numpy = {}
+    parsers = threading.local()
     
     def __init__(self, mml_str):
         """Construction function for MMLExpression class."""
@@ -62,14 +88,103 @@ class MMLExpression:
         return root
 
 
+    @staticmethod
+    def parse(mml_str):
+        """Parse MathML with the XML parser of the current thread, which is reused by all translations."""
+        if not hasattr(MMLExpression.parsers, "parser"):
+            MMLExpression.parsers.parser = etree.XMLParser()
+        return etree.fromstring(mml_str, MMLExpression.parsers.parser)
+
+
+    @staticmethod
+    def convert_many(mml_strs, target="numpy", postfix=""):
+        """Convert many MathML expressions at once, e.g. all formulas of the ontology.
+
+        Each distinct expression is translated once and shared by all its occurrences (mainpage dicts are copied
+        per occurrence, as callers edit them), translations are looked up in and kept by the translation caches.
+
+        Args:
+            mml_strs (list of str): MathML expressions
+            target (str): one of `numpy`, `function`, `sidebar` and `mainpage`
+            postfix (str): postfix of variables of `numpy` and `function` translations
+
+        Returns:
+            list: converted expressions in the order of `mml_strs`
+        """
+        if target not in MMLExpression.conversions:
+            raise ValueError(f"Unsupported conversion target: {target}")
+        kwargs = {"postfix": postfix} if target in ["numpy", "function"] else {}
+        converted = {mml_str: getattr(MMLExpression(mml_str), MMLExpression.conversions[target])(**kwargs) for mml_str in dict.fromkeys(mml_strs)}
+        if target == "mainpage":
+            return [dict(converted[mml_str]) for mml_str in mml_strs]
+        return [converted[mml_str] for mml_str in mml_strs]
+
+
+    @staticmethod
+    def cache_info():
+        """Statistics of the translation caches.
+
+        Returns:
+            dict: `functools._CacheInfo` of `numpy`, `function`, `sidebar` and `mainpage` translations and number of `precompiled` ones
+        """
+        return {
+            "precompiled": len(MMLExpression.precompiled_numpy),
+            "numpy": MMLExpression._to_numpy.cache_info(),
+            "function": MMLExpression._to_function.cache_info(),
+            "sidebar": MMLExpression._to_sidebar_mml.cache_info(),
+            "mainpage": MMLExpression._to_mainpage_mml.cache_info(),
+        }
+
+
+    @staticmethod
+    def cache_clear():
+        """Clear the translation caches, precompiled translations are kept."""
+        MMLExpression._to_numpy.cache_clear()
+        MMLExpression._to_function.cache_clear()
+        MMLExpression._to_sidebar_mml.cache_clear()
+        MMLExpression._to_mainpage_mml.cache_clear()
+
+
+    @staticmethod
+    def load_precompiled(path):
+        """Seed the numpy translations with an artifact of `graphdb/ontology/compile_onto.py`.
+
+        Artifacts of another `MML_TRANSLATOR_VERSION` are ignored.
+
+        Args:
+            path (str): path of the JSON artifact
+
+        Returns:
+            int: number of loaded translations
+        """
+        if not os.path.exists(path):
+            return 0
+        with open(path, "r") as f:
+            artifact = json.load(f)
+        if artifact["version"] != MML_TRANSLATOR_VERSION:
+            return 0
+        translations = {}
+        for section in ["law", "definition", "model_variable"]:
+            for entry in artifact[section].values():
+                for mml_str, numpy_code in entry.values():
+                    translations[mml_str] = numpy_code
+        MMLExpression.precompiled_numpy.update(translations)
+        return len(translations)
+
+
     def to_mainpage_mml(self):
         """Convert MathML expression for display in mainpage.
 
         Returns:
             dict: converted MathML for main page
         """
-        parser = etree.XMLParser()
-        root = etree.fromstring(self.mml_str, parser)
+        return dict(MMLExpression._to_mainpage_mml(self.mml_str))
+
+
+    @staticmethod
+    @lru_cache(maxsize=MML_CACHE_SIZE)
+    def _to_mainpage_mml(mml_str):
+        root = MMLExpression.parse(mml_str)
         root = MMLExpression.sanitize_display_etree(root)
         mainpage_mml_str = {"concise_formula": None, "detail_formula": []}
         rx = re.compile(r'<mspace nspace="(?P<nspace>[0-9]+)"/>')
@@ -95,8 +210,13 @@ class MMLExpression:
         Returns:
             str: converted MathML
         """
-        parser = etree.XMLParser()
-        root = etree.fromstring(self.mml_str, parser)
+        return MMLExpression._to_sidebar_mml(self.mml_str)
+
+
+    @staticmethod
+    @lru_cache(maxsize=MML_CACHE_SIZE)
+    def _to_sidebar_mml(mml_str):
+        root = MMLExpression.parse(mml_str)
         root = MMLExpression.sanitize_display_etree(root)
         sidebar_mml_str = []
         for i, child in enumerate(root.getchildren()):
@@ -125,16 +245,20 @@ class MMLExpression:
             list of str: converted numpy expression
             list of str: extracted variables
         """
-        parser = etree.XMLParser()
-        root = etree.fromstring(self.mml_str, parser)
-        root = self.sanitize_etree(root)
-        mml_str = etree.tostring(root)
+        if not postfix and self.mml_str in MMLExpression.precompiled_numpy:
+            return MMLExpression.precompiled_numpy[self.mml_str]
+        return MMLExpression._to_numpy(self.mml_str, postfix)
+
+
+    @staticmethod
+    @lru_cache(maxsize=MML_CACHE_SIZE)
+    def _to_numpy(mml_str, postfix=""):
+        root = MMLExpression.parse(mml_str)
+        root = MMLExpression.sanitize_etree(root)
         expr = []
         vars = []
-        root = etree.fromstring(mml_str)
         for child in root.getchildren():
-            sub_str = b"<math>" + etree.tostring(child) + b"</math>"
-            sub_expr, sub_vars = MMLExpression.mml2numpy(sub_str, postfix)
+            sub_expr, sub_vars = MMLExpression.elems2numpy([child], postfix)
             expr.append(sub_expr)
             vars.extend(sub_vars)
         code = MMLExpression.formulate_numpy_code(expr)
@@ -176,6 +300,46 @@ class MMLExpression:
         return code
 
 
+    def to_function(self, postfix=""):
+        """Convert MathML expression to a callable over numpy arrays
+
+        The callable is compiled from the parsed tree, without generating and executing source code. It takes a dict of
+        variables, e.g. `{"c": c, "q": q}`, and evaluates auxiliary equations, `if` blocks and inner `fsolve` of the formula
+        on a copy of it, in the same order as generated models do. Optional terms like `[r_m]` evaluate to 0 if any of their
+        variables is missing.
+
+        Example:
+            >>> mml_str = '<math><mrow><mfrac><mi>q</mi><mrow><mi>w</mi><mi>h</mi></mrow></mfrac></mrow></math>'
+            >>> MMLExpression(mml_str).to_function()({"q": 6.0, "w": 2.0, "h": 1.5})
+            2.0
+
+        Returns:
+            function: evaluation of the formula given a dict of variables
+        """
+        return MMLExpression._to_function(self.mml_str, postfix)
+
+
+    @staticmethod
+    @lru_cache(maxsize=MML_CACHE_SIZE)
+    def _to_function(mml_str, postfix=""):
+        root = MMLExpression.parse(mml_str)
+        root = MMLExpression.sanitize_etree(root)
+        lines = []
+        for child in root.getchildren():
+            tokens, _ = MMLExpression.elems2tokens([child], postfix)
+            lines.extend(MMLExpression.tokens2lines(MMLExpression.simplify_tokens(tokens)))
+        # as in generated models, a leading expression is the result of the auxiliary equations following it
+        if lines and "=" not in lines[0][1] and not lines[0][1][-1].endswith(":"):
+            lines = lines[1:] + lines[:1]
+        statements, i = MMLExpression.compile_statements(lines, 0, 0)
+        if i < len(lines):
+            raise ValueError(f"Unexpected indentation of numpy statement: {' '.join(lines[i][1])}")
+
+        def function(namespace):
+            return MMLExpression.run_statements(statements, dict(namespace))
+        return function
+
+
     @staticmethod
     def sanitize_etree(root):
         """Sanitize xml etree:
@@ -206,175 +370,494 @@ class MMLExpression:
         return root
 
     @staticmethod
-    def sanitize_numpy(numpy_expr):
-        """Sanitize numpy expression by adjusting spaces and brackets"""
-        sanitize_numpy_expr = []
-        for sub_numpy_expr in numpy_expr.split("\n"):
-            match = re.match(r"^ +", sub_numpy_expr)
-            pos = match.span()[1] if match else 0
-            sub_numpy_expr = sub_numpy_expr[:pos] + re.sub(" +", " ", sub_numpy_expr[pos:])
-            sub_numpy_expr = sub_numpy_expr.rstrip(" ")
-            sub_numpy_expr = re.sub(r" *:", ":", sub_numpy_expr)
-            sub_numpy_expr = re.sub(r" *\[ *", " [", sub_numpy_expr)
-            sub_numpy_expr = re.sub(r" *\] *", "] ", sub_numpy_expr)
-            sub_numpy_expr = re.sub(r"\( *", "(", sub_numpy_expr)
-            sub_numpy_expr = re.sub(r" *\)", ")", sub_numpy_expr)
-            sub_numpy_expr = re.sub(r"\(\(([^\(\)]*)\)\)", r"(\1)", sub_numpy_expr)
-            sub_numpy_expr = re.sub(r"\(\(([^\(\)]*)\(([^\(\)]*)\)\)\)", r"(\1(\2))", sub_numpy_expr)
-            sub_numpy_expr = re.sub(r" *(\[[^ <>\[\]]+(\[[:0-9]+\])* [<>] 0\])", r"\1", sub_numpy_expr)
-            sub_numpy_expr = re.sub(r"\(\(((\(([^\(\)]*)\)([^\(\)]*))+)\)\)", r"(\1)", sub_numpy_expr)
-            sub_numpy_expr = re.sub(r"\(np.sum\(([^\(\)]+)\)\)", r"np.sum(\1)", sub_numpy_expr)
-            sub_numpy_expr = re.sub(r"\(np.prod\(([^\(\)]+)\)\)", r"np.prod(\1)", sub_numpy_expr)
-            sub_numpy_expr = re.sub(r"(?<!len)(?<!np\.exp)(?<!np\.sum)(?<!np\.prod)(?<!np\.maximum)(?<!np\.matmul)\(([^\+\-\*\/\,]*)\)", r"\1", sub_numpy_expr)
-            sanitize_numpy_expr.append(sub_numpy_expr)
-        sanitize_numpy_expr = "\n".join(sanitize_numpy_expr)
-        return sanitize_numpy_expr
-    
+    def mml2numpy(mml_str, postfix=""):
+        """Conversion of MathML expression to numpy expression and variables"""
+        return MMLExpression.elems2numpy([MMLExpression.parse(mml_str)], postfix)
+
 
     @staticmethod
-    def mml2numpy(mml_str, postfix=""):
-        """Iterative conversion of MathML expression to numpy expression and variables"""
-        expr = ""
+    def elems2numpy(elems, postfix=""):
+        """Single-pass conversion of sibling MathML elements to numpy expression and variables
+
+        Args:
+            elems (list of lxml.etree._Element): sibling elements of a parsed MathML tree
+            postfix (str): postfix appended to variables
+
+        Returns:
+            str: converted numpy expression
+            list of str: extracted variables
+        """
+        tokens, vars = MMLExpression.elems2tokens(elems, postfix)
+        return MMLExpression.print_numpy(tokens), vars
+
+
+    @staticmethod
+    def elems2tokens(elems, postfix=""):
+        """Conversion of sibling MathML elements to numpy tokens and variables
+
+        Tokens are `(kind, value)` pairs: `("w", text)` for words, `("s", n)` for `n` spaces,
+        `("n", None)` for line breaks and `("g", None)` for gluing neighbouring words without space.
+
+        Returns:
+            list of tuples: numpy tokens
+            list of str: extracted variables
+        """
+        tokens = []
         vars = []
-        level = 0
-        context = etree.iterparse(BytesIO(mml_str), events=("start", "end"))
-        for action, elem in context:
-            # tag:mfrac
-            if action == "start" and elem.tag == "mfrac":
-                if level == 0:
-                    l_mml_str = etree.tostring(elem[0])
-                    r_mml_str = etree.tostring(elem[1])
-                    l_expr, l_vars = MMLExpression.mml2numpy(l_mml_str, postfix)
-                    r_expr, r_vars = MMLExpression.mml2numpy(r_mml_str, postfix)
-                    expr += f"({l_expr}) / ({r_expr}) "
-                    vars.extend(l_vars + r_vars)
-                level += 1
-            if action == "end" and elem.tag == "mfrac":
-                level -= 1
+        for elem in elems:
+            MMLExpression.elem2tokens(elem, postfix, tokens, vars)
+        # sub-expressions end without spacing, which is decided by the enclosing element
+        while tokens and tokens[-1][0] in ["s", "g"]:
+            tokens.pop()
+        vars = sorted(list(set(vars)))
+        return tokens, vars
+
+
+    @staticmethod
+    def elem2tokens(elem, postfix, tokens, vars):
+        """Recursive conversion of a MathML element, appending to numpy tokens and variables
+
+        `mfrac`, `mrow`, `msqrt`, `msub` and `msup` are converted from their children as sub-expressions,
+        while other tags are transparent to their children.
+        """
+        # tag:mfrac
+        if elem.tag == "mfrac":
+            l_tokens, l_vars = MMLExpression.elems2tokens([elem[0]], postfix)
+            r_tokens, r_vars = MMLExpression.elems2tokens([elem[1]], postfix)
+            tokens.extend(MMLExpression.wrap_tokens(l_tokens) + [("w", "/")] + MMLExpression.wrap_tokens(r_tokens))
+            vars.extend(l_vars + r_vars)
+        # tag:mrow
+        elif elem.tag == "mrow":
+            if elem[0].tag == "mo":
+                l_mml_str = elem[0].text.strip(" ")
+                l_tokens, l_vars = MMLExpression.elems2tokens([elem[0]])
+                r_tokens, r_vars = MMLExpression.elems2tokens(elem[1:], postfix)
+                if l_mml_str == "[":
+                    tokens.extend(l_tokens + r_tokens + [("g", None)])
+                elif l_mml_str in ["len", "exp", "∑", "∏"]:
+                    function = {"len": "len", "exp": "np.exp", "∑": "np.sum", "∏": "np.prod"}[l_mml_str]
+                    tokens.extend([("w", f"{function}(")] + r_tokens + [("w", ")")])
+                    vars.extend(r_vars)
+                elif l_mml_str in ["maximum", "matmul"]:
+                    first_tokens, first_vars = MMLExpression.elems2tokens([elem[1]], postfix)
+                    second_tokens, second_vars = MMLExpression.elems2tokens([elem[2]], postfix)
+                    tokens.extend([("w", f"np.{l_mml_str}(")] + first_tokens + [("g", None), ("w", ",")] + second_tokens + [("w", ")"), ("g", None)])
+                    vars.extend(first_vars)
+                    vars.extend(second_vars)
+                else:
+                    tokens.extend(l_tokens + [("g", None)] + r_tokens + [("g", None)])
+                    vars.extend(r_vars)
+            elif len(elem) == 3 and elem[0].tag == "msub" and elem[1].tag == "mspace" and elem[2].tag == "mi":
+                # for variables like k_La
+                l_expr, l_vars = MMLExpression.elems2numpy([elem[0]])
+                r_expr, r_vars = MMLExpression.elems2numpy([elem[2]])
+                tokens.append(("w", f"{l_expr}{r_expr}"))
+                vars.extend(f"{l_expr}{r_expr}")
+            else:
+                sub_tokens, sub_vars = MMLExpression.elems2tokens(elem[:], postfix)
+                tokens.extend(sub_tokens)
+                vars.extend(sub_vars)
+        # tag:msqrt
+        elif elem.tag == "msqrt":
+            sub_tokens, sub_vars = MMLExpression.elems2tokens(elem[:], postfix)
+            tokens.extend(MMLExpression.wrap_tokens(sub_tokens) + [("w", "**"), ("w", "0.5")])
+            vars.extend(sub_vars)
+        # tag:msub
+        elif elem.tag == "msub":
+            l_expr, _ = MMLExpression.elems2numpy([elem[0]])
+            r_expr, _ = MMLExpression.elems2numpy([elem[1]])
+            tokens.append(("w", f"{l_expr}_{r_expr}{postfix}"))
+            vars.append(f"{l_expr}_{r_expr}")
+        # tag:msup
+        elif elem.tag == "msup":
+            l_tokens, l_vars = MMLExpression.elems2tokens([elem[0]], postfix)
+            r_tokens, r_vars = MMLExpression.elems2tokens([elem[1]], postfix)
+            tokens.extend(MMLExpression.wrap_tokens(l_tokens) + [("w", "**")] + MMLExpression.wrap_tokens(r_tokens))
+            vars.extend(l_vars + r_vars)
+        else:
             # tag:mi
-            if action == "start" and elem.tag == "mi" and level == 0:
+            if elem.tag == "mi":
                 mi_expr = elem.text.strip(" ")
-                expr += f"{mi_expr}{postfix} "
+                tokens.append(("w", f"{mi_expr}{postfix}"))
                 vars.append(mi_expr)
-            # tag:mn
-            if action == "start" and elem.tag == "mn" and level == 0:
-                mn_expr = elem.text.strip(" ")
-                for k, v in MMLExpression.mml_numpy_map.items():
-                    mn_expr = mn_expr.replace(k, v)
-                expr += f"{mn_expr} "
-            # tag:mo
-            if action == "start" and elem.tag == "mo" and level == 0:
+            # tag:mn, tag:mo
+            if elem.tag in ["mn", "mo"]:
                 mo_expr = elem.text.strip(" ")
                 for k, v in MMLExpression.mml_numpy_map.items():
                     mo_expr = mo_expr.replace(k, v)
-                expr += f"{mo_expr} "
-            # tag:mrow
-            if action == "start" and elem.tag == "mrow":
-                if level == 0:
-                    if elem[0].tag == "mo":
-                        l_mml_str = elem[0].text.strip(" ")
-                        l_expr, l_vars = MMLExpression.mml2numpy(b"<math>" + etree.tostring(elem[0]) + b"</math>")
-                        r_mml_str = b"".join([etree.tostring(e) for e in elem[1:]])
-                        r_mml_str = b"<math>" + r_mml_str + b"</math>"
-                        r_expr, r_vars = MMLExpression.mml2numpy(r_mml_str, postfix)
-                        if l_mml_str == "[":
-                            expr += f"{l_expr}{r_expr}"
-                        elif l_mml_str == "len":
-                            expr += f"len({r_expr}) "
-                            vars.extend(r_vars)
-                        elif l_mml_str == "exp":
-                            expr += f"np.exp({r_expr}) "
-                            vars.extend(r_vars)
-                        elif l_mml_str == "∑":
-                            expr += f"np.sum({r_expr}) "
-                            vars.extend(r_vars)
-                        elif l_mml_str == "∏":
-                            expr += f"np.prod({r_expr}) "
-                            vars.extend(r_vars)
-                            vars.extend(r_vars)
-                        elif l_mml_str == "maximum":
-                            first_mml_str = etree.tostring(elem[1])
-                            first_mml_str = b"<math>" + first_mml_str + b"</math>"
-                            first_expr, first_vars = MMLExpression.mml2numpy(first_mml_str, postfix)
-                            second_mml_str = etree.tostring(elem[2])
-                            second_mml_str = b"<math>" + second_mml_str + b"</math>"
-                            second_expr, second_vars = MMLExpression.mml2numpy(second_mml_str, postfix)
-                            expr += f"np.maximum({first_expr}, {second_expr})"
-                            vars.extend(first_vars)
-                            vars.extend(second_vars)
-                        elif l_mml_str == "matmul":
-                            first_mml_str = etree.tostring(elem[1])
-                            first_mml_str = b"<math>" + first_mml_str + b"</math>"
-                            first_expr, first_vars = MMLExpression.mml2numpy(first_mml_str, postfix)
-                            second_mml_str = etree.tostring(elem[2])
-                            second_mml_str = b"<math>" + second_mml_str + b"</math>"
-                            second_expr, second_vars = MMLExpression.mml2numpy(second_mml_str, postfix)
-                            expr += f"np.matmul({first_expr}, {second_expr})"
-                            vars.extend(first_vars)
-                            vars.extend(second_vars)
-                        else:
-                            expr += f"{l_expr}{r_expr}"
-                            vars.extend(r_vars)
-                    elif len(elem) == 3 and elem[0].tag == "msub" and elem[1].tag == "mspace" and elem[2].tag == "mi":
-                        # for variables like k_La
-                        l_expr, l_vars = MMLExpression.mml2numpy(b"<math>" + etree.tostring(elem[0]) + b"</math>")
-                        r_expr, r_vars = MMLExpression.mml2numpy(b"<math>" + etree.tostring(elem[2]) + b"</math>")
-                        expr += f"{l_expr}{r_expr} "
-                        vars.extend(f"{l_expr}{r_expr}")
-                    else:
-                        sub_mml_str = b"".join([etree.tostring(e) for e in elem])
-                        sub_mml_str = b"<math>" + sub_mml_str + b"</math>"
-                        sub_expr, sub_vars = MMLExpression.mml2numpy(sub_mml_str, postfix)
-                        expr += f"{sub_expr} "
-                        vars.extend(sub_vars)
-                level += 1
-            if action == "end" and elem.tag == "mrow":
-                level -= 1
+                tokens.append(("w", mo_expr))
             # tag:mspace
-            if action == "start" and elem.tag == "mspace":
-                expr += " " * int(elem.attrib["nspace"])
-            # tag:msqrt
-            if action == "start" and elem.tag == "msqrt":
-                if level == 0:
-                    sub_mml_str = b"".join([etree.tostring(e) for e in elem])
-                    sub_mml_str = b"<math>" + sub_mml_str + b"</math>"
-                    sub_expr, sub_vars = MMLExpression.mml2numpy(sub_mml_str, postfix)
-                    expr += f"({sub_expr}) ** 0.5 "
-                    vars.extend(sub_vars)
-                level += 1
-            if action == "end" and elem.tag == "msqrt":
-                level -= 1
-            # tag:msub
-            if action == "start" and elem.tag == "msub":
-                if level == 0:
-                    l_mml_str = etree.tostring(elem[0])
-                    r_mml_str = etree.tostring(elem[1])
-                    l_expr, _ = MMLExpression.mml2numpy(l_mml_str)
-                    r_expr, _ = MMLExpression.mml2numpy(r_mml_str)
-                    expr += f"{l_expr}_{r_expr}{postfix} "
-                    vars.append(f"{l_expr}_{r_expr}")
-                level += 1
-            if action == "end" and elem.tag == "msub":
-                level -= 1
-            # tag:msup
-            if action == "start" and elem.tag == "msup":
-                if level == 0:
-                    l_mml_str = etree.tostring(elem[0])
-                    r_mml_str = etree.tostring(elem[1])
-                    l_expr, l_vars = MMLExpression.mml2numpy(l_mml_str, postfix)
-                    r_expr, r_vars = MMLExpression.mml2numpy(r_mml_str, postfix)
-                    expr += f"({l_expr}) ** ({r_expr}) "
-                    vars.extend(l_vars + r_vars)
-                level += 1
-            if action == "end" and elem.tag == "msup":
-                level -= 1
+            if elem.tag == "mspace":
+                tokens.append(("s", int(elem.attrib["nspace"])))
             # tag:mtext
-            if action == "start" and elem.tag == "mtext" and level == 0:
-                mtext_expr = elem.text.replace(",", "_").strip(" ")
-                expr += mtext_expr
-        expr = MMLExpression.sanitize_numpy(expr)
-        vars = sorted(list(set(vars)))
-        return expr, vars
+            if elem.tag == "mtext":
+                for i, line in enumerate(elem.text.replace(",", "_").strip(" ").split("\n")):
+                    if i > 0:
+                        tokens.append(("n", None))
+                    indent = len(line) - len(line.lstrip(" "))
+                    if indent:
+                        tokens.append(("s", indent))
+                    tokens.extend(("w", word) for word in line.split(" ") if word)
+                tokens.append(("g", None))
+            for child in elem:
+                MMLExpression.elem2tokens(child, postfix, tokens, vars)
+            return
+        # spaces of nested mspace are kept at the level of the converted element
+        for child in elem.iter("mspace"):
+            tokens.append(("s", int(child.attrib["nspace"])))
+
+
+    @staticmethod
+    def enclosed_tokens(tokens):
+        """Whether numpy tokens are enclosed by a pair of matching brackets"""
+        words = [v for k, v in tokens if k == "w"]
+        if not words or words[0] != "(" or words[-1] != ")":
+            return False
+        depth = 0
+        for word in words[:-1]:
+            depth += word.endswith("(") - (word == ")")
+            if depth == 0:
+                return False
+        return True
+
+
+    @staticmethod
+    def wrap_tokens(tokens):
+        """Enclose numpy tokens of an operand by brackets, unless it is a single term, already enclosed or a sum/product"""
+        words = [v for k, v in tokens if k == "w"]
+        if not any(c in word for word in words for c in "+-*/,"):
+            return tokens
+        if MMLExpression.enclosed_tokens(tokens):
+            return tokens
+        if words[0] in ["np.sum(", "np.prod("] and MMLExpression.enclosed_tokens([("w", "(")] + tokens[1:]):
+            return tokens
+        return [("w", "(")] + tokens + [("w", ")")]
+
+
+    @staticmethod
+    def simplify_tokens(tokens):
+        """Remove explicit brackets enclosing a single term, another bracket pair or a sum/product"""
+        removed = set()
+        stack = []
+        for j, (kind, value) in enumerate(tokens):
+            if kind != "w":
+                continue
+            if value.endswith("("):
+                stack.append(j)
+            elif value == ")" and stack:
+                i = stack.pop()
+                inner = [n for n in range(i + 1, j) if n not in removed and tokens[n][0] == "w"]
+                if inner and tokens[inner[0]][1] == "(" and MMLExpression.enclosed_tokens([tokens[n] for n in inner]):
+                    # double brackets
+                    removed.update([inner[0], inner[-1]])
+                elif tokens[i][1] != "(":
+                    continue
+                elif not any(c in tokens[n][1] for n in inner for c in "+-*/,"):
+                    removed.update([i, j])
+                elif tokens[inner[0]][1] in ["np.sum(", "np.prod("] and \
+                        MMLExpression.enclosed_tokens([("w", "(")] + [tokens[n] for n in inner[1:]]):
+                    removed.update([i, j])
+        # no spacing follows an opening bracket, so neither does it follow a removed one
+        for n in sorted(removed):
+            while tokens[n][1] == "(" and n + 1 < len(tokens) and tokens[n + 1][0] == "g":
+                removed.add(n + 1)
+                n += 1
+        return [token for n, token in enumerate(tokens) if n not in removed]
+
+
+    @staticmethod
+    def print_numpy(tokens):
+        """Print numpy tokens as numpy expression
+
+        Words are separated by single spaces except after `(` and `[` and before `)` and `:`, while `[` and `]` are
+        spaced out except for masks like `c[ν < 0]`. Indentation is kept and lines are right-stripped but for `]`.
+        """
+        tokens = MMLExpression.simplify_tokens(tokens)
+        lines = []
+        line = ""
+        space = False
+        prev = None
+        for i, (kind, value) in enumerate(tokens):
+            if kind == "g":
+                space = False
+            elif kind == "s":
+                if prev is None:
+                    line += " " * value
+                else:
+                    space = True
+            elif kind == "n":
+                lines.append(line.rstrip(" ") + (" " if line.endswith("]") else ""))
+                line = ""
+                space = False
+                prev = None
+            else:
+                words = [v for k, v in tokens[i + 1:i + 5] if k == "w"]
+                mask = value == "[" and len(words) == 4 and words[1] in ["<", ">"] and words[2:] == ["0", "]"] and \
+                    not any(c in words[0] for c in " <>[]")
+                if value == ")" or (value == "]" and prev != "]") or value.startswith(":") or mask:
+                    line = line.rstrip(" ") if prev is None else line
+                    space = False
+                elif value == "[":
+                    line = line.rstrip(" ") if prev is None else line
+                    space = prev is None or not prev.endswith("(")
+                elif prev is not None and (prev.endswith("(") or prev == "["):
+                    space = False
+                elif prev == "]":
+                    space = True
+                line += (" " if space else "") + value
+                space = True
+                prev = value
+        lines.append(line.rstrip(" ") + (" " if line.endswith("]") else ""))
+        return "\n".join(lines)
+
+
+
+    @staticmethod
+    def tokens2lines(tokens):
+        """Split numpy tokens to lines of indentation and words, dropping empty lines
+
+        Glued names are joined into a single word as printed, e.g. `dc` of `<mtext>d</mtext><mi>c</mi>`.
+        """
+        lines = []
+        indent = 0
+        words = []
+        glue = False
+        for kind, value in tokens + [("n", None)]:
+            if kind == "n":
+                if words:
+                    lines.append((indent, words))
+                indent = 0
+                words = []
+            elif kind == "s" and not words:
+                indent += value
+            elif kind == "w" and glue and words and re.search(r"\w$", words[-1]) and re.match(r"\w", value):
+                words[-1] += value
+            elif kind == "w":
+                words.append(value)
+            glue = kind == "g"
+        return lines
+
+
+    @staticmethod
+    def compile_statements(lines, i, indent):
+        """Compile lines of numpy words from `i` to closures of statements, until the block of `indent` ends
+
+        Supported statements are expressions, assignments, `if`/`elif`/`else` blocks and `SOLVE START` ... `SOLVE END`
+        blocks of `formulate_numpy_code`.
+
+        Returns:
+            list of function: closures evaluating statements on a dict of variables
+            int: position of the first line after the block
+        """
+        statements = []
+        while i < len(lines) and lines[i][0] == indent and lines[i][1] != ["SOLVE", "END"]:
+            words = lines[i][1]
+            if words == ["SOLVE", "START"]:
+                target = lines[i + 1][1][-1]
+                x0 = float(lines[i + 2][1][-1])
+                body, i = MMLExpression.compile_statements(lines, i + 3, lines[i + 3][0])
+                statements.append(MMLExpression.solve_closure(target, x0, body))
+                i += 1
+            elif words[0] == "if":
+                branches = []
+                while True:
+                    words = lines[i][1][:-1] + ([lines[i][1][-1][:-1]] if lines[i][1][-1] != ":" else [])
+                    condition = MMLExpression.compile_expression(words[1:]) if words[0] != "else" else None
+                    if i + 1 >= len(lines) or lines[i + 1][0] <= indent:
+                        raise ValueError(f"Missing block of numpy statement: {' '.join(lines[i][1])}")
+                    body, i = MMLExpression.compile_statements(lines, i + 1, lines[i + 1][0])
+                    branches.append((condition, body))
+                    if condition is None or i >= len(lines) or lines[i][0] != indent or lines[i][1][0] not in ["elif", "else:"]:
+                        break
+                statements.append(MMLExpression.branch_closure(branches))
+            elif len(words) > 2 and words[1] == "=":
+                statements.append(MMLExpression.assign_closure(words[0], MMLExpression.compile_expression(words[2:])))
+                i += 1
+            else:
+                statements.append(MMLExpression.compile_expression(words))
+                i += 1
+        return statements, i
+
+
+    @staticmethod
+    def run_statements(statements, env):
+        """Evaluate closures of statements on a dict of variables, returning the value of the last one"""
+        value = None
+        for statement in statements:
+            value = statement(env)
+        return value
+
+
+    @staticmethod
+    def assign_closure(name, expression):
+        def assign(env):
+            env[name] = expression(env)
+            return env[name]
+        return assign
+
+
+    @staticmethod
+    def branch_closure(branches):
+        def branch(env):
+            for condition, body in branches:
+                if condition is None or condition(env):
+                    return MMLExpression.run_statements(body, env)
+        return branch
+
+
+    @staticmethod
+    def solve_closure(target, x0, body):
+        def solve(env):
+            def error(x):
+                local_env = dict(env)
+                local_env[target] = x
+                MMLExpression.run_statements(body, local_env)
+                return local_env["error"]
+            return fsolve(error, x0, xtol=1e-6, maxfev=1000)[0]
+        return solve
+
+
+    @staticmethod
+    def compile_expression(words):
+        """Compile numpy words of a single expression to a closure evaluating it on a dict of variables"""
+        expression, pos = MMLExpression.parse_expression(words, 0, 1, set())
+        if pos < len(words):
+            raise ValueError(f"Unsupported numpy expression: {' '.join(words)}")
+        return expression
+
+
+    @staticmethod
+    def parse_expression(words, pos, precedence, names):
+        """Precedence climbing over numpy words from `pos` for operators binding at least as tight as `precedence`
+
+        Args:
+            words (list of str): numpy words
+            pos (int): position of the first word of the expression
+            precedence (int): minimum precedence of binary operators, see `numpy_precedences`
+            names (set of str): collected variables of the expression
+
+        Returns:
+            function: closure evaluating the expression on a dict of variables
+            int: position of the first word after the expression
+        """
+        expression, pos = MMLExpression.parse_operand(words, pos, names)
+        while pos < len(words) and MMLExpression.numpy_precedences.get(words[pos], 0) >= precedence:
+            op = words[pos]
+            # `**` is right-associative
+            op_precedence = MMLExpression.numpy_precedences[op] + (op != "**")
+            right, pos = MMLExpression.parse_expression(words, pos + 1, op_precedence, names)
+            expression = MMLExpression.binary_closure(op, expression, right)
+        return expression, pos
+
+
+    @staticmethod
+    def parse_operand(words, pos, names):
+        """Parse an operand of numpy words from `pos`: unary operation, bracket, optional term, call, constant or variable"""
+        if pos >= len(words):
+            raise ValueError(f"Incomplete numpy expression: {' '.join(words)}")
+        word = words[pos]
+        if word in ["-", "+", "not"]:
+            # unary minus binds looser than `**`
+            operand, pos = MMLExpression.parse_expression(words, pos + 1, 7 if word != "not" else 3, names)
+            operand = MMLExpression.unary_closure(word, operand)
+        elif word == "(":
+            operand, pos = MMLExpression.parse_expression(words, pos + 1, 1, names)
+            pos = MMLExpression.expect_word(words, pos, ")")
+        elif word == "[":
+            term_names = set()
+            term, pos = MMLExpression.parse_expression(words, pos + 1, 1, term_names)
+            pos = MMLExpression.expect_word(words, pos, "]")
+            operand = MMLExpression.optional_closure(term, term_names)
+            names.update(term_names)
+        elif word.endswith("("):
+            if word == "len(":
+                function = len
+            elif word.startswith("np.") and hasattr(np, word[3:-1]):
+                function = getattr(np, word[3:-1])
+            else:
+                raise ValueError(f"Unsupported numpy function: {word[:-1]}")
+            args = []
+            pos += 1
+            while True:
+                arg, pos = MMLExpression.parse_expression(words, pos, 1, names)
+                args.append(arg)
+                if pos >= len(words) or words[pos] != ",":
+                    break
+                pos += 1
+            pos = MMLExpression.expect_word(words, pos, ")")
+            operand = MMLExpression.call_closure(function, args)
+        elif word.startswith("np.") and hasattr(np, word[3:]):
+            operand = MMLExpression.constant_closure(getattr(np, word[3:]))
+            pos += 1
+        elif re.match(r"^-?[0-9.]", word):
+            operand = MMLExpression.constant_closure(int(word) if word.lstrip("-").isdigit() else float(word))
+            pos += 1
+        elif word in MMLExpression.numpy_precedences or word in [")", "]", ",", ":", "="]:
+            raise ValueError(f"Unexpected numpy word {word}: {' '.join(words)}")
+        else:
+            operand = MMLExpression.variable_closure(word)
+            names.add(word)
+            pos += 1
+        # subscripts like masks `c[ν < 0]`
+        while pos < len(words) and words[pos] == "[":
+            index, pos = MMLExpression.parse_expression(words, pos + 1, 1, names)
+            pos = MMLExpression.expect_word(words, pos, "]")
+            operand = MMLExpression.subscript_closure(operand, index)
+        return operand, pos
+
+
+    @staticmethod
+    def expect_word(words, pos, word):
+        if pos >= len(words) or words[pos] != word:
+            raise ValueError(f"Missing {word} in numpy expression: {' '.join(words)}")
+        return pos + 1
+
+
+    @staticmethod
+    def constant_closure(value):
+        return lambda env: value
+
+
+    @staticmethod
+    def variable_closure(name):
+        return lambda env: env[name]
+
+
+    @staticmethod
+    def unary_closure(op, operand):
+        if op == "-":
+            return lambda env: -operand(env)
+        if op == "not":
+            return lambda env: not operand(env)
+        return operand
+
+
+    @staticmethod
+    def binary_closure(op, left, right):
+        if op == "and":
+            return lambda env: left(env) and right(env)
+        if op == "or":
+            return lambda env: left(env) or right(env)
+        function = MMLExpression.numpy_operators[op]
+        return lambda env: function(left(env), right(env))
+
+
+    @staticmethod
+    def call_closure(function, args):
+        if len(args) == 1:
+            arg = args[0]
+            return lambda env: function(arg(env))
+        return lambda env: function(*[arg(env) for arg in args])
+
+
+    @staticmethod
+    def subscript_closure(operand, index):
+        return lambda env: operand(env)[index(env)]
+
+
+    @staticmethod
+    def optional_closure(term, names):
+        return lambda env: term(env) if all(name in env for name in names) else 0
 
 
 if __name__ == "__main__":